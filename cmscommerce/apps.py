@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CmscommerceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cmscommerce'
+
+    def ready(self):
+        # Register the signal handlers
+        # pylint: disable=import-outside-toplevel,unused-import
+        from . import signals
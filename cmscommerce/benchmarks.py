@@ -0,0 +1,435 @@
+import io
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from .categories import invalidate_categories
+from .counters import reconcile_counters
+from .listings import rebuild_listings
+from .models import User, Seller, Customer, Category, Product, Cart, CartItem
+from .response_cache import RESPONSE_NAMESPACES, invalidate_responses
+from .search import invalidate_index
+from .token_cache import get_token_cache
+
+
+# The categories script.bash inserts
+DEFAULT_CATEGORIES = (
+    ("Technology", "tech"),
+    ("Fashion", "fashion"),
+    ("Grocery", "grocery"),
+    ("Books", "books"),
+    ("Music", "music"),
+    ("Sports", "sports"),
+    ("Games", "games"),
+    ("No Category", "no-category"),
+)
+
+SEED_PASSWORD = "benchmark"
+SEED_BATCH_SIZE = 1000
+
+WORDS = (
+    "laptop phone shirt coffee novel guitar ball console camera jacket tea "
+    "album racket keyboard monitor shoes rice poster headphones board"
+).split()
+
+
+def seed_data(sellers=10, customers=100, products=1000, cart_items=3, seed=0):
+    """
+    Fills the database with the default categories and generated sellers,
+    customers (with a cart holding cart_items products each) and products,
+    all inserted with bulk_create. Every user has a token and the password
+    SEED_PASSWORD. The same seed always generates the same data.
+    Returns:
+        dict: The ids the benchmarks need: "seller_user_id",
+        "seller_product_id", "seller_token", "customer_token",
+        "customer_cart_product_ids" and "product_ids".
+    """
+    rng = random.Random(seed)
+    password = make_password(SEED_PASSWORD)
+    # pylint: disable=no-member
+    Category.objects.bulk_create(
+        [Category(name=name, code=code) for name, code in DEFAULT_CATEGORIES],
+        ignore_conflicts=True,
+    )
+    category_ids = list(Category.objects.values_list("id", flat=True))
+
+    User.objects.bulk_create(
+        [
+            User(username=f"bench-seller-{i}", role="Seller", password=password)
+            for i in range(sellers)
+        ]
+        + [
+            User(username=f"bench-customer-{i}", role="Customer", password=password)
+            for i in range(customers)
+        ],
+        batch_size=SEED_BATCH_SIZE,
+    )
+    users = list(User.objects.filter(username__startswith="bench-").order_by("pk"))
+    Token.objects.bulk_create(
+        [Token(key=Token.generate_key(), user=user) for user in users],
+        batch_size=SEED_BATCH_SIZE,
+    )
+    Seller.objects.bulk_create(
+        [Seller(user=user) for user in users if user.role == "Seller"],
+        batch_size=SEED_BATCH_SIZE,
+    )
+    Customer.objects.bulk_create(
+        [Customer(user=user) for user in users if user.role == "Customer"],
+        batch_size=SEED_BATCH_SIZE,
+    )
+    seller_ids = list(
+        Seller.objects.filter(user__username__startswith="bench-").values_list(
+            "pk", flat=True
+        )
+    )
+    customer_ids = list(
+        Customer.objects.filter(user__username__startswith="bench-").values_list(
+            "pk", flat=True
+        )
+    )
+
+    Product.objects.bulk_create(
+        (
+            Product(
+                name=" ".join(rng.sample(WORDS, 3)).title(),
+                brand=rng.choice(WORDS).title(),
+                description=" ".join(rng.choices(WORDS, k=12)),
+                base_price=rng.randint(100, 100000) / 100,
+                price=rng.randint(100, 100000) / 100,
+                stock=rng.randint(100, 10000),
+                category_id=rng.choice(category_ids),
+                seller_id=seller_ids[i % len(seller_ids)],
+            )
+            for i in range(products)
+        ),
+        batch_size=SEED_BATCH_SIZE,
+    )
+    rebuild_listings()
+    reconcile_counters()
+    product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+
+    Cart.objects.bulk_create(
+        [
+            Cart(customer_id=customer_id, total_quantity=cart_items)
+            for customer_id in customer_ids
+        ],
+        batch_size=SEED_BATCH_SIZE,
+    )
+    carts = Cart.objects.filter(customer_id__in=customer_ids).values_list(
+        "pk", flat=True
+    )
+    CartItem.objects.bulk_create(
+        (
+            CartItem(cart_id=cart_id, product_id=product_id, quantity=1)
+            for cart_id in carts
+            for product_id in rng.sample(product_ids, min(cart_items, len(product_ids)))
+        ),
+        batch_size=SEED_BATCH_SIZE,
+    )
+
+    seller_user = users[0]
+    customer_user = next(user for user in users if user.role == "Customer")
+    return {
+        "seller_user_id": seller_user.pk,
+        "seller_product_id": Product.objects.filter(seller__user=seller_user)
+        .values_list("pk", flat=True)
+        .first(),
+        "seller_token": Token.objects.get(user=seller_user).key,
+        "customer_token": Token.objects.get(user=customer_user).key,
+        "customer_cart_product_ids": list(
+            CartItem.objects.filter(cart__customer__user=customer_user)
+            .order_by("product_id")
+            .values_list("product_id", flat=True)
+        ),
+        "product_ids": product_ids,
+    }
+
+
+def _product_form(ids):
+    return {
+        "name": "Benchmark product",
+        "brand": "Benchmark",
+        "description": "Benchmark product",
+        "base_price": "20",
+        "price": "10",
+        "stock": "5",
+        "category_code": "tech",
+        "seller_id": str(ids["seller_user_id"]),
+    }
+
+
+def _import_file(ids):
+    rows = "".join(
+        f"Imported {i},Benchmark,Benchmark,20,10,5,tech\n" for i in range(100)
+    )
+    file = io.BytesIO(
+        (
+            "name,brand,description,base_price,price,stock,category_code\n" + rows
+        ).encode()
+    )
+    file.name = "products.csv"
+    return {"file": file}
+
+
+# URL name -> function of the seeded ids returning (method, path, auth role, kwargs)
+# for the test client. Every request runs in a rolled back transaction.
+ENDPOINTS = {
+    "index": lambda ids: ("get", "/", None, {}),
+    "register": lambda ids: (
+        "post",
+        "/register",
+        None,
+        {
+            "data": {
+                "username": "bench-new-user",
+                "password": "secret123",
+                "confirmPassword": "secret123",
+                "role": "Customer",
+            },
+            "content_type": "application/json",
+        },
+    ),
+    "login_view": lambda ids: (
+        "post",
+        "/login_view",
+        None,
+        {
+            "data": {"username": "bench-seller-0", "password": SEED_PASSWORD},
+            "content_type": "application/json",
+        },
+    ),
+    "logout_view": lambda ids: ("get", "/logout_view", "seller", {}),
+    "seller_dashboard": lambda ids: (
+        "get",
+        f"/seller_dashboard/{ids['seller_user_id']}",
+        "seller",
+        {"data": {"per_page": 20}},
+    ),
+    "seller_products": lambda ids: (
+        "get",
+        f"/seller_products/{ids['seller_user_id']}",
+        "seller",
+        {},
+    ),
+    "categories": lambda ids: ("get", "/categories", "seller", {}),
+    "public_categories": lambda ids: ("get", "/public/categories", None, {}),
+    "create_product": lambda ids: (
+        "post",
+        "/create_product",
+        "seller",
+        {"data": _product_form(ids)},
+    ),
+    "import_products": lambda ids: (
+        "post",
+        "/import_products",
+        "seller",
+        {"data": _import_file(ids)},
+    ),
+    "bulk_update_products": lambda ids: (
+        "post",
+        "/bulk_update_products",
+        "seller",
+        {
+            "data": {
+                "updates": [{"product_id": ids["seller_product_id"], "stock_delta": 1}]
+            },
+            "content_type": "application/json",
+        },
+    ),
+    "all_products": lambda ids: (
+        "get",
+        "/all_products",
+        None,
+        {"data": {"page": 2, "per_page": 20}},
+    ),
+    "all_product_ids": lambda ids: ("get", "/all_product_ids", None, {}),
+    "catalog": lambda ids: ("get", "/catalog", "customer", {}),
+    "export_products": lambda ids: ("get", "/export_products", "seller", {}),
+    "search": lambda ids: ("get", "/search", None, {"data": {"q": "laptop"}}),
+    "delete_product": lambda ids: (
+        "delete",
+        f"/delete_product/{ids['seller_product_id']}",
+        "seller",
+        {},
+    ),
+    "update_product": lambda ids: (
+        "post",
+        f"/update_product/{ids['seller_product_id']}",
+        "seller",
+        {"data": _product_form(ids)},
+    ),
+    "add_to_cart": lambda ids: (
+        "post",
+        f"/add_to_cart/{ids['product_ids'][-1]}",
+        "customer",
+        {},
+    ),
+    "update_quantity": lambda ids: (
+        "put",
+        f"/update_quantity/{ids['customer_cart_product_ids'][0]}",
+        "customer",
+        {"data": {"quantity": 1}, "content_type": "application/json"},
+    ),
+    "remove_from_cart": lambda ids: (
+        "delete",
+        f"/remove_from_cart/{ids['customer_cart_product_ids'][0]}",
+        "customer",
+        {},
+    ),
+    "batch_cart": lambda ids: (
+        "post",
+        "/batch_cart",
+        "customer",
+        {
+            "data": {
+                "operations": [
+                    {"op": "add", "product_id": product_id, "quantity": 1}
+                    for product_id in ids["product_ids"][:20]
+                ]
+            },
+            "content_type": "application/json",
+        },
+    ),
+    "get_cart": lambda ids: ("get", "/get_cart", "customer", {}),
+    "checkout": lambda ids: (
+        "post",
+        "/checkout",
+        "customer",
+        {
+            "data": {"shipping_information": "Benchmark address"},
+            "content_type": "application/json",
+        },
+    ),
+    "metrics": lambda ids: ("get", "/metrics", None, {}),
+}
+
+
+def clear_caches():
+    """
+    Drops what the app caches, for cold runs: the cached responses, the
+    categories payload, the tokens and the search index. The CACHES may be
+    shared with sessions or other applications, so instead of clearing them
+    the app's keys are moved to new versions / generations.
+    """
+    invalidate_responses(*RESPONSE_NAMESPACES)
+    invalidate_categories()
+    get_token_cache().clear()
+    invalidate_index()
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _request(client, ids, name):
+    method, path, role, kwargs = ENDPOINTS[name](ids)
+    headers = {}
+    if role:
+        headers["HTTP_AUTHORIZATION"] = f"Token {ids[f'{role}_token']}"
+    try:
+        with transaction.atomic():
+            response = getattr(client, method)(path, **kwargs, **headers)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return response
+
+
+TRANSACTION_SQL = ("BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK", "COMMIT")
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def run_benchmark(ids, name, iterations=50, cold=False):
+    """
+    Requests an endpoint iterations times after a warm-up request, then once
+    more with the queries and the allocations traced. Every request runs in
+    a rolled back transaction, so they all see the same data.
+    With cold=True the caches are cleared before every request.
+    Returns:
+        dict: Status, latency percentiles and mean (ms), query count and
+        peak memory allocated by the request (KiB).
+    """
+    client = Client()
+    _request(client, ids, name)
+
+    latencies = []
+    for _ in range(iterations):
+        if cold:
+            clear_caches()
+        started = time.perf_counter()
+        response = _request(client, ids, name)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    if cold:
+        clear_caches()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            _request(client, ids, name)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": response.status_code,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.mean(latencies), 3),
+        # Without the statements of the rolled back transaction
+        "queries": len(
+            [q for q in queries if not q["sql"].upper().startswith(TRANSACTION_SQL)]
+        ),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+# Metrics compare_results allows to grow by up to its threshold
+COMPARED_METRICS = ("p50_ms", "p95_ms", "peak_memory_kb")
+
+
+def compare_results(baseline, current, threshold=0.2, min_latency_ms=1.0):
+    """
+    Compares two benchmark results. A latency or memory metric regresses when
+    it grows by more than threshold (a fraction), latencies under
+    min_latency_ms being too noisy to compare, and the query count regresses
+    on any increase.
+    Returns:
+        list: One (endpoint, metric, baseline value, current value) per regression.
+    """
+    regressions = []
+    for name, result in current["endpoints"].items():
+        previous = baseline["endpoints"].get(name)
+        if previous is None:
+            continue
+        if result["queries"] > previous["queries"]:
+            regressions.append(
+                (name, "queries", previous["queries"], result["queries"])
+            )
+        for metric in COMPARED_METRICS:
+            before, after = previous[metric], result[metric]
+            if metric.endswith("_ms") and max(before, after) < min_latency_ms:
+                continue
+            if after > before * (1 + threshold):
+                regressions.append((name, metric, before, after))
+    return regressions
+
+
+def load_results(path) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
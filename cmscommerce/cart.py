@@ -0,0 +1,272 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Cart, CartItem
+
+
+class CartItemNotFound(Exception):
+    """
+    Raised when a product is not in the cart.
+    """
+
+
+def get_cart_id(user):
+    """
+    Looks up the id of the customer's cart with a single query.
+    Returns:
+        int: The cart id, or None if the customer has no cart.
+    """
+    # pylint: disable=no-member
+    return Cart.objects.filter(customer__user=user).values_list("pk", flat=True).first()
+
+
+async def aget_cart_id(user):
+    """
+    Async version of get_cart_id.
+    Returns:
+        int: The cart id, or None if the customer has no cart.
+    """
+    # pylint: disable=no-member
+    return (
+        await Cart.objects.filter(customer__user=user)
+        .values_list("pk", flat=True)
+        .afirst()
+    )
+
+
+# Most units of one product a cart can hold, far below the column's limit
+MAX_ITEM_QUANTITY = 1000
+
+
+class CartQuantityError(Exception):
+    """
+    Raised when a quantity is invalid for a cart operation.
+    """
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def clean_quantity(quantity, op) -> int:
+    """
+    Checks the quantity of an "add" or "update" operation: an integer (bool
+    excepted, JSON true / false aren't quantities), at least 1 for "add",
+    and at most MAX_ITEM_QUANTITY units either way.
+    Raises:
+        CartQuantityError: With the message of the first broken rule.
+    Returns:
+        int: The quantity.
+    """
+    if not isinstance(quantity, int) or isinstance(quantity, bool):
+        raise CartQuantityError("Quantity must be an integer.")
+    if op == "add" and quantity < 1:
+        raise CartQuantityError("Quantity must be a positive integer.")
+    if abs(quantity) > MAX_ITEM_QUANTITY:
+        raise CartQuantityError(f"Quantity can't be higher than {MAX_ITEM_QUANTITY}.")
+    return quantity
+
+
+# Every cart mutation locks the cart row before touching its items, like
+# checkout does, so they are serialized instead of deadlocking each other.
+
+
+def _add_to_total(cart_id, delta):
+    # pylint: disable=no-member
+    Cart.objects.filter(pk=cart_id).update(total_quantity=F("total_quantity") + delta)
+
+
+def lock_cart(cart_id):
+    """
+    Locks the cart row until the end of the current transaction.
+    """
+    # pylint: disable=no-member
+    Cart.objects.select_for_update().filter(pk=cart_id).values_list(
+        "pk", flat=True
+    ).first()
+
+
+def add_item(cart_id, product_id, quantity):
+    """
+    Adds quantity units of a product to the cart. The item row is upserted
+    with UPDATE ... SET quantity = quantity + n and an INSERT when it does not
+    exist yet, so concurrent requests never lose units. Cart.total_quantity
+    is kept in sync in the same transaction.
+    Raises:
+        CartQuantityError: If the quantity is invalid or the item would go
+        over MAX_ITEM_QUANTITY.
+    """
+    clean_quantity(quantity, "add")
+    with transaction.atomic():
+        _add_to_total(cart_id, quantity)
+        # The quantity filter keeps the item under the cap
+        # pylint: disable=no-member
+        items = CartItem.objects.filter(
+            cart_id=cart_id,
+            product_id=product_id,
+            quantity__lte=MAX_ITEM_QUANTITY - quantity,
+        )
+        if not items.update(quantity=F("quantity") + quantity):
+            try:
+                with transaction.atomic():
+                    CartItem.objects.create(
+                        cart_id=cart_id, product_id=product_id, quantity=quantity
+                    )
+            except IntegrityError:
+                # Another request inserted the row first, add to it instead,
+                # unless the row is already too full
+                if items.update(quantity=F("quantity") + quantity):
+                    return
+                if not CartItem.objects.filter(
+                    cart_id=cart_id, product_id=product_id
+                ).exists():
+                    raise
+                raise CartQuantityError(
+                    f"Quantity can't be higher than {MAX_ITEM_QUANTITY}."
+                )
+
+
+def change_item_quantity(cart_id, product_id, delta):
+    """
+    Adds delta (which may be negative) to the quantity of a product already in
+    the cart, atomically, and keeps Cart.total_quantity in sync.
+    Raises:
+        CartItemNotFound: If the product is not in the cart.
+        CartQuantityError: If the delta is invalid or the item would go over
+        MAX_ITEM_QUANTITY.
+        IntegrityError: If the quantity would become negative.
+    """
+    clean_quantity(delta, "update")
+    with transaction.atomic():
+        _add_to_total(cart_id, delta)
+        # pylint: disable=no-member
+        items = CartItem.objects.filter(cart_id=cart_id, product_id=product_id)
+        updated = items.filter(quantity__lte=MAX_ITEM_QUANTITY - delta).update(
+            quantity=F("quantity") + delta
+        )
+        if not updated:
+            if items.exists():
+                raise CartQuantityError(
+                    f"Quantity can't be higher than {MAX_ITEM_QUANTITY}."
+                )
+            raise CartItemNotFound()
+
+
+def remove_item(cart_id, product_id):
+    """
+    Removes a product from the cart and subtracts its quantity from
+    Cart.total_quantity. The item row is locked so a concurrent add can not
+    slip in between reading its quantity and deleting it.
+    Raises:
+        CartItemNotFound: If the product is not in the cart.
+    """
+    with transaction.atomic():
+        lock_cart(cart_id)
+        # pylint: disable=no-member
+        quantity = (
+            CartItem.objects.select_for_update()
+            .filter(cart_id=cart_id, product_id=product_id)
+            .values_list("quantity", flat=True)
+            .first()
+        )
+        if quantity is None:
+            raise CartItemNotFound()
+        CartItem.objects.filter(cart_id=cart_id, product_id=product_id).delete()
+        _add_to_total(cart_id, -quantity)
+
+
+class CartOperationError(Exception):
+    """
+    Raised when an operation of a batch can't be applied, nothing of the
+    batch is saved.
+    """
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+
+
+# Operations accepted by apply_operations
+CART_OPERATIONS = ("add", "update", "remove")
+
+
+def apply_operations(cart_id, operations):
+    """
+    Applies a list of {"op", "product_id", "quantity"} operations to the cart
+    in one transaction. The affected items are loaded (and locked) with one
+    query, the operations are replayed in memory and the result is written
+    with one bulk_create, one bulk_update and one delete.
+    Operations have the same meaning as the single item views: "add" adds
+    units (creating the item), "update" adds a delta to an item already in
+    the cart and "remove" deletes the item.
+    Raises:
+        CartOperationError: If an operation is invalid, nothing is applied.
+    """
+    product_ids = {operation["product_id"] for operation in operations}
+
+    with transaction.atomic():
+        lock_cart(cart_id)
+        # pylint: disable=no-member
+        items = {
+            item.product_id: item
+            for item in CartItem.objects.select_for_update().filter(
+                cart_id=cart_id, product_id__in=product_ids
+            )
+        }
+        original_quantities = {
+            product_id: item.quantity for product_id, item in items.items()
+        }
+
+        # Final quantity of every touched product, None means removed
+        quantities = dict(original_quantities)
+        for index, operation in enumerate(operations):
+            product_id, quantity = operation["product_id"], operation.get("quantity")
+            current = quantities.get(product_id)
+            if operation["op"] == "add":
+                quantities[product_id] = (current or 0) + quantity
+                if quantities[product_id] > MAX_ITEM_QUANTITY:
+                    raise CartOperationError(
+                        index, f"Quantity can't be higher than {MAX_ITEM_QUANTITY}."
+                    )
+            elif current is None:
+                raise CartOperationError(index, "Product is not in the cart.")
+            elif operation["op"] == "update":
+                if current + quantity < 0:
+                    raise CartOperationError(
+                        index, "Quantity can't be lower than zero."
+                    )
+                if current + quantity > MAX_ITEM_QUANTITY:
+                    raise CartOperationError(
+                        index, f"Quantity can't be higher than {MAX_ITEM_QUANTITY}."
+                    )
+                quantities[product_id] = current + quantity
+            else:
+                quantities[product_id] = None
+
+        to_create, to_update, to_delete = [], [], []
+        for product_id, quantity in quantities.items():
+            item = items.get(product_id)
+            if quantity is None:
+                if item is not None:
+                    to_delete.append(item.pk)
+            elif item is None:
+                to_create.append(
+                    CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                )
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                to_update.append(item)
+
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ["quantity"])
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+
+        delta = sum(quantity or 0 for quantity in quantities.values()) - sum(
+            original_quantities.values()
+        )
+        if delta:
+            _add_to_total(cart_id, delta)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Category
+
+
+# Shared (CACHES "default") version of the categories, bumped on every change
+CATEGORIES_VERSION_KEY = "categories_version"
+
+# Default of settings.CATEGORIES_CACHE_TIMEOUT: seconds the version lives,
+# its expiry makes every process rebuild its payload. It bounds how long
+# changes the signals don't see (raw SQL, other processes with a
+# per-process cache) stay invisible.
+DEFAULT_CATEGORIES_CACHE_TIMEOUT = 300
+
+# Seconds browsers and CDNs may reuse the public categories response
+PUBLIC_CATEGORIES_MAX_AGE = 300
+
+CategoriesPayload = namedtuple(
+    "CategoriesPayload", ["version", "body", "etag", "last_modified"]
+)
+
+_payload = None
+_payload_lock = threading.Lock()
+
+
+def get_categories_cache_timeout() -> int:
+    return getattr(
+        settings, "CATEGORIES_CACHE_TIMEOUT", DEFAULT_CATEGORIES_CACHE_TIMEOUT
+    )
+
+
+def get_categories_version() -> int:
+    """
+    Reads the current categories version, creating it if the cache lost it.
+    The version is the time of the last change in nanoseconds, so it also
+    serves as the Last-Modified date.
+    Returns:
+        int: The version.
+    """
+    version = cache.get(CATEGORIES_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(CATEGORIES_VERSION_KEY, version, get_categories_cache_timeout())
+        # Another process may have created it first, this one may have expired
+        version = cache.get(CATEGORIES_VERSION_KEY, version)
+    return version
+
+
+async def aget_categories_version() -> int:
+    """
+    Async version of get_categories_version.
+    Returns:
+        int: The version.
+    """
+    version = await cache.aget(CATEGORIES_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        await cache.aadd(
+            CATEGORIES_VERSION_KEY, version, get_categories_cache_timeout()
+        )
+        version = await cache.aget(CATEGORIES_VERSION_KEY, version)
+    return version
+
+
+def invalidate_categories():
+    """
+    Bumps the categories version, every process sharing the cache rebuilds
+    its payload on the next request. Writes that send no Category signal
+    must call it, or wait for CATEGORIES_CACHE_TIMEOUT.
+    """
+    global _payload  # pylint: disable=global-statement
+    cache.set(CATEGORIES_VERSION_KEY, time.time_ns(), get_categories_cache_timeout())
+    with _payload_lock:
+        _payload = None
+
+
+def _categories_queryset():
+    # pylint: disable=no-member
+    return Category.objects.order_by("pk").values_list("id", "name", "code")
+
+
+def build_categories_payload(version, rows=None) -> CategoriesPayload:
+    """
+    Serializes the categories, read from the database unless the
+    (id, name, code) rows are given.
+    Returns:
+        CategoriesPayload: The JSON body with its validators.
+    """
+    if rows is None:
+        rows = _categories_queryset()
+    categories_json = [
+        {"id": pk, "name": name, "code": code} for pk, name, code in rows
+    ]
+    body = json.dumps(
+        {
+            "message": "Categories retrieved successfully",
+            "categories": categories_json,
+        }
+    ).encode()
+    return CategoriesPayload(
+        version=version,
+        body=body,
+        # Derived from the content, so every process agrees on it
+        etag=f'"{hashlib.sha1(body).hexdigest()}"',
+        last_modified=version // 1_000_000_000,
+    )
+
+
+def get_categories_payload() -> CategoriesPayload:
+    """
+    Returns the serialized categories, only rebuilt when the version moved.
+    Returns:
+        CategoriesPayload: The JSON body with its ETag and Last-Modified
+        timestamp.
+    """
+    global _payload  # pylint: disable=global-statement
+    version = get_categories_version()
+    payload = _payload
+    if payload is None or payload.version != version:
+        payload = build_categories_payload(version)
+        with _payload_lock:
+            _payload = payload
+    return payload
+
+
+async def aget_categories_payload() -> CategoriesPayload:
+    """
+    Async version of get_categories_payload.
+    Returns:
+        CategoriesPayload: The JSON body with its ETag and Last-Modified
+        timestamp.
+    """
+    global _payload  # pylint: disable=global-statement
+    version = await aget_categories_version()
+    payload = _payload
+    if payload is None or payload.version != version:
+        rows = [row async for row in _categories_queryset()]
+        payload = build_categories_payload(version, rows)
+        with _payload_lock:
+            _payload = payload
+    return payload
+
+
+def categories_response(request, public=False) -> HttpResponse:
+    """
+    Serves the cached categories payload, or a 304 Not Modified when the
+    client's If-None-Match / If-Modified-Since still matches it.
+    Public responses may be stored by browsers and CDNs for
+    PUBLIC_CATEGORIES_MAX_AGE seconds, the others must be revalidated.
+    Returns:
+        HttpResponse: The JSON response or the 304.
+    """
+    return _payload_response(request, get_categories_payload(), public)
+
+
+async def acategories_response(request, public=False) -> HttpResponse:
+    """
+    Async version of categories_response.
+    Returns:
+        HttpResponse: The JSON response or the 304.
+    """
+    return _payload_response(request, await aget_categories_payload(), public)
+
+
+def _payload_response(request, payload, public) -> HttpResponse:
+    response = get_conditional_response(
+        request, etag=payload.etag, last_modified=payload.last_modified
+    )
+    if response is None:
+        response = HttpResponse(payload.body, content_type="application/json")
+    response["ETag"] = payload.etag
+    response["Last-Modified"] = http_date(payload.last_modified)
+    if public:
+        patch_cache_control(response, public=True, max_age=PUBLIC_CATEGORIES_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,93 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+
+from .cart import lock_cart
+from .listings import refresh_listings
+from .models import Product, Cart, CartItem, Order, OrderItem
+
+
+class CheckoutError(Exception):
+    """
+    Raised when a cart can't be turned into an order, nothing is saved.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def checkout(cart_id, customer_id, shipping_information):
+    """
+    Turns the cart into an order in one transaction:
+
+    1. The cart row is locked, so two checkouts of the same cart are serialized.
+    2. The products are locked with SELECT ... FOR UPDATE in primary key
+       order, every checkout takes the locks in the same order and they can't
+       deadlock each other.
+    3. Stock is decremented with UPDATE ... SET stock = stock - n WHERE
+       stock >= n, a product can never be oversold.
+    4. The order items are bulk inserted and the cart is emptied.
+
+    Raises:
+        CheckoutError: If the cart is empty or a product is out of stock.
+    Returns:
+        tuple: The new Order and the list of its OrderItem objects.
+    """
+    with transaction.atomic():
+        lock_cart(cart_id)
+        # pylint: disable=no-member
+        lines = dict(
+            CartItem.objects.filter(cart_id=cart_id, quantity__gt=0).values_list(
+                "product_id", "quantity"
+            )
+        )
+        if not lines:
+            raise CheckoutError("Cart is empty.")
+
+        products = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=lines)
+            .order_by("pk")
+            .only("id", "name", "price", "stock")
+        )
+
+        total_price = Decimal("0")
+        for product in products:
+            quantity = lines[product.pk]
+            updated = Product.objects.filter(pk=product.pk, stock__gte=quantity).update(
+                stock=F("stock") - quantity, updated_at=Now()
+            )
+            if not updated:
+                raise CheckoutError(
+                    f"Not enough stock for {product.name}.", status=409
+                )
+            total_price += product.price * quantity
+        # Queryset updates send no signals
+        refresh_listings(lines)
+
+        order = Order.objects.create(
+            customer_id=customer_id,
+            total_price=total_price,
+            shipping_information=shipping_information,
+        )
+        items = OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order,
+                    product_id=product.pk,
+                    quantity=lines[product.pk],
+                    price=product.price,
+                )
+                for product in products
+            ]
+        )
+
+        CartItem.objects.filter(cart_id=cart_id).delete()
+        Cart.objects.filter(pk=cart_id).update(total_quantity=0)
+
+    return order, items
+
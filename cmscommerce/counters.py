@@ -0,0 +1,200 @@
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Product, ProductCounter
+
+
+# Counter of the whole catalog
+ALL_PRODUCTS = "all"
+
+ProductCounts = namedtuple("ProductCounts", ["products", "in_stock"])
+
+# What a product adds to the counters: (seller_id, category_id, in_stock)
+ProductState = namedtuple("ProductState", ["seller_id", "category_id", "in_stock"])
+
+
+def seller_key(seller_id) -> str:
+    return f"seller:{seller_id}"
+
+
+def category_key(category_id) -> str:
+    return f"category:{category_id}"
+
+
+def _keys(state) -> tuple:
+    return (ALL_PRODUCTS, seller_key(state.seller_id), category_key(state.category_id))
+
+
+def count_changes(old_states, new_states) -> dict:
+    """
+    Compares the states of products before and after a write.
+    Returns:
+        dict: The (products, in_stock) delta of every counter that changed.
+    """
+    changes = defaultdict(lambda: [0, 0])
+    for states, sign in ((old_states, -1), (new_states, 1)):
+        for state in states:
+            for key in _keys(state):
+                changes[key][0] += sign
+                changes[key][1] += sign if state.in_stock else 0
+    return {key: tuple(delta) for key, delta in changes.items() if delta != [0, 0]}
+
+
+def apply_changes(changes):
+    """
+    Adds the deltas of count_changes to the counters with F() updates, one
+    UPDATE per distinct delta, in the caller's transaction. Missing
+    counters are created.
+    """
+    keys_by_delta = defaultdict(list)
+    for key, delta in changes.items():
+        keys_by_delta[delta].append(key)
+
+    # pylint: disable=no-member
+    for (products, in_stock), keys in keys_by_delta.items():
+        updated = ProductCounter.objects.filter(key__in=keys).update(
+            products=F("products") + products, in_stock=F("in_stock") + in_stock
+        )
+        if updated < len(keys):
+            existing = set(
+                ProductCounter.objects.filter(key__in=keys).values_list(
+                    "key", flat=True
+                )
+            )
+            ProductCounter.objects.bulk_create(
+                [
+                    ProductCounter(key=key, products=products, in_stock=in_stock)
+                    for key in keys
+                    if key not in existing
+                ],
+                ignore_conflicts=True,
+            )
+
+
+def create_counters(*keys):
+    """
+    Creates empty counters, for a new seller or category.
+    """
+    # pylint: disable=no-member
+    ProductCounter.objects.bulk_create(
+        [ProductCounter(key=key) for key in keys], ignore_conflicts=True
+    )
+
+
+def delete_counters(*keys):
+    # pylint: disable=no-member
+    ProductCounter.objects.filter(key__in=keys).delete()
+
+
+def get_counts(key) -> ProductCounts:
+    """
+    Reads one counter by primary key, whatever the number of products.
+    Returns:
+        ProductCounts: The number of products and of products in stock.
+    """
+    # pylint: disable=no-member
+    row = ProductCounter.objects.filter(key=key).values_list("products", "in_stock")
+    return ProductCounts(*row.first() or (0, 0))
+
+
+async def aget_counts(key) -> ProductCounts:
+    """
+    Async version of get_counts.
+    Returns:
+        ProductCounts: The number of products and of products in stock.
+    """
+    # pylint: disable=no-member
+    row = ProductCounter.objects.filter(key=key).values_list("products", "in_stock")
+    return ProductCounts(*await row.afirst() or (0, 0))
+
+
+def _catalog_counter_rows():
+    # pylint: disable=no-member
+    return ProductCounter.objects.filter(
+        Q(key=ALL_PRODUCTS) | Q(key__startswith=category_key(""))
+    ).values_list("key", "products", "in_stock")
+
+
+def _catalog_counts(rows) -> tuple:
+    catalog, categories = ProductCounts(0, 0), {}
+    for key, products, in_stock in rows:
+        if key == ALL_PRODUCTS:
+            catalog = ProductCounts(products, in_stock)
+        else:
+            categories[int(key.removeprefix(category_key("")))] = ProductCounts(
+                products, in_stock
+            )
+    return catalog, categories
+
+
+def get_catalog_counts():
+    """
+    Reads the catalog counter and every category counter in one query.
+    Returns:
+        tuple: The catalog ProductCounts and a {category_id: ProductCounts} dict.
+    """
+    return _catalog_counts(_catalog_counter_rows())
+
+
+async def aget_catalog_counts():
+    """
+    Async version of get_catalog_counts.
+    Returns:
+        tuple: The catalog ProductCounts and a {category_id: ProductCounts} dict.
+    """
+    return _catalog_counts([row async for row in _catalog_counter_rows()])
+
+
+def expected_counters() -> dict:
+    """
+    Counts the products of the catalog, of every seller and of every
+    category from the products table, with three GROUP BY queries.
+    Returns:
+        dict: The ProductCounts of every counter that should be non-zero.
+    """
+    aggregates = {
+        "products": Count("pk"),
+        "in_stock": Count("pk", filter=Q(stock__gt=0)),
+    }
+    # pylint: disable=no-member
+    expected = {ALL_PRODUCTS: ProductCounts(**Product.objects.aggregate(**aggregates))}
+    for field, key_for in (("seller_id", seller_key), ("category_id", category_key)):
+        for row in Product.objects.values(field).annotate(**aggregates).order_by():
+            expected[key_for(row[field])] = ProductCounts(
+                row["products"], row["in_stock"]
+            )
+    return expected
+
+
+def reconcile_counters() -> list:
+    """
+    Recomputes every counter from the products table and fixes the ones
+    that drifted. The counters are locked meanwhile, so writes waiting on
+    them apply their deltas on top of the fixed values.
+    Returns:
+        list: The (key, stored ProductCounts, expected ProductCounts) of
+        every fixed counter.
+    """
+    fixed = []
+    with transaction.atomic():
+        # pylint: disable=no-member
+        stored = {
+            counter.key: ProductCounts(counter.products, counter.in_stock)
+            for counter in ProductCounter.objects.select_for_update()
+        }
+        expected = expected_counters()
+        to_update, to_create = [], []
+        for key in stored.keys() | expected.keys():
+            counts = expected.get(key, ProductCounts(0, 0))
+            if stored.get(key) == counts:
+                continue
+            counter = ProductCounter(
+                key=key, products=counts.products, in_stock=counts.in_stock
+            )
+            (to_update if key in stored else to_create).append(counter)
+            fixed.append((key, stored.get(key), counts))
+        ProductCounter.objects.bulk_update(to_update, ["products", "in_stock"])
+        ProductCounter.objects.bulk_create(to_create)
+    return sorted(fixed)
@@ -0,0 +1,161 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Category, Product, Seller
+
+
+# Rows fetched per round trip, from a server-side cursor on PostgreSQL
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows encoded together before being handed to the response / file
+ROWS_PER_CHUNK = 500
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# Exported columns -> Product lookups
+EXPORT_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "brand": "brand",
+    "description": "description",
+    "base_price": "base_price",
+    "price": "price",
+    "stock": "stock",
+    "category_code": "category__code",
+    "category_name": "category__name",
+    "seller_id": "seller_id",
+    "seller_username": "seller__user__username",
+    "updated_at": "updated_at",
+}
+
+
+def parse_since(value):
+    """
+    Reads the "since" of an incremental export: an ISO 8601 datetime, or a
+    date meaning its midnight. Naive values are in the project's time zone.
+    Returns:
+        datetime: The aware datetime, or None if value is empty.
+    Raises:
+        ValueError: If the value is not a valid date or datetime.
+    """
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError("since must be an ISO 8601 date or datetime")
+        since = datetime.combine(date, time.min)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def changed_since(since) -> Q:
+    """
+    Products whose exported columns may have changed since a datetime: the
+    product itself, its category (name, code) or its seller's user
+    (username) was saved since then. Queryset updates of categories or users
+    must set their updated_at themselves to be picked up.
+    Returns:
+        Q: The filter, each part can use its own index.
+    """
+    # pylint: disable=no-member
+    return (
+        Q(updated_at__gte=since)
+        | Q(category__in=Category.objects.filter(updated_at__gte=since))
+        | Q(seller__in=Seller.objects.filter(user__updated_at__gte=since))
+    )
+
+
+def export_rows(since=None):
+    """
+    Reads the catalog joined with categories and seller usernames as tuples,
+    in pk order. .iterator() streams the rows through a server-side cursor on
+    PostgreSQL (a chunked fetch elsewhere), no model instance is built.
+    Returns:
+        iterator: Tuples of the EXPORT_FIELDS values.
+    """
+    # pylint: disable=no-member
+    queryset = Product.objects.order_by("pk")
+    if since is not None:
+        queryset = queryset.filter(changed_since(since))
+    return queryset.values_list(*EXPORT_FIELDS.values()).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    )
+
+
+class _Buffer:
+    """
+    File-like object csv.writer writes into, emptied after every chunk.
+    """
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+
+    def flush(self) -> str:
+        value = "".join(self.parts)
+        self.parts = []
+        return value
+
+
+def _csv_chunks(rows):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.flush()
+    yield buffer.flush()
+
+
+def _ndjson_chunks(rows):
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    names = list(EXPORT_FIELDS)
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(names, row))))
+        if len(lines) == ROWS_PER_CHUNK:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def gzip_chunks(chunks):
+    """
+    Compresses a stream of bytes into a gzip stream on the fly.
+    Yields:
+        bytes: The compressed parts.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_catalog(file_format, since=None, compress=False):
+    """
+    Exports the catalog (or the products updated since a datetime) as CSV
+    with a header line or as NDJSON, optionally gzipped. Only one chunk of
+    rows is held in memory at a time, whatever the size of the catalog.
+    Yields:
+        bytes: The next part of the export.
+    """
+    rows = export_rows(since)
+    chunks = _csv_chunks(rows) if file_format == "csv" else _ndjson_chunks(rows)
+    encoded = (chunk.encode() for chunk in chunks if chunk)
+    return gzip_chunks(encoded) if compress else encoded
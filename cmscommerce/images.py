@@ -0,0 +1,212 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models.functions import Now
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .listings import refresh_listings
+from .models import Product
+from .response_cache import invalidate_responses
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE_PIPELINE = {
+    # Threads processing uploads, 0 processes them on the request thread
+    "WORKERS": 2,
+    # Format of the resized variants: "WEBP" or "JPEG"
+    "FORMAT": "WEBP",
+    "QUALITY": 80,
+    # Longest side in pixels of every variant, stored in Product.image_<name>
+    "SIZES": {"thumbnail": 200, "medium": 600},
+    # Larger images are rejected before being decoded
+    "MAX_PIXELS": 40_000_000,
+}
+
+# Pillow formats accepted for uploads
+ALLOWED_IMAGE_FORMATS = ("JPEG", "PNG")
+
+INVALID_IMAGE_ERROR = "Image must be a valid .jpg or .png file."
+
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024
+
+
+def get_pipeline_config() -> dict:
+    return {**DEFAULT_IMAGE_PIPELINE, **getattr(settings, "IMAGE_PIPELINE", {})}
+
+
+def validate_image(image):
+    """
+    Checks the actual content of an uploaded image, not only its extension:
+    it must be a JPEG or PNG Pillow can parse, within the pixel limit.
+    Only the headers are read, the image is not decoded.
+    Returns:
+        str: The error message, or None if the image is valid.
+    """
+    try:
+        image.seek(0)
+        with Image.open(image) as img:
+            image_format = img.format
+            width, height = img.size
+            img.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        return INVALID_IMAGE_ERROR
+    except Image.DecompressionBombError:
+        return "Image dimensions are too large."
+    finally:
+        image.seek(0)
+
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        return INVALID_IMAGE_ERROR
+    if width * height > get_pipeline_config()["MAX_PIXELS"]:
+        return "Image dimensions are too large."
+    return None
+
+
+def validate_upload(image):
+    """
+    Checks an uploaded product image: .jpg / .png name, at most
+    MAX_UPLOAD_SIZE bytes and a content validate_image accepts.
+    Returns:
+        str: The error message, or None if the image is valid.
+    """
+    if not image.name.endswith((".jpg", ".png")):
+        return "Image must be a .jpg or .png file."
+    if image.size > MAX_UPLOAD_SIZE:
+        return "Image must be less than or equal to 2MB."
+    return validate_image(image)
+
+
+def _encode(img, image_format, quality) -> bytes:
+    """
+    Encodes an image without any of its metadata (EXIF, ICC, comments...).
+    """
+    if image_format in ("JPEG", "WEBP") and img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    if image_format == "JPEG" and img.mode == "RGBA":
+        img = img.convert("RGB")
+
+    output = BytesIO()
+    options = {"optimize": True} if image_format in ("JPEG", "PNG") else {}
+    if image_format in ("JPEG", "WEBP"):
+        options["quality"] = quality
+    img.save(output, format=image_format, **options)
+    return output.getvalue()
+
+
+def process_product_image(product_id, image_name):
+    """
+    Worker job for a freshly uploaded product image:
+
+    1. Re-encodes the original without metadata (EXIF orientation is applied
+       first) and replaces it.
+    2. Writes the resized variants configured in IMAGE_PIPELINE["SIZES"].
+    3. Points the product to the new files, unless its image changed meanwhile.
+    """
+    config = get_pipeline_config()
+    image_field = Product._meta.get_field("image")
+    storage = image_field.storage
+    base_name = os.path.splitext(os.path.basename(image_name))[0]
+    variant_extension = ".webp" if config["FORMAT"] == "WEBP" else ".jpg"
+    saved_names = []
+
+    try:
+        with storage.open(image_name, "rb") as stored:
+            with Image.open(stored) as source:
+                source_format = source.format
+                img = ImageOps.exif_transpose(source)
+                img.load()
+
+        clean_extension = ".png" if source_format == "PNG" else ".jpg"
+        clean_name = storage.save(
+            f"{os.path.dirname(image_name)}/{base_name}_clean{clean_extension}",
+            ContentFile(_encode(img, source_format, 90)),
+        )
+        saved_names.append(clean_name)
+
+        fields = {"image": clean_name}
+        for variant, size in config["SIZES"].items():
+            variant_img = img.copy()
+            variant_img.thumbnail((size, size), Image.LANCZOS)
+            upload_to = Product._meta.get_field(f"image_{variant}").upload_to
+            variant_name = storage.save(
+                f"{upload_to}{base_name}_{variant}{variant_extension}",
+                ContentFile(_encode(variant_img, config["FORMAT"], config["QUALITY"])),
+            )
+            saved_names.append(variant_name)
+            fields[f"image_{variant}"] = variant_name
+
+        # pylint: disable=no-member
+        with transaction.atomic():
+            updated = Product.objects.filter(pk=product_id, image=image_name).update(
+                updated_at=Now(), **fields
+            )
+            if updated:
+                refresh_listings([product_id])
+        if updated:
+            storage.delete(image_name)
+            invalidate_responses("all_products")
+        else:
+            # The product got another image (or was deleted) in the meantime
+            for name in saved_names:
+                storage.delete(name)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception(
+            "Couldn't process image %s of product %s", image_name, product_id
+        )
+
+
+def _process_in_worker(product_id, image_name):
+    try:
+        process_product_image(product_id, image_name)
+    finally:
+        # Worker threads keep their own connection, don't leak it
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the process-wide pool of image processing threads.
+    Returns:
+        ThreadPoolExecutor: The pool, or None if images are processed inline.
+    """
+    global _executor  # pylint: disable=global-statement
+    workers = get_pipeline_config()["WORKERS"]
+    if not workers:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="product-images"
+                )
+    return _executor
+
+
+def schedule_product_image(product):
+    """
+    Queues the processing of the product's current image once the
+    transaction that saved it commits.
+    """
+    if not product.image:
+        return
+    product_id, image_name = product.pk, product.image.name
+
+    def submit():
+        executor = get_executor()
+        if executor is None:
+            process_product_image(product_id, image_name)
+        else:
+            executor.submit(_process_in_worker, product_id, image_name)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,140 @@
+from django.db import transaction
+
+from .counters import ProductState, apply_changes, count_changes
+from .models import ProductListing
+from .serializers import product_queryset
+
+
+# Listings written per INSERT by rebuild_listings
+REBUILD_BATCH_SIZE = 1000
+
+# Columns rewritten when a product changes, everything but the primary key
+LISTING_UPDATE_FIELDS = [
+    "name",
+    "brand",
+    "description",
+    "base_price",
+    "price",
+    "stock",
+    "version",
+    "image",
+    "image_thumbnail",
+    "image_medium",
+    "category_id",
+    "category_name",
+    "category_code",
+    "seller_id",
+    "seller_username",
+]
+
+
+def listing_for(product) -> ProductListing:
+    """
+    Builds the listing row of a product. The product should come from
+    product_queryset (or have its category and seller's user loaded) to
+    avoid extra queries.
+    Returns:
+        ProductListing: The unsaved listing.
+    """
+    image = product.image.name or ""
+    return ProductListing(
+        product_id=product.pk,
+        name=product.name,
+        brand=product.brand,
+        description=product.description,
+        base_price=product.base_price,
+        price=product.price,
+        stock=product.stock,
+        version=product.version,
+        image=image,
+        image_thumbnail=product.image_thumbnail.name or image,
+        image_medium=product.image_medium.name or image,
+        category_id=product.category.id,
+        category_name=product.category.name,
+        category_code=product.category.code,
+        seller_id=product.seller.id,
+        seller_username=product.seller.user.username,
+    )
+
+
+def _listing_states(product_ids) -> dict:
+    # pylint: disable=no-member
+    rows = ProductListing.objects.filter(pk__in=product_ids).values_list(
+        "pk", "seller_id", "category_id", "stock"
+    )
+    return {
+        pk: ProductState(seller_id, category_id, stock > 0)
+        for pk, seller_id, category_id, stock in rows
+    }
+
+
+def save_listings(listings, created=False):
+    """
+    Inserts the listings or overwrites the existing ones, in one query, and
+    applies the difference to the product counters. created skips reading
+    the previous listings, for products that were just inserted.
+    """
+    old_states = (
+        {} if created else _listing_states([listing.pk for listing in listings])
+    )
+    # pylint: disable=no-member
+    ProductListing.objects.bulk_create(
+        listings,
+        update_conflicts=True,
+        unique_fields=["product"],
+        update_fields=LISTING_UPDATE_FIELDS,
+    )
+    # Values just assigned from the request may still be strings
+    new_states = [
+        ProductState(listing.seller_id, listing.category_id, int(listing.stock) > 0)
+        for listing in listings
+    ]
+    apply_changes(count_changes(old_states.values(), new_states))
+
+
+def forget_listings(product_ids):
+    """
+    Removes the products from the counters, before they are deleted (their
+    listings go with them through the cascade).
+    """
+    apply_changes(count_changes(_listing_states(product_ids).values(), []))
+
+
+def refresh_listings(product_ids):
+    """
+    Rewrites the listings of the given products from the products table,
+    for the writes that bypass Product.save() (queryset updates,
+    bulk_create, bulk_update). Should run in the transaction of the write.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    # pylint: disable=no-member
+    products = product_queryset().filter(pk__in=product_ids)
+    save_listings([listing_for(product) for product in products])
+
+
+def rebuild_listings() -> int:
+    """
+    Rewrites every listing from the products table in one transaction, to
+    fill the table or fix any drift.
+    Returns:
+        int: The number of listings.
+    """
+    count = 0
+    with transaction.atomic():
+        # pylint: disable=no-member
+        ProductListing.objects.all().delete()
+        batch = []
+        for product in (
+            product_queryset().order_by("pk").iterator(chunk_size=REBUILD_BATCH_SIZE)
+        ):
+            batch.append(listing_for(product))
+            if len(batch) == REBUILD_BATCH_SIZE:
+                ProductListing.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            ProductListing.objects.bulk_create(batch)
+            count += len(batch)
+    return count
@@ -0,0 +1,124 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from cmscommerce.benchmarks import (
+    ENDPOINTS,
+    clear_caches,
+    compare_results,
+    load_results,
+    run_benchmark,
+    seed_data,
+)
+from cmscommerce.urls import urlpatterns
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks every cmscommerce endpoint through the test client against "
+        "a freshly created and seeded test database: latency percentiles, "
+        "query count and peak memory. Results can be saved as JSON and "
+        "compared to a previous run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            help="Only benchmark this URL name (can be repeated).",
+        )
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear the caches before every request.",
+        )
+        parser.add_argument("--sellers", type=int, default=10)
+        parser.add_argument("--customers", type=int, default=100)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--compare", help="JSON results of a previous run to compare against."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Allowed growth of latencies and memory, as a fraction.",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the test database (it is seeded again on the next run).",
+        )
+
+    def handle(self, *args, **options):
+        url_names = [pattern.name for pattern in urlpatterns if pattern.name]
+        missing = [name for name in url_names if name not in ENDPOINTS]
+        if missing:
+            self.stderr.write(f"No benchmark for: {', '.join(missing)}")
+        names = options["endpoint"] or [name for name in url_names if name in ENDPOINTS]
+        unknown = set(names) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        baseline = load_results(options["compare"]) if options["compare"] else None
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            clear_caches()
+            ids = seed_data(
+                sellers=options["sellers"],
+                customers=options["customers"],
+                products=options["products"],
+            )
+            results = {}
+            for name in names:
+                results[name] = run_benchmark(
+                    ids, name, options["iterations"], options["cold"]
+                )
+                result = results[name]
+                self.stdout.write(
+                    f"{name:<22} {result['status']}  p50 {result['p50_ms']:>8.2f}ms  "
+                    f"p95 {result['p95_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms  "
+                    f"queries {result['queries']:>3}  "
+                    f"peak {result['peak_memory_kb']:>9.1f}KiB"
+                )
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"]
+            )
+            teardown_test_environment()
+
+        report = {
+            "meta": {
+                "date": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "iterations": options["iterations"],
+                "cold": options["cold"],
+                "sellers": options["sellers"],
+                "customers": options["customers"],
+                "products": options["products"],
+            },
+            "endpoints": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2)
+
+        if baseline is not None:
+            regressions = compare_results(baseline, report, options["threshold"])
+            for name, metric, before, after in regressions:
+                self.stderr.write(f"{name}: {metric} went from {before} to {after}")
+            if regressions:
+                raise CommandError("Performance regressions found.")
+            self.stdout.write(self.style.SUCCESS("No regression."))
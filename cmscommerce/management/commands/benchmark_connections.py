@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from cmscommerce.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures what a database connection costs per request: requests are "
+        "simulated with the request_started / request_finished signals that "
+        "close the expired connections, around one query, first with a new "
+        "connection per request (CONN_MAX_AGE=0) and then with the configured "
+        "persistent connections. Run it against the production database to "
+        "include the network and TLS handshakes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        settings_dict = connection.settings_dict
+        conn_max_age = settings_dict["CONN_MAX_AGE"] or 600
+        profiles = [
+            ("new connection per request", 0, False),
+            (f"persistent ({conn_max_age}s)", conn_max_age, False),
+            (f"persistent ({conn_max_age}s) + health checks", conn_max_age, True),
+        ]
+        saved = settings_dict["CONN_MAX_AGE"], settings_dict["CONN_HEALTH_CHECKS"]
+        try:
+            for label, max_age, health_checks in profiles:
+                settings_dict["CONN_MAX_AGE"] = max_age
+                settings_dict["CONN_HEALTH_CHECKS"] = health_checks
+                connection.close()
+                latencies, connects = self.run(connection, options["requests"])
+                self.stdout.write(
+                    f"{label:<40} connects {connects:>5}  "
+                    f"p50 {percentile(latencies, 50):>7.2f}ms  "
+                    f"p95 {percentile(latencies, 95):>7.2f}ms  "
+                    f"mean {sum(latencies) / len(latencies):>7.2f}ms"
+                )
+        finally:
+            settings_dict["CONN_MAX_AGE"], settings_dict["CONN_HEALTH_CHECKS"] = saved
+            connection.close()
+
+    def run(self, connection, requests):
+        """
+        Returns:
+            tuple: The latency of every request (ms) and the number of
+            connections opened.
+        """
+        connects = []
+
+        def count_connect(sender, connection, **kwargs):
+            connects.append(connection.alias)
+
+        connection_created.connect(count_connect)
+        latencies = []
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                request_started.send(sender=self.__class__)
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                request_finished.send(sender=self.__class__)
+                latencies.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection_created.disconnect(count_connect)
+        return latencies, connects.count(connection.alias)
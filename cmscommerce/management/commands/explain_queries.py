@@ -0,0 +1,118 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from cmscommerce.counters import ALL_PRODUCTS, category_key, seller_key
+
+from cmscommerce.models import (
+    User,
+    Product,
+    ProductCounter,
+    ProductListing,
+    Seller,
+    Customer,
+    Category,
+    Cart,
+    CartItem,
+)
+from cmscommerce.serializers import cart_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints the EXPLAIN plan of the queries run by each cmscommerce endpoint, "
+        "so missing indexes show up as sequential scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            help="Only explain the queries of this endpoint (can be repeated).",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run EXPLAIN ANALYZE (PostgreSQL only), the queries are executed.",
+        )
+        parser.add_argument("--per-page", type=int, default=10)
+
+    def get_queries(self, per_page):
+        """
+        Builds the querysets each endpoint runs, using existing rows as sample
+        parameters where possible.
+        Returns:
+            dict: Endpoint name -> list of (description, queryset).
+        """
+        # pylint: disable=no-member
+        seller_id = Seller.objects.values_list("pk", flat=True).first() or 1
+        cart_id = Cart.objects.values_list("pk", flat=True).first() or 1
+        customer_user_id = (
+            Customer.objects.values_list("user_id", flat=True).first() or 1
+        )
+        product_id = Product.objects.values_list("pk", flat=True).first() or 1
+        middle_product_id = Product.objects.count() // 2
+
+        listings = ProductListing.objects.order_by("pk")
+        return {
+            "all_products": [
+                (
+                    "counters",
+                    ProductCounter.objects.filter(
+                        Q(key=ALL_PRODUCTS) | Q(key__startswith=category_key(""))
+                    ),
+                ),
+                ("page", listings[:per_page]),
+                (
+                    "cursor page",
+                    listings.filter(pk__gt=middle_product_id)[: per_page + 1],
+                ),
+            ],
+            "all_product_ids": [
+                ("ids", Product.objects.order_by("pk").values_list("pk", flat=True)),
+            ],
+            "seller_dashboard": [
+                ("counters", ProductCounter.objects.filter(key=seller_key(seller_id))),
+                ("page", listings.filter(seller_id=seller_id)[:per_page]),
+            ],
+            "categories": [
+                ("categories", Category.objects.all()),
+            ],
+            "get_cart": [
+                (
+                    "cart",
+                    Cart.objects.only("id").filter(customer__user_id=customer_user_id),
+                ),
+                ("lines", cart_lines(cart_id)),
+            ],
+            "add_to_cart": [
+                (
+                    "cart item",
+                    CartItem.objects.filter(cart_id=cart_id, product_id=product_id),
+                ),
+            ],
+            "role_required": [
+                ("sellers", User.objects.filter(role="Seller")),
+            ],
+        }
+
+    def handle(self, *args, **options):
+        queries = self.get_queries(options["per_page"])
+        endpoints = options["endpoint"] or list(queries)
+        explain_options = {}
+        if options["analyze"]:
+            if connection.vendor != "postgresql":
+                self.stderr.write("--analyze is only supported on PostgreSQL.")
+                return
+            explain_options = {"analyze": True, "buffers": True}
+
+        for endpoint in endpoints:
+            if endpoint not in queries:
+                self.stderr.write(f"Unknown endpoint: {endpoint}")
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(endpoint))
+            for description, queryset in queries[endpoint]:
+                self.stdout.write(self.style.MIGRATE_LABEL(f"  {description}"))
+                self.stdout.write(f"    {queryset.query}")
+                for line in queryset.explain(**explain_options).splitlines():
+                    self.stdout.write(f"    {line}")
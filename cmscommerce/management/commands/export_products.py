@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cmscommerce.export import EXPORT_FORMATS, export_catalog, parse_since
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the catalog (products with their category and seller username) "
+        "as CSV or NDJSON, optionally gzipped and limited to recent updates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument(
+            "--output", help="File to write, defaults to the standard output."
+        )
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument(
+            "--since",
+            help=(
+                "Only products updated since this ISO 8601 date or datetime, "
+                "or whose category or seller's user was."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options["since"])
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+
+        started_at = timezone.now()
+        chunks = export_catalog(options["format"], since, options["gzip"])
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+
+        # Pass it as --since to the next run to only export what changed
+        self.stderr.write(f"Export started at {started_at.isoformat()}")
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cmscommerce.models import Seller
+from cmscommerce.products import IMPORT_FORMATS, import_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk imports the products of a CSV (with a header line) or JSON Lines "
+        "file for a seller, and prints the rows that were rejected."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--seller", type=int, required=True, help="User ID of the seller."
+        )
+        parser.add_argument(
+            "--format",
+            choices=IMPORT_FORMATS,
+            help="Defaults to the extension of the file.",
+        )
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or options["path"].rsplit(".", 1)[-1].lower()
+        if file_format not in IMPORT_FORMATS:
+            raise CommandError("File must be a .csv or .jsonl file, or use --format.")
+        try:
+            # pylint: disable=no-member
+            seller = Seller.objects.get(user_id=options["seller"])
+        except Seller.DoesNotExist as e:
+            raise CommandError("Seller with provided ID does not exist.") from e
+
+        started = time.perf_counter()
+        with open(options["path"], "rb") as file:
+            report = import_products(seller, file, file_format)
+        elapsed = time.perf_counter() - started
+
+        for error in report.errors:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        if report.error_count > len(report.errors):
+            self.stderr.write(
+                f"... and {report.error_count - len(report.errors)} more errors"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report.created} products in {elapsed:.2f}s, "
+                f"{report.error_count} rows rejected."
+            )
+        )
@@ -0,0 +1,158 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Q
+
+from cmscommerce.checkout import CheckoutError, checkout
+from cmscommerce.models import (
+    User,
+    Seller,
+    Customer,
+    Category,
+    Product,
+    Cart,
+    CartItem,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Flash-sale load test: many customers check out the same product at once. "
+        "Creates its own users, category and product, and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=200)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument(
+            "--stock", type=int, default=100, help="Units of the hot product."
+        )
+        parser.add_argument(
+            "--quantity", type=int, default=1, help="Units in every cart."
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Don't delete the created rows."
+        )
+
+    def create_data(self, options):
+        """
+        Creates the hot product and one customer with a cart holding it per
+        simulated buyer.
+        Returns:
+            tuple: The run id, the category, the product and the list of
+            (cart id, customer id).
+        """
+        run_id = uuid.uuid4().hex[:8]
+        # pylint: disable=no-member
+        category = Category.objects.create(
+            name=f"Load test {run_id}", code=f"lt-{run_id}"
+        )
+        seller_user = User.objects.create(username=f"lt-seller-{run_id}", role="Seller")
+        product = Product.objects.create(
+            name="Flash sale product",
+            brand="Load test",
+            description="Load test",
+            base_price="20.00",
+            price="10.00",
+            stock=options["stock"],
+            category=category,
+            seller=Seller.objects.create(user=seller_user),
+        )
+
+        users = User.objects.bulk_create(
+            User(username=f"lt-customer-{run_id}-{i}", role="Customer")
+            for i in range(options["customers"])
+        )
+        customers = Customer.objects.bulk_create(Customer(user=user) for user in users)
+        carts = Cart.objects.bulk_create(
+            Cart(customer=customer, total_quantity=options["quantity"])
+            for customer in customers
+        )
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=product, quantity=options["quantity"])
+            for cart in carts
+        )
+        return run_id, category, product, [(cart.pk, cart.customer_id) for cart in carts]
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite" and options["threads"] > 1:
+            self.stderr.write(
+                "SQLite has no row locks, concurrent checkouts will fail with "
+                "'database is locked'. Run it against PostgreSQL or with --threads 1."
+            )
+        run_id, category, product, carts = self.create_data(options)
+        pending = list(carts)
+        lock = threading.Lock()
+        results = {"orders": 0, "sold_out": 0, "errors": 0}
+        latencies = []
+        errors = []
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        cart_id, customer_id = pending.pop()
+                    started = time.perf_counter()
+                    try:
+                        checkout(cart_id, customer_id, "Load test address")
+                        outcome = "orders"
+                    except CheckoutError:
+                        outcome = "sold_out"
+                    except Exception as e:  # pylint: disable=broad-except
+                        outcome = "errors"
+                        errors.append(e)
+                    with lock:
+                        results[outcome] += 1
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        sold = results["orders"] * options["quantity"]
+        latencies.sort()
+
+        self.stdout.write(f"Checkouts attempted: {len(carts)} in {elapsed:.2f}s")
+        self.stdout.write(f"Throughput: {len(carts) / elapsed:.1f} checkouts/s")
+        self.stdout.write(
+            f"Orders: {results['orders']}, sold out: {results['sold_out']}, "
+            f"errors: {results['errors']}"
+        )
+        if errors:
+            self.stderr.write(f"First error: {errors[0]!r}")
+        if latencies:
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f"Latency p50: {p50 * 1000:.1f}ms, p99: {p99 * 1000:.1f}ms"
+            )
+        self.stdout.write(
+            f"Stock left: {product.stock} (sold {sold} of {options['stock']})"
+        )
+
+        oversold = product.stock < 0 or sold + product.stock != options["stock"]
+        if oversold:
+            self.stderr.write(self.style.ERROR("Stock is inconsistent with the orders!"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No overselling."))
+
+        if not options["keep"]:
+            # Customers, carts, orders, seller and product go with their users
+            # pylint: disable=no-member
+            User.objects.filter(
+                Q(username=f"lt-seller-{run_id}")
+                | Q(username__startswith=f"lt-customer-{run_id}-")
+            ).delete()
+            category.delete()
@@ -0,0 +1,154 @@
+import asyncio
+import socket
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cmscommerce.benchmarks import percentile
+
+
+# A slow client reads READ_SIZE bytes at a time, client_delay is spread over
+# READS_PER_RESPONSE reads (a larger response takes proportionally longer)
+READ_SIZE = 4096
+READS_PER_RESPONSE = 10
+
+
+class Command(BaseCommand):
+    help = (
+        "HTTP load test of a running server, to compare deployments under the "
+        "same load, e.g. sync workers:\n"
+        "  gunicorn gmarket.wsgi --workers 4\n"
+        "against the ASGI application:\n"
+        "  gunicorn gmarket.asgi --workers 4 -k uvicorn.workers.UvicornWorker\n"
+        "Clients can download the responses slowly (--client-delay), like "
+        "clients on a bad mobile connection: a sync worker is held until the "
+        "response fits in the socket buffers, an ASGI worker keeps serving "
+        "the other requests meanwhile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument(
+            "--path",
+            action="append",
+            help="Path to request, in turns (can be repeated). Defaults to "
+            "/all_products?per_page=100 and /public/categories.",
+        )
+        parser.add_argument("--token", help="Token sent in the Authorization header.")
+        parser.add_argument(
+            "--concurrency", type=int, default=100, help="Simultaneous clients."
+        )
+        parser.add_argument(
+            "--requests", type=int, default=1000, help="Total number of requests."
+        )
+        parser.add_argument(
+            "--client-delay",
+            type=float,
+            default=0.0,
+            help=f"Seconds each client waits while reading every "
+            f"{READS_PER_RESPONSE * READ_SIZE // 1024}KiB of a response.",
+        )
+        parser.add_argument("--timeout", type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("--url must be an http:// URL.")
+        paths = options["path"] or ["/all_products?per_page=100", "/public/categories"]
+        results = asyncio.run(self.run(url, paths, options))
+
+        elapsed = results["elapsed"]
+        latencies = results["latencies"]
+        self.stdout.write(
+            f"{options['requests']} requests, {options['concurrency']} clients, "
+            f"{options['client_delay']}s client delay: {elapsed:.2f}s"
+        )
+        self.stdout.write(f"Throughput: {len(latencies) / elapsed:.1f} requests/s")
+        self.stdout.write(
+            "Statuses: "
+            + ", ".join(
+                f"{status}: {count}"
+                for status, count in sorted(results["statuses"].items())
+            )
+        )
+        if latencies:
+            self.stdout.write(
+                f"Latency p50: {percentile(latencies, 50) * 1000:.1f}ms, "
+                f"p95: {percentile(latencies, 95) * 1000:.1f}ms, "
+                f"p99: {percentile(latencies, 99) * 1000:.1f}ms"
+            )
+        if results["errors"]:
+            self.stderr.write(
+                f"{sum(results['errors'].values())} failed requests, first: "
+                f"{next(iter(results['errors']))}"
+            )
+
+    async def run(self, url, paths, options):
+        port = url.port or 80
+        headers = [f"Host: {url.netloc}", "Connection: close"]
+        if options["token"]:
+            headers.append(f"Authorization: Token {options['token']}")
+        requests = [
+            (
+                f"GET {url.path.rstrip('/')}{paths[i % len(paths)]} HTTP/1.1\r\n"
+                + "".join(f"{header}\r\n" for header in headers)
+                + "\r\n"
+            ).encode()
+            for i in range(options["requests"])
+        ]
+
+        latencies = []
+        statuses = Counter()
+        errors = Counter()
+
+        async def client():
+            while requests:
+                request = requests.pop()
+                started = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(
+                        self.send(url.hostname, port, request, options["client_delay"]),
+                        options["timeout"],
+                    )
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError) as e:
+                    errors[repr(e)] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options["concurrency"])))
+        return {
+            "elapsed": time.perf_counter() - started,
+            "latencies": latencies,
+            "statuses": statuses,
+            "errors": errors,
+        }
+
+    @staticmethod
+    async def send(host, port, request, client_delay):
+        """
+        Sends one request and reads the response through a small receive
+        buffer, in READ_SIZE parts spread over client_delay seconds.
+        Returns:
+            int: The response status.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, READ_SIZE)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, (host, port))
+        reader, writer = await asyncio.open_connection(sock=sock, limit=READ_SIZE)
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            while True:
+                if client_delay:
+                    await asyncio.sleep(client_delay / READS_PER_RESPONSE)
+                if not await reader.read(READ_SIZE):
+                    break
+        finally:
+            writer.close()
+        return int(status_line.split()[1])
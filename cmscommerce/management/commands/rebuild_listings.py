@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cmscommerce.listings import rebuild_listings
+from cmscommerce.response_cache import invalidate_responses
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrites the ProductListing table from the products, categories and "
+        "sellers, after loading fixtures or raw SQL changes to the catalog."
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_listings()
+        invalidate_responses("all_products")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {count} listings in {time.perf_counter() - started:.2f}s."
+            )
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from cmscommerce.counters import reconcile_counters
+from cmscommerce.response_cache import invalidate_responses
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the per-catalog, per-seller and per-category product "
+        "counters from the products table and fixes the ones that drifted "
+        "(raw SQL changes, fixtures, bulk_create without refresh_listings)."
+    )
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters()
+        for key, stored, expected in fixed:
+            self.stdout.write(f"{key}: {stored} -> {expected}")
+        if fixed:
+            invalidate_responses("all_products")
+        self.stdout.write(self.style.SUCCESS(f"Fixed {len(fixed)} counters."))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cmscommerce.benchmarks import SEED_PASSWORD, seed_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills an empty database with the default categories and generated "
+        "sellers, customers with carts and products, using bulk inserts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sellers", type=int, default=10)
+        parser.add_argument("--customers", type=int, default=100)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument(
+            "--cart-items", type=int, default=3, help="Products in every cart."
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the random data."
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        seed_data(
+            sellers=options["sellers"],
+            customers=options["customers"],
+            products=options["products"],
+            cart_items=options["cart_items"],
+            seed=options["seed"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded in {time.perf_counter() - started:.2f}s, "
+                f'users are "bench-seller-<n>" / "bench-customer-<n>" with the '
+                f'password "{SEED_PASSWORD}".'
+            )
+        )
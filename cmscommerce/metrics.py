@@ -0,0 +1,346 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from .token_cache import get_token_cache
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS = {
+    "ENABLED": True,
+    # Log the queries of requests running more than this many, None disables it
+    "LOG_QUERY_COUNT_OVER": None,
+    # Log every query slower than this many milliseconds, None disables it
+    "LOG_QUERY_TIME_OVER_MS": None,
+    # Client addresses (REMOTE_ADDR) allowed to read /metrics, None opens it
+    # to everyone
+    "ALLOWED_IPS": ("127.0.0.1", "::1"),
+}
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def get_metrics_config() -> dict:
+    return {**DEFAULT_METRICS, **getattr(settings, "METRICS", {})}
+
+
+def can_read_metrics(request) -> bool:
+    """
+    Returns:
+        bool: Whether the client may read /metrics, see METRICS["ALLOWED_IPS"].
+    """
+    allowed_ips = get_metrics_config()["ALLOWED_IPS"]
+    return allowed_ips is None or request.META.get("REMOTE_ADDR") in allowed_ips
+
+
+class RequestStats:
+    """
+    What a request spent on the database and in the serializers.
+    """
+
+    def __init__(self, keep_queries=False, slow_query_time=None):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serialize_depth = 0
+        self.queries = [] if keep_queries else None
+        # Seconds over which a query is logged, or None
+        self.slow_query_time = slow_query_time
+
+
+_current_stats = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def measure_serialization():
+    """
+    Adds the time spent in the block to the serialization time of the
+    current request. Nested blocks are only counted once.
+    """
+    stats = _current_stats.get()
+    if stats is None:
+        yield
+        return
+    stats.serialize_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize_depth -= 1
+        if not stats.serialize_depth:
+            stats.serialize_time += time.perf_counter() - started
+
+
+def timed_serializer(func):
+    """
+    Decorator counting the time spent in a serializer as serialization time.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with measure_serialization():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class Histogram:
+    """
+    Prometheus histogram with one series per label value.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # Label value -> ([count per bucket + the +Inf one], sum)
+        self.series = {}
+
+    def observe(self, label, value):
+        counts, total = self.series.get(label) or ([0] * (len(self.buckets) + 1), 0)
+        counts[bisect_left(self.buckets, value)] += 1
+        self.series[label] = (counts, total + value)
+
+    def render(self, label_name) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_name}="{label}",le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(f'{self.name}_sum{{{label_name}="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{{label_name}="{label}"}} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Per-process request metrics, labelled by URL name.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.duration = Histogram(
+            "cmscommerce_request_duration_seconds",
+            "Total time spent processing the request.",
+            DURATION_BUCKETS,
+        )
+        self.db_duration = Histogram(
+            "cmscommerce_request_db_duration_seconds",
+            "Time spent running SQL queries.",
+            DURATION_BUCKETS,
+        )
+        self.serialize_duration = Histogram(
+            "cmscommerce_request_serialize_duration_seconds",
+            "Time spent in the serializers.",
+            DURATION_BUCKETS,
+        )
+        self.queries = Histogram(
+            "cmscommerce_request_queries",
+            "Number of SQL queries run.",
+            QUERY_COUNT_BUCKETS,
+        )
+        self.responses = {}
+
+    def record(self, view, status, stats, duration):
+        with self.lock:
+            self.duration.observe(view, duration)
+            self.db_duration.observe(view, stats.db_time)
+            self.serialize_duration.observe(view, stats.serialize_time)
+            self.queries.observe(view, stats.query_count)
+            key = (view, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            lines = [
+                "# HELP cmscommerce_responses_total Responses sent.",
+                "# TYPE cmscommerce_responses_total counter",
+            ]
+            for (view, status), count in sorted(self.responses.items()):
+                lines.append(
+                    f'cmscommerce_responses_total{{view="{view}",status="{status}"}} '
+                    f"{count}"
+                )
+            for histogram in (
+                self.duration,
+                self.db_duration,
+                self.serialize_duration,
+                self.queries,
+            ):
+                lines.extend(histogram.render("view"))
+        lines.extend(render_token_cache())
+        return "\n".join(lines) + "\n"
+
+
+def render_token_cache() -> list:
+    """
+    Returns:
+        list: The hit and miss counters (and size, for the in-process LRU) of
+        the token cache, in the Prometheus text exposition format.
+    """
+    stats = get_token_cache().stats()
+    lines = []
+    for name, documentation in (
+        ("hits", "Token lookups answered by the token cache."),
+        ("misses", "Token lookups that went to the database."),
+    ):
+        lines.extend(
+            [
+                f"# HELP cmscommerce_token_cache_{name}_total {documentation}",
+                f"# TYPE cmscommerce_token_cache_{name}_total counter",
+                f"cmscommerce_token_cache_{name}_total {stats[name]}",
+            ]
+        )
+    if "size" in stats:
+        lines.extend(
+            [
+                "# HELP cmscommerce_token_cache_size Tokens held by the token cache.",
+                "# TYPE cmscommerce_token_cache_size gauge",
+                f"cmscommerce_token_cache_size {stats['size']}",
+            ]
+        )
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper adding every query to the stats of the current request.
+    It stays installed on the connections: the async ORM runs its queries on
+    another thread, with its own connections, but with a copy of the
+    request's context.
+    """
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.query_count += 1
+        stats.db_time += elapsed
+        if stats.queries is not None:
+            stats.queries.append((sql, elapsed))
+        if stats.slow_query_time is not None and elapsed > stats.slow_query_time:
+            logger.warning("Slow query (%.1fms): %s", elapsed * 1000, sql)
+
+
+def install_query_recorder(connection, **kwargs):
+    """
+    connection_created receiver installing record_query on a connection.
+    It goes first in the list, execute_wrapper() pops the last one.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def _request_stats(config) -> RequestStats:
+    slow_query_ms = config["LOG_QUERY_TIME_OVER_MS"]
+    return RequestStats(
+        keep_queries=config["LOG_QUERY_COUNT_OVER"] is not None,
+        slow_query_time=None if slow_query_ms is None else slow_query_ms / 1000,
+    )
+
+
+def server_timing(stats, duration) -> str:
+    return (
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries", '
+        f"serialize;dur={stats.serialize_time * 1000:.1f}, "
+        f"total;dur={duration * 1000:.1f}"
+    )
+
+
+class MetricsMiddleware:
+    """
+    Measures the query count, database time, serialization time and total
+    time of every request, sends them in a Server-Timing header and records
+    them per URL name for the /metrics endpoint.
+    Queries run while a streaming response is consumed are not counted.
+    Works in both sync and async stacks, so async views stay async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = get_metrics_config()
+        if not config["ENABLED"]:
+            return self.get_response(request)
+
+        for connection in connections.all():
+            install_query_recorder(connection)
+        stats = _request_stats(config)
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, stats, started, config)
+
+    async def __acall__(self, request):
+        config = get_metrics_config()
+        if not config["ENABLED"]:
+            return await self.get_response(request)
+
+        # The connections of the ORM thread got the recorder when they were
+        # created, see install_query_recorder
+        stats = _request_stats(config)
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, stats, started, config)
+
+    def finish(self, request, response, stats, started, config):
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unmatched"
+        registry.record(view, response.status_code, stats, duration)
+        response["Server-Timing"] = server_timing(stats, duration)
+
+        log_count_over = config["LOG_QUERY_COUNT_OVER"]
+        if log_count_over is not None and stats.query_count > log_count_over:
+            logger.warning(
+                "%s %s ran %d queries:\n%s",
+                request.method,
+                request.path,
+                stats.query_count,
+                "\n".join(
+                    f"({elapsed * 1000:.1f}ms) {sql}" for sql, elapsed in stats.queries
+                ),
+            )
+        return response
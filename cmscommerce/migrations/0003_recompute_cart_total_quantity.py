@@ -0,0 +1,32 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def recompute_total_quantity(apps, schema_editor):
+    """
+    Cart.total_quantity was never maintained, set it from the cart items once
+    so the atomic cart operations can keep it in sync from now on.
+    """
+    Cart = apps.get_model("cmscommerce", "Cart")
+    CartItem = apps.get_model("cmscommerce", "CartItem")
+    items_quantity = (
+        CartItem.objects.filter(cart_id=OuterRef("pk"))
+        .values("cart_id")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    Cart.objects.update(total_quantity=Coalesce(Subquery(items_quantity), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmscommerce', '0002_indexes_and_unique_cart_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            recompute_total_quantity, reverse_code=migrations.RunPython.noop
+        ),
+    ]
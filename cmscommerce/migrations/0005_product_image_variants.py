@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmscommerce', '0004_order_orderitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_medium',
+            field=models.ImageField(blank=True, upload_to='product_images/variants/'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, upload_to='product_images/variants/'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# Weighted tsvector over the product's own text columns, PostgreSQL keeps it
+# up to date on every INSERT / UPDATE. Category names are matched at query time.
+ADD_SEARCH_VECTOR = """
+ALTER TABLE cmscommerce_product ADD COLUMN search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(name, '')), 'A')
+    || setweight(to_tsvector('english', coalesce(brand, '')), 'B')
+    || setweight(to_tsvector('english', coalesce(description, '')), 'C')
+) STORED;
+CREATE INDEX product_search_vector_idx ON cmscommerce_product USING GIN (search_vector);
+"""
+
+DROP_SEARCH_VECTOR = """
+DROP INDEX IF EXISTS product_search_vector_idx;
+ALTER TABLE cmscommerce_product DROP COLUMN IF EXISTS search_vector;
+"""
+
+
+def add_search_vector(apps, schema_editor):
+    # Other databases use the in-memory index of cmscommerce.search
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(ADD_SEARCH_VECTOR)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_SEARCH_VECTOR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmscommerce', '0005_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, reverse_code=drop_search_vector),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_listings(apps, schema_editor):
+    """
+    Creates the listing of every existing product, in batches.
+    """
+    Product = apps.get_model("cmscommerce", "Product")
+    ProductListing = apps.get_model("cmscommerce", "ProductListing")
+    db_alias = schema_editor.connection.alias
+    products = Product.objects.using(db_alias).order_by("pk").values(
+        "pk",
+        "name",
+        "brand",
+        "description",
+        "base_price",
+        "price",
+        "stock",
+        "version",
+        "image",
+        "image_thumbnail",
+        "image_medium",
+        "category_id",
+        "category__name",
+        "category__code",
+        "seller_id",
+        "seller__user__username",
+    )
+    batch = []
+    for row in products.iterator(chunk_size=1000):
+        image = row["image"] or ""
+        batch.append(
+            ProductListing(
+                product_id=row["pk"],
+                name=row["name"],
+                brand=row["brand"],
+                description=row["description"],
+                base_price=row["base_price"],
+                price=row["price"],
+                stock=row["stock"],
+                version=row["version"],
+                image=image,
+                image_thumbnail=row["image_thumbnail"] or image,
+                image_medium=row["image_medium"] or image,
+                category_id=row["category_id"],
+                category_name=row["category__name"],
+                category_code=row["category__code"],
+                seller_id=row["seller_id"],
+                seller_username=row["seller__user__username"],
+            )
+        )
+        if len(batch) == 1000:
+            ProductListing.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    ProductListing.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmscommerce', '0008_product_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                (
+                    'product',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name='listing',
+                        serialize=False,
+                        to='cmscommerce.product',
+                    ),
+                ),
+                ('name', models.CharField(max_length=100)),
+                ('brand', models.CharField(max_length=50)),
+                ('description', models.TextField()),
+                ('base_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('stock', models.PositiveIntegerField()),
+                ('version', models.PositiveIntegerField()),
+                ('image', models.CharField(blank=True, max_length=100)),
+                ('image_thumbnail', models.CharField(blank=True, max_length=100)),
+                ('image_medium', models.CharField(blank=True, max_length=100)),
+                ('category_id', models.IntegerField()),
+                ('category_name', models.CharField(max_length=50)),
+                ('category_code', models.CharField(max_length=15)),
+                ('seller_id', models.IntegerField()),
+                ('seller_username', models.CharField(max_length=150)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(
+                        fields=['seller_id', 'product'],
+                        name='listing_seller_product_idx',
+                    ),
+                    models.Index(
+                        fields=['price', 'product'], name='listing_price_product_idx'
+                    ),
+                    models.Index(
+                        fields=['name', 'product'], name='listing_name_product_idx'
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_listings, reverse_code=migrations.RunPython.noop),
+    ]
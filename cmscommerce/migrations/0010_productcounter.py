@@ -0,0 +1,59 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:26
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Counts the existing products of the catalog, of every seller and of
+    every category. Sellers and categories without products get an empty
+    counter.
+    """
+    Product = apps.get_model("cmscommerce", "Product")
+    Seller = apps.get_model("cmscommerce", "Seller")
+    Category = apps.get_model("cmscommerce", "Category")
+    ProductCounter = apps.get_model("cmscommerce", "ProductCounter")
+    db_alias = schema_editor.connection.alias
+    products = Product.objects.using(db_alias)
+    aggregates = {
+        "products": Count("pk"),
+        "in_stock": Count("pk", filter=Q(stock__gt=0)),
+    }
+
+    counters = {"all": ProductCounter(key="all", **products.aggregate(**aggregates))}
+    for prefix, model in (("seller", Seller), ("category", Category)):
+        for pk in model.objects.using(db_alias).values_list("pk", flat=True):
+            counters[f"{prefix}:{pk}"] = ProductCounter(key=f"{prefix}:{pk}")
+        field = f"{prefix}_id"
+        for row in products.values(field).annotate(**aggregates).order_by():
+            counters[f"{prefix}:{row[field]}"] = ProductCounter(
+                key=f"{prefix}:{row[field]}",
+                products=row["products"],
+                in_stock=row["in_stock"],
+            )
+    ProductCounter.objects.using(db_alias).bulk_create(
+        counters.values(), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmscommerce', '0009_productlisting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCounter',
+            fields=[
+                (
+                    'key',
+                    models.CharField(max_length=30, primary_key=True, serialize=False),
+                ),
+                ('products', models.IntegerField(default=0)),
+                ('in_stock', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, reverse_code=migrations.RunPython.noop),
+    ]
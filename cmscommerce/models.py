@@ -11,6 +11,13 @@ class User(AbstractUser):
     ]
     role = models.CharField(max_length=10, choices=USER_ROLES, default="Customer")
     created_at = models.DateTimeField(default=timezone.now)
+    # The username is exported with the seller's products, see cmscommerce.export
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["role"], name="user_role_idx"),
+        ]
 
 
 class Seller(models.Model):
@@ -29,6 +36,9 @@ class Category(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=50, unique=True)
     code = models.CharField(max_length=15, unique=True)
+    # The name and code are exported with the products, see cmscommerce.export
+    updated_at = models.DateTimeField(auto_now=True)
+
 
 class Product(models.Model):
     id = models.AutoField(primary_key=True)
@@ -39,29 +49,108 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
     image = models.ImageField(upload_to="product_images/")
+    # Resized, metadata-free copies of image generated by cmscommerce.images
+    image_thumbnail = models.ImageField(upload_to="product_images/variants/", blank=True)
+    image_medium = models.ImageField(upload_to="product_images/variants/", blank=True)
     category = models.ForeignKey(
         Category, on_delete=models.CASCADE, related_name="products"
     )
     seller = models.ForeignKey(
         Seller, on_delete=models.CASCADE, related_name="products"
     )
+    # Set by save() and bulk_create(), queryset updates must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
+    # Incremented by every seller edit, for optimistic concurrency (If-Match)
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # seller_dashboard: filter by seller, order by pk
+            models.Index(fields=["seller", "id"], name="product_seller_id_idx"),
+            # Category listings ordered / filtered by price
+            models.Index(fields=["category", "price"], name="product_category_price_idx"),
+            # Cursor pagination sorted by (price, pk) and (name, pk)
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(fields=["name", "id"], name="product_name_id_idx"),
+            # Incremental catalog exports
+            models.Index(fields=["updated_at"], name="product_updated_at_idx"),
+        ]
+
+
+class ProductListing(models.Model):
+    """
+    Denormalized copy of a product with everything the listing JSON needs,
+    kept in sync by cmscommerce.listings, so listings read a single table.
+    """
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="listing"
+    )
+    name = models.CharField(max_length=100)
+    brand = models.CharField(max_length=50)
+    description = models.TextField()
+    base_price = models.DecimalField(max_digits=10, decimal_places=2)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    stock = models.PositiveIntegerField()
+    version = models.PositiveIntegerField()
+    # Storage names of every image size, missing sizes fall back to the original
+    image = models.CharField(max_length=100, blank=True)
+    image_thumbnail = models.CharField(max_length=100, blank=True)
+    image_medium = models.CharField(max_length=100, blank=True)
+    category_id = models.IntegerField()
+    category_name = models.CharField(max_length=50)
+    category_code = models.CharField(max_length=15)
+    seller_id = models.IntegerField()
+    seller_username = models.CharField(max_length=150)
+
+    class Meta:
+        indexes = [
+            # seller_dashboard: filter by seller, order by pk
+            models.Index(
+                fields=["seller_id", "product"], name="listing_seller_product_idx"
+            ),
+            # Cursor pagination sorted by (price, pk) and (name, pk)
+            models.Index(fields=["price", "product"], name="listing_price_product_idx"),
+            models.Index(fields=["name", "product"], name="listing_name_product_idx"),
+        ]
+
+
+class ProductCounter(models.Model):
+    """
+    Number of products, and of products in stock, of the whole catalog
+    ("all"), of a seller ("seller:<id>") or of a category ("category:<id>"),
+    kept up to date by cmscommerce.counters.
+    """
+
+    key = models.CharField(max_length=30, primary_key=True)
+    # Signed so a drifted counter never blocks a write, see reconcile_counters
+    products = models.IntegerField(default=0)
+    in_stock = models.IntegerField(default=0)
+
+
+class Order(models.Model):
+    ORDER_STATUSES = [
+        ("Pending", "Pending"),
+        ("Paid", "Paid"),
+        ("Shipped", "Shipped"),
+        ("Cancelled", "Cancelled"),
+    ]
+    id = models.AutoField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    products = models.ManyToManyField(Product, through="OrderItem")
+    order_date = models.DateTimeField(auto_now_add=True)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    shipping_information = models.TextField()
+    status = models.CharField(max_length=20, choices=ORDER_STATUSES, default="Pending")
 
 
-# class Order(models.Model):
-#     id = models.AutoField(primary_key=True)
-#     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
-#     products = models.ManyToManyField(Product, through="OrderItem")
-#     order_date = models.DateTimeField(auto_now_add=True)
-#     total_price = models.DecimalField(max_digits=10, decimal_places=2)
-#     shipping_information = models.TextField()
-#     status = models.CharField(max_length=20)
-
-
-# class OrderItem(models.Model):
-#     id = models.AutoField(primary_key=True)
-#     order = models.ForeignKey(Order, on_delete=models.CASCADE)
-#     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-#     quantity = models.PositiveIntegerField()
+class OrderItem(models.Model):
+    id = models.AutoField(primary_key=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    # Unit price at checkout time, the product price may change later
+    price = models.DecimalField(max_digits=10, decimal_places=2)
 
 
 class Cart(models.Model):
@@ -75,4 +164,12 @@ class CartItem(models.Model):
     id = models.AutoField(primary_key=True)
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    quantity = models.PositiveIntegerField()
\ No newline at end of file
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            # One row per product in a cart, also serves the (cart, product) lookups
+            models.UniqueConstraint(
+                fields=["cart", "product"], name="unique_cart_product"
+            ),
+        ]
@@ -0,0 +1,291 @@
+import base64
+import binascii
+import json
+import math
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import Q
+
+
+# Upper bound for the "per_page" query param, the frontend only offers 5 to 50
+MAX_PER_PAGE = 100
+DEFAULT_PER_PAGE = 10
+
+# Fields a cursor listing can be sorted by, the primary key is always the tie-breaker
+CURSOR_SORT_FIELDS = ("name", "price")
+
+# Seconds a listing's COUNT(*) is reused before it is computed again
+COUNT_CACHE_TIMEOUT = 60
+
+
+def get_per_page(request) -> int:
+    """
+    Reads the "per_page" query param and clamps it to a sane range.
+    Returns:
+        int: The number of products to show per page.
+    """
+    try:
+        per_page = int(request.GET.get("per_page", DEFAULT_PER_PAGE))
+    except (TypeError, ValueError):
+        per_page = DEFAULT_PER_PAGE
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def _count_cache_key(count_key) -> str:
+    return f"listing_count:{count_key}"
+
+
+def cached_count(queryset, count_key) -> int:
+    """
+    Returns the number of rows of a listing, reusing the last COUNT(*) for
+    COUNT_CACHE_TIMEOUT seconds.
+    Returns:
+        int: The (possibly slightly stale) number of rows.
+    """
+    if count_key is None:
+        return queryset.count()
+
+    key = _count_cache_key(count_key)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+async def acached_count(queryset, count_key) -> int:
+    """
+    Async version of cached_count.
+    Returns:
+        int: The (possibly slightly stale) number of rows.
+    """
+    if count_key is None:
+        return await queryset.acount()
+
+    key = _count_cache_key(count_key)
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate_count(*count_keys):
+    """
+    Drops the cached counts of the given listings, used after products are
+    created or deleted.
+    """
+    cache.delete_many([_count_cache_key(count_key) for count_key in count_keys])
+
+
+def paginate(request, queryset, count_key=None, total_count=None):
+    """
+    Slices an ordered queryset down to the requested page.
+    Only the rows of that page are fetched from the database, the caller must
+    serialize page.object_list and never the whole queryset.
+
+    Requests with a "cursor" query param (an empty one asks for the first page)
+    are served by keyset pagination, the rest by page number. total_count,
+    when already known (e.g. from cmscommerce.counters), skips the COUNT(*).
+    Returns:
+        tuple: The list of objects of the page and the "pagination_info" dict.
+    """
+    if "cursor" in request.GET:
+        return paginate_by_cursor(request, queryset, count_key, total_count)
+    return paginate_by_page(request, queryset, count_key, total_count)
+
+
+async def apaginate(request, queryset, count_key=None, total_count=None):
+    """
+    Async version of paginate, for querysets only.
+    Returns:
+        tuple: The list of objects of the page and the "pagination_info" dict.
+    """
+    if total_count is None:
+        total_count = await acached_count(queryset, count_key)
+    if "cursor" in request.GET:
+        plan = _plan_cursor_page(request, queryset)
+        rows = [row async for row in plan.queryset[: plan.per_page + 1]]
+        return _cursor_page(plan, rows, total_count)
+
+    page, pagination_info = _page(request, queryset, total_count)
+    return [obj async for obj in page.object_list], pagination_info
+
+
+def paginate_by_page(request, object_list, count_key=None, total_count=None):
+    """
+    Page-number pagination ("page" and "per_page" query params) over a
+    queryset or a list.
+    Returns:
+        tuple: The list of objects of the page and the "pagination_info" dict.
+    """
+    if total_count is None and count_key is not None:
+        total_count = cached_count(object_list, count_key)
+    page, pagination_info = _page(request, object_list, total_count)
+    return page.object_list, pagination_info
+
+
+def _page(request, object_list, count=None):
+    """
+    Picks the requested page, counting the objects unless count is given.
+    The objects of the page are not fetched yet.
+    Returns:
+        tuple: The Page and the "pagination_info" dict.
+    """
+    per_page = get_per_page(request)
+
+    paginator = Paginator(object_list, per_page)
+    if count is not None:
+        # Paginator.count is a cached_property, so setting it skips the COUNT(*)
+        paginator.count = count
+
+    try:
+        page = paginator.page(request.GET.get("page", 1))
+    except (EmptyPage, PageNotAnInteger):
+        # Handle out-of-range pages by returning the first page
+        page = paginator.page(1)
+
+    pagination_info = {
+        "total_pages": paginator.num_pages,
+        # The page served, which differs from the requested one when it fell back
+        "current_page": page.number,
+        "products_per_page": per_page,
+        "has_next": page.has_next(),
+        "has_previous": page.has_previous(),
+    }
+    return page, pagination_info
+
+
+def encode_cursor(sort_key, position, direction) -> str:
+    """
+    Builds the opaque cursor handed to the client.
+    Returns:
+        str: A url-safe base64 string.
+    """
+    payload = json.dumps({"s": sort_key, "p": position, "d": direction})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, sort_key):
+    """
+    Reads a cursor built by encode_cursor.
+    Returns:
+        tuple: The keyset position and the direction ("next" or "prev").
+    Raises:
+        ValueError: If the cursor is malformed or was built for another sort key.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        position, direction = payload["p"], payload["d"]
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+    expected_length = 2 if sort_key else 1
+    if (
+        payload.get("s") != sort_key
+        or direction not in ("next", "prev")
+        or not isinstance(position, list)
+        or len(position) != expected_length
+    ):
+        raise ValueError("Invalid cursor.")
+    return position, direction
+
+
+def _keyset_filter(sort_key, position, direction) -> Q:
+    lookup = "gt" if direction == "next" else "lt"
+    if not sort_key:
+        return Q(**{f"pk__{lookup}": position[0]})
+    sort_value, pk = position
+    return Q(**{f"{sort_key}__{lookup}": sort_value}) | Q(
+        **{sort_key: sort_value, f"pk__{lookup}": pk}
+    )
+
+
+def _position(obj, sort_key) -> list:
+    if not sort_key:
+        return [obj.pk]
+    return [str(getattr(obj, sort_key)), obj.pk]
+
+
+# Keyset page to fetch: the ordered and filtered queryset and how to read it
+CursorPlan = namedtuple(
+    "CursorPlan", ["queryset", "per_page", "sort_key", "position", "direction"]
+)
+
+
+def paginate_by_cursor(request, queryset, count_key=None, total_count=None):
+    """
+    Keyset pagination over (pk) or (sort_key, pk). Every page is a single
+    indexed range scan of per_page + 1 rows, so deep pages cost the same as
+    the first one. Malformed cursors fall back to the first page.
+    Returns:
+        tuple: The list of objects of the page and the "pagination_info" dict.
+    """
+    plan = _plan_cursor_page(request, queryset)
+    rows = list(plan.queryset[: plan.per_page + 1])
+    if total_count is None:
+        total_count = cached_count(queryset, count_key)
+    return _cursor_page(plan, rows, total_count)
+
+
+def _plan_cursor_page(request, queryset) -> CursorPlan:
+    per_page = get_per_page(request)
+    sort_key = request.GET.get("sort")
+    if sort_key not in CURSOR_SORT_FIELDS:
+        sort_key = None
+
+    position, direction = None, "next"
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            position, direction = decode_cursor(cursor, sort_key)
+        except ValueError:
+            position, direction = None, "next"
+
+    ordering = [sort_key, "pk"] if sort_key else ["pk"]
+    if direction == "prev":
+        ordering = [f"-{field}" for field in ordering]
+
+    page_queryset = queryset.order_by(*ordering)
+    if position is not None:
+        page_queryset = page_queryset.filter(
+            _keyset_filter(sort_key, position, direction)
+        )
+    return CursorPlan(page_queryset, per_page, sort_key, position, direction)
+
+
+def _cursor_page(plan, rows, total_count):
+    """
+    Builds a keyset page from the per_page + 1 rows fetched for its plan.
+    Returns:
+        tuple: The list of objects of the page and the "pagination_info" dict.
+    """
+    per_page, sort_key = plan.per_page, plan.sort_key
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if plan.direction == "prev":
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, plan.position is not None
+
+    pagination_info = {
+        "total_pages": max(1, math.ceil(total_count / per_page)),
+        "products_per_page": per_page,
+        "has_next": has_next and bool(rows),
+        "has_previous": has_previous and bool(rows),
+        "next_cursor": (
+            encode_cursor(sort_key, _position(rows[-1], sort_key), "next")
+            if has_next and rows
+            else None
+        ),
+        "prev_cursor": (
+            encode_cursor(sort_key, _position(rows[0], sort_key), "prev")
+            if has_previous and rows
+            else None
+        ),
+    }
+    return rows, pagination_info
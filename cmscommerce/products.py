@@ -0,0 +1,406 @@
+import csv
+import io
+import json
+import math
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+
+from .listings import refresh_listings
+from .models import Product, Category
+from .response_cache import invalidate_responses
+from .search import invalidate_index
+
+
+# Products inserted per bulk_create / transaction
+IMPORT_BATCH_SIZE = 1000
+
+# Rows listed in the error report, the others are only counted
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+DEFAULT_CATEGORY_CODE = "no-category"
+
+# Prices have 10 digits, 2 of them decimals
+MAX_PRICE = Decimal("99999999.99")
+
+# Largest value of a PositiveIntegerField on every supported database
+MAX_STOCK = 2147483647
+
+
+class ProductValidationError(Exception):
+    """
+    Raised when product fields break one of the create_product rules.
+    """
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+# Fields set by create_product and update_product, with their "required" message
+PRODUCT_FIELDS = {
+    "name": "Name is required",
+    "brand": "Brand is required",
+    "description": "Description is required",
+    "base_price": "Base price is required",
+    "price": "Price is required",
+    "stock": "Stock is required",
+}
+
+
+def validate_product_fields(data, partial=False) -> dict:
+    """
+    Checks the fields of a product: name, brand, description, base_price,
+    price and stock are required, prices are positive numbers rounded to 2
+    decimals and stock is a positive integer. With partial=True only the
+    fields present in data are checked, but they can't be empty either.
+    Raises:
+        ProductValidationError: With the message of the first broken rule.
+    Returns:
+        dict: The cleaned values of the checked fields.
+    """
+    values = {
+        name: None if data.get(name) is None else str(data.get(name))
+        for name in PRODUCT_FIELDS
+        if not partial or name in data
+    }
+    for name, message in PRODUCT_FIELDS.items():
+        if name in values and not values[name]:
+            raise ProductValidationError(message)
+
+    for name in ("name", "brand"):
+        max_length = Product._meta.get_field(name).max_length
+        if name in values and len(values[name]) > max_length:
+            raise ProductValidationError(
+                f"{name.capitalize()} can't be longer than {max_length} characters"
+            )
+
+    for name, label in (("base_price", "Base price"), ("price", "Price")):
+        if name not in values:
+            continue
+        try:
+            values[name] = round(float(values[name]), 2)
+        except ValueError as e:
+            raise ProductValidationError(f"{label} must be a valid number") from e
+        # float() accepts "nan" and "inf"
+        if not math.isfinite(values[name]):
+            raise ProductValidationError(f"{label} must be a valid number")
+        if values[name] < 0:
+            raise ProductValidationError(f"{label} must be a positive number")
+        if values[name] > MAX_PRICE:
+            raise ProductValidationError(f"{label} can't be higher than {MAX_PRICE}")
+
+    if "stock" in values:
+        if not values["stock"].isdecimal():
+            raise ProductValidationError("Stock must be a positive integer")
+        values["stock"] = int(values["stock"])
+        if values["stock"] > MAX_STOCK:
+            raise ProductValidationError(f"Stock can't be higher than {MAX_STOCK}")
+    return values
+
+
+def product_etag(product) -> str:
+    """
+    Returns:
+        str: The ETag of a version of a product, for If-Match.
+    """
+    return f'"{product.pk}-{product.version}"'
+
+
+def parse_if_match(header, product_id):
+    """
+    Reads the version a client expects from an If-Match header built by
+    product_etag ("*" or no header means any version).
+    Returns:
+        int: The expected version, or None.
+    Raises:
+        ValueError: If the header is not an ETag of this product.
+    """
+    if not header or header.strip() == "*":
+        return None
+    etag = header.strip().removeprefix("W/").strip('"')
+    pk, _, version = etag.partition("-")
+    if pk != str(product_id) or not version.isdigit():
+        raise ValueError("If-Match must be an ETag of this product.")
+    return int(version)
+
+
+def read_rows(file, file_format):
+    """
+    Parses an uploaded CSV (with a header line) or JSON Lines file one row
+    at a time, the file is never loaded whole.
+    Yields:
+        tuple: The 1-based row number and the row dict, or None if the row
+        couldn't be parsed.
+    """
+    if file_format == "csv":
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, row
+    else:
+        for number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except (UnicodeError, ValueError):
+                row = None
+            yield number, row if isinstance(row, dict) else None
+
+
+class ImportReport:
+    """
+    Outcome of an import: the number of products created and the errors of
+    the rejected rows.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+# Errors of a rejected insert, reported per row
+INSERT_ERRORS = (IntegrityError, DataError, ValidationError)
+
+
+def _insert_error_message(error) -> str:
+    if isinstance(error, ValidationError):
+        return " ".join(error.messages)
+    if isinstance(error, IntegrityError):
+        return f"Product already exists or is invalid: {error}"
+    return f"Product is invalid: {error}"
+
+
+def _insert_batch(batch, report):
+    """
+    Inserts a batch in one statement, or row by row if the batch is rejected
+    so only the faulty rows are reported.
+    """
+    # pylint: disable=no-member
+    try:
+        with transaction.atomic():
+            products = Product.objects.bulk_create(
+                [product for _, product in batch], batch_size=IMPORT_BATCH_SIZE
+            )
+            # bulk_create sends no signals
+            refresh_listings(product.pk for product in products)
+        report.created += len(batch)
+        return
+    except INSERT_ERRORS:
+        pass
+    for row_number, product in batch:
+        try:
+            with transaction.atomic():
+                product.save(force_insert=True)
+            report.created += 1
+        except INSERT_ERRORS as e:
+            report.add_error(row_number, _insert_error_message(e))
+
+
+def import_products(seller, file, file_format) -> ImportReport:
+    """
+    Creates the products of a CSV / JSON Lines file for a seller.
+    Rows are validated like create_product does, categories are resolved
+    from a code -> id map loaded once, and the valid products are inserted
+    with bulk_create in batches of IMPORT_BATCH_SIZE. Invalid rows are
+    skipped and reported, the others are imported.
+    Returns:
+        ImportReport: The number of created products and the row errors.
+    """
+    # pylint: disable=no-member
+    category_ids = dict(Category.objects.values_list("code", "id"))
+    report = ImportReport()
+    batch = []
+
+    for row_number, row in read_rows(file, file_format):
+        if row is None:
+            report.add_error(row_number, "Row couldn't be parsed.")
+            continue
+        try:
+            values = validate_product_fields(row)
+        except ProductValidationError as e:
+            report.add_error(row_number, e.message)
+            continue
+
+        category_code = row.get("category_code") or DEFAULT_CATEGORY_CODE
+        category_id = category_ids.get(category_code)
+        if category_id is None:
+            report.add_error(
+                row_number, f"Category with code {category_code} does not exist."
+            )
+            continue
+
+        batch.append(
+            (row_number, Product(category_id=category_id, seller=seller, **values))
+        )
+        if len(batch) == IMPORT_BATCH_SIZE:
+            _insert_batch(batch, report)
+            batch = []
+    if batch:
+        _insert_batch(batch, report)
+
+    if report.created:
+        # bulk_create sends no signals, the caches are dropped here
+        invalidate_responses("all_products")
+        invalidate_index()
+    return report
+
+
+class BulkUpdateError(Exception):
+    """
+    Raised when an update of a bulk stock / price update can't be applied,
+    nothing of the batch is saved.
+    """
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+
+
+def _parse_price(value, name):
+    try:
+        price = Decimal(str(value))
+    except InvalidOperation as e:
+        raise ValueError(f"{name} must be a valid number") from e
+    if not price.is_finite():
+        raise ValueError(f"{name} must be a valid number")
+    if abs(price) > MAX_PRICE:
+        raise ValueError(f"{name} can't be higher than {MAX_PRICE}")
+    return price.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def _parse_int(value, name):
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"{name} must be an integer")
+    return value
+
+
+def _parse_stock(value, name):
+    stock = _parse_int(value, name)
+    if abs(stock) > MAX_STOCK:
+        raise ValueError(f"{name} can't be higher than {MAX_STOCK}")
+    return stock
+
+
+def clean_stock_price_update(update) -> dict:
+    """
+    Checks one {"product_id", "stock" | "stock_delta", "price" | "price_delta"}
+    update: absolute values replace the current ones, deltas are added to them.
+    Raises:
+        ValueError: If the update is malformed.
+    Returns:
+        dict: The product_id and the given values, prices as Decimals.
+    """
+    if not isinstance(update, dict):
+        raise ValueError("Invalid update.")
+    cleaned = {"product_id": _parse_int(update.get("product_id"), "Product ID")}
+    for name in ("stock", "stock_delta"):
+        if update.get(name) is not None:
+            cleaned[name] = _parse_stock(update[name], name)
+    for name in ("price", "price_delta"):
+        if update.get(name) is not None:
+            cleaned[name] = _parse_price(update[name], name)
+
+    if "stock" in cleaned and "stock_delta" in cleaned:
+        raise ValueError("stock and stock_delta can't be combined")
+    if "price" in cleaned and "price_delta" in cleaned:
+        raise ValueError("price and price_delta can't be combined")
+    if len(cleaned) == 1:
+        raise ValueError("Nothing to update")
+    return cleaned
+
+
+def apply_stock_price_updates(seller_id, updates) -> list:
+    """
+    Applies cleaned stock / price updates to the seller's own products in one
+    transaction: the products are loaded (and locked) with one query, the
+    updates are replayed in memory, so deltas apply to the locked values, and
+    the result is written with one bulk_update of the changed columns only.
+    Raises:
+        ValueError: If seller_id is None.
+        BulkUpdateError: If a product isn't the seller's or would get a
+        stock or price out of its column's range, nothing is applied.
+    Returns:
+        list: The updated products, with their id, stock, price and new
+        version loaded.
+    """
+    if seller_id is None:
+        raise ValueError("A seller is required")
+    product_ids = {update["product_id"] for update in updates}
+
+    with transaction.atomic():
+        # pylint: disable=no-member
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update()
+            .filter(seller_id=seller_id, pk__in=product_ids)
+            .order_by("pk")
+            .only("id", "stock", "price", "version")
+        }
+
+        fields = set()
+        for index, update in enumerate(updates):
+            product = products.get(update["product_id"])
+            if product is None:
+                raise BulkUpdateError(index, "Product with provided ID does not exist.")
+            if "stock" in update or "stock_delta" in update:
+                stock = update.get(
+                    "stock", product.stock + update.get("stock_delta", 0)
+                )
+                if stock < 0:
+                    raise BulkUpdateError(index, "Stock can't be lower than zero.")
+                if stock > MAX_STOCK:
+                    raise BulkUpdateError(
+                        index, f"Stock can't be higher than {MAX_STOCK}."
+                    )
+                product.stock = stock
+                fields.add("stock")
+            if "price" in update or "price_delta" in update:
+                price = update.get(
+                    "price", product.price + update.get("price_delta", 0)
+                )
+                if price < 0:
+                    raise BulkUpdateError(index, "Price must be a positive number.")
+                if price > MAX_PRICE:
+                    raise BulkUpdateError(
+                        index, f"Price can't be higher than {MAX_PRICE}."
+                    )
+                product.price = price
+                fields.add("price")
+
+        # bulk_update doesn't apply auto_now
+        now = timezone.now()
+        for product in products.values():
+            product.updated_at = now
+            # The rows are locked, the new version can be computed here
+            product.version += 1
+        Product.objects.bulk_update(
+            products.values(),
+            sorted(fields) + ["updated_at", "version"],
+            batch_size=500,
+        )
+        refresh_listings(products)
+
+    # Queryset updates send no signals
+    invalidate_responses("all_products")
+    invalidate_index()
+    return list(products.values())
@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .routers import read_from_primary
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE_CACHE = {
+    # CACHES alias storing the responses: locmem, file based or Redis
+    "CACHE_ALIAS": "default",
+    # Seconds a cached response is served before it is rebuilt
+    "TIMEOUT": 60,
+    # Seconds a stale response may still be served while one worker rebuilds it
+    "STALE_TIMEOUT": 30,
+    # Seconds the rebuilding worker holds the lock, and the others wait on a cold miss
+    "LOCK_TIMEOUT": 10,
+    # Seconds after an invalidation during which responses are rebuilt from
+    # the primary database, it must exceed the read replicas' lag
+    "PRIMARY_SECONDS": 5,
+}
+
+# Sleep between two checks while another worker builds a missing response
+WAIT_INTERVAL = 0.05
+
+# Namespaces of the cache_response views, filled as they are decorated
+RESPONSE_NAMESPACES = set()
+
+
+def get_response_cache_config() -> dict:
+    return {**DEFAULT_RESPONSE_CACHE, **getattr(settings, "RESPONSE_CACHE", {})}
+
+
+def get_response_cache():
+    return caches[get_response_cache_config()["CACHE_ALIAS"]]
+
+
+def _generation_key(namespace) -> str:
+    return f"response_generation:{namespace}"
+
+
+def get_generation(namespace) -> int:
+    """
+    Reads the current generation of a namespace of cached responses. Keys of
+    older generations are never read again and simply expire. A generation
+    is the time of the invalidation that started it, in nanoseconds.
+    Returns:
+        int: The generation.
+    """
+    response_cache = get_response_cache()
+    key = _generation_key(namespace)
+    generation = response_cache.get(key)
+    if generation is None:
+        # Lost or never set: start from the clock so no old key is reused
+        response_cache.add(key, time.time_ns(), None)
+        generation = response_cache.get(key)
+    return generation
+
+
+async def aget_generation(namespace) -> int:
+    """
+    Async version of get_generation.
+    Returns:
+        int: The generation.
+    """
+    response_cache = get_response_cache()
+    key = _generation_key(namespace)
+    generation = await response_cache.aget(key)
+    if generation is None:
+        await response_cache.aadd(key, time.time_ns(), None)
+        generation = await response_cache.aget(key)
+    return generation
+
+
+def invalidate_responses(*namespaces):
+    """
+    Moves the given namespaces to a new generation, which orphans all their
+    cached responses at once without having to know their keys.
+    """
+    response_cache = get_response_cache()
+    generation = time.time_ns()
+    response_cache.set_many(
+        {_generation_key(namespace): generation for namespace in namespaces}, None
+    )
+
+
+def _is_recent(generation, config) -> bool:
+    # Replicas may not have the writes that started the generation yet
+    return time.time_ns() - generation < config["PRIMARY_SECONDS"] * 1_000_000_000
+
+
+@contextmanager
+def _rebuilding(generation, config):
+    """
+    Runs the rebuild of a response, from the primary database if its
+    generation is recent, so no stale replica rows get cached under it.
+    """
+    if _is_recent(generation, config):
+        with read_from_primary():
+            yield
+    else:
+        yield
+
+
+def response_cache_key(namespace, params) -> str:
+    """
+    Builds the key of a response from its namespace, the current generation
+    and the query params, sorted and without the absent ones (None), so
+    equivalent URLs share an entry.
+    Returns:
+        str: The cache key.
+    """
+    return _response_cache_key(namespace, get_generation(namespace), params)
+
+
+def _response_cache_key(namespace, generation, params) -> str:
+    normalized = urlencode(
+        sorted((name, value) for name, value in params if value is not None)
+    )
+    digest = hashlib.sha1(normalized.encode()).hexdigest()
+    return f"response:{namespace}:{generation}:{digest}"
+
+
+def _entry(response, config):
+    return (
+        response.status_code,
+        response["Content-Type"],
+        response.content,
+        time.time() + config["TIMEOUT"],
+    )
+
+
+def _store(response_cache, key, response, config):
+    response_cache.set(
+        key, _entry(response, config), config["TIMEOUT"] + config["STALE_TIMEOUT"]
+    )
+
+
+def _respond(entry, cache_status) -> HttpResponse:
+    status, content_type, content, _ = entry
+    response = HttpResponse(content, status=status, content_type=content_type)
+    response["X-Cache"] = cache_status
+    return response
+
+
+def cache_response(namespace, query_params):
+    """
+    Decorator caching the 200 responses of a GET view per namespace and
+    value of the given query params (all other params are ignored).
+
+    Only one worker rebuilds a response at a time: once an entry is past its
+    TIMEOUT the worker getting the lock rebuilds it while the others keep
+    serving the stale copy, and on a cold miss the others wait up to
+    LOCK_TIMEOUT for the first one to finish.
+    Async views get an async wrapper, which waits without blocking the
+    event loop.
+    """
+
+    RESPONSE_NAMESPACES.add(namespace)
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            return _async_cache_response(view_func, namespace, query_params)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method != "GET":
+                return view_func(request, *args, **kwargs)
+
+            config = get_response_cache_config()
+            response_cache = get_response_cache()
+            generation = get_generation(namespace)
+            key = _response_cache_key(
+                namespace,
+                generation,
+                [(name, request.GET.get(name)) for name in query_params],
+            )
+            lock_key = f"{key}:lock"
+
+            entry = response_cache.get(key)
+            if entry is not None and entry[3] > time.time():
+                return _respond(entry, "HIT")
+
+            has_lock = response_cache.add(lock_key, 1, config["LOCK_TIMEOUT"])
+            if not has_lock:
+                if entry is not None:
+                    return _respond(entry, "STALE")
+                deadline = time.monotonic() + config["LOCK_TIMEOUT"]
+                while time.monotonic() < deadline:
+                    time.sleep(WAIT_INTERVAL)
+                    entry = response_cache.get(key)
+                    if entry is not None:
+                        return _respond(entry, "HIT")
+                logger.warning("Gave up waiting for the cached response %s", key)
+
+            try:
+                with _rebuilding(generation, config):
+                    response = view_func(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    _store(response_cache, key, response, config)
+            finally:
+                if has_lock:
+                    response_cache.delete(lock_key)
+            response["X-Cache"] = "MISS"
+            return response
+
+        return _wrapped_view
+
+    return decorator
+
+
+def _async_cache_response(view_func, namespace, query_params):
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        if request.method != "GET":
+            return await view_func(request, *args, **kwargs)
+
+        config = get_response_cache_config()
+        response_cache = get_response_cache()
+        generation = await aget_generation(namespace)
+        key = _response_cache_key(
+            namespace,
+            generation,
+            [(name, request.GET.get(name)) for name in query_params],
+        )
+        lock_key = f"{key}:lock"
+
+        entry = await response_cache.aget(key)
+        if entry is not None and entry[3] > time.time():
+            return _respond(entry, "HIT")
+
+        has_lock = await response_cache.aadd(lock_key, 1, config["LOCK_TIMEOUT"])
+        if not has_lock:
+            if entry is not None:
+                return _respond(entry, "STALE")
+            deadline = time.monotonic() + config["LOCK_TIMEOUT"]
+            while time.monotonic() < deadline:
+                await asyncio.sleep(WAIT_INTERVAL)
+                entry = await response_cache.aget(key)
+                if entry is not None:
+                    return _respond(entry, "HIT")
+            logger.warning("Gave up waiting for the cached response %s", key)
+
+        try:
+            with _rebuilding(generation, config):
+                response = await view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                await response_cache.aset(
+                    key,
+                    _entry(response, config),
+                    config["TIMEOUT"] + config["STALE_TIMEOUT"],
+                )
+        finally:
+            if has_lock:
+                await response_cache.adelete(lock_key)
+        response["X-Cache"] = "MISS"
+        return response
+
+    return _wrapped_view
@@ -0,0 +1,204 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+DEFAULT_DATABASE_ROUTING = {
+    # DATABASES aliases of the read replicas, the ones not configured are ignored
+    "REPLICAS": ["replica"],
+    # Seconds a user reads from the primary after changing their cart or products
+    "STICKY_SECONDS": 5,
+    # CACHES alias remembering the users who wrote recently, it must be shared
+    # by all the workers for the stickiness to follow the user across them
+    "CACHE_ALIAS": "default",
+}
+
+# Methods that don't change anything, they never pin a user to the primary
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# DATABASES alias the reads of the current block go to, None leaves it to Django
+_read_alias = ContextVar("read_alias", default=None)
+
+# Set by read_from_primary, replica_reads views then read from the primary
+_primary_only = ContextVar("primary_only", default=False)
+
+
+def get_routing_config() -> dict:
+    return {**DEFAULT_DATABASE_ROUTING, **getattr(settings, "DATABASE_ROUTING", {})}
+
+
+def get_replicas() -> list:
+    """
+    Returns:
+        list: The aliases of the configured read replicas.
+    """
+    return [
+        alias
+        for alias in get_routing_config()["REPLICAS"]
+        if alias in connections.settings
+    ]
+
+
+@contextmanager
+def read_from_replica(alias=None):
+    """
+    Sends the reads of the block to a replica (a random one unless alias is
+    given), if there is one. Only for reads that can be slightly behind the
+    primary. The async ORM runs with a copy of the context, so it is routed
+    too.
+    """
+    if alias is None:
+        replicas = get_replicas()
+        alias = random.choice(replicas) if replicas else None
+    with _reads_from(alias):
+        yield
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Keeps the reads of the block on the primary, even in replica_reads
+    views, for results that must include the latest writes.
+    """
+    token = _primary_only.set(True)
+    try:
+        with _reads_from(None):
+            yield
+    finally:
+        _primary_only.reset(token)
+
+
+@contextmanager
+def _reads_from(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _sticky_key(user_id) -> str:
+    return f"read_primary:{user_id}"
+
+
+def _user_id(request):
+    # Token-authenticated users only, see role_required
+    entry = getattr(request, "token_entry", None)
+    return entry.user_id if entry is not None else None
+
+
+def pin_to_primary(user_id):
+    """
+    Sends the replica reads of the user to the primary for STICKY_SECONDS,
+    so they see their own writes before the replicas catch up.
+    """
+    config = get_routing_config()
+    caches[config["CACHE_ALIAS"]].set(
+        _sticky_key(user_id), True, config["STICKY_SECONDS"]
+    )
+
+
+def _replica_for(request):
+    """
+    Returns:
+        str: The replica the reads of the request go to, or None for the
+        primary (no replica, in a read_from_primary block, or the user wrote
+        recently).
+    """
+    replicas = get_replicas()
+    if not replicas or _primary_only.get():
+        return None
+    user_id = _user_id(request)
+    if user_id is not None:
+        cache = caches[get_routing_config()["CACHE_ALIAS"]]
+        if cache.get(_sticky_key(user_id)):
+            return None
+    return random.choice(replicas)
+
+
+async def _areplica_for(request):
+    """
+    Async version of _replica_for.
+    Returns:
+        str: The replica alias, or None for the primary.
+    """
+    replicas = get_replicas()
+    if not replicas or _primary_only.get():
+        return None
+    user_id = _user_id(request)
+    if user_id is not None:
+        cache = caches[get_routing_config()["CACHE_ALIAS"]]
+        if await cache.aget(_sticky_key(user_id)):
+            return None
+    return random.choice(replicas)
+
+
+def replica_reads(view_func):
+    """
+    Decorator for read-only views: all their reads go to one replica, picked
+    per request, unless the user changed their cart or products in the last
+    STICKY_SECONDS (see primary_writes). Goes under role_required, which
+    identifies the user.
+    """
+    if iscoroutinefunction(view_func):
+
+        @wraps(view_func)
+        async def _async_wrapped_view(request, *args, **kwargs):
+            with _reads_from(await _areplica_for(request)):
+                return await view_func(request, *args, **kwargs)
+
+        return _async_wrapped_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        with _reads_from(_replica_for(request)):
+            return view_func(request, *args, **kwargs)
+
+    return _wrapped_view
+
+
+def primary_writes(view_func):
+    """
+    Decorator for views changing the user's cart or products: after a
+    successful write the user's replica_reads views read from the primary
+    for STICKY_SECONDS. Goes under role_required, which identifies the user.
+    """
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        user_id = _user_id(request)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user_id is not None
+            and get_replicas()
+        ):
+            pin_to_primary(user_id)
+        return response
+
+    return _wrapped_view
+
+
+class ReplicaRouter:
+    """
+    Routes the reads of replica_reads views and read_from_replica blocks to
+    their replica and the writes to the primary (default), other reads are
+    left to Django. Replicas hold the same rows as the primary, so relations
+    between them are allowed.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
@@ -0,0 +1,327 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+from django.db.models import BooleanField, Count
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+from .pagination import paginate_by_page
+from .serializers import product_queryset
+
+
+# Text search configuration of the PostgreSQL search_vector column (migration 0006)
+SEARCH_CONFIG = "english"
+TSQUERY = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+
+# Weight of a term found in each field, for the in-memory index
+FIELD_WEIGHTS = {"name": 4, "brand": 2, "category": 2, "description": 1}
+
+# Seconds the in-memory index is trusted, bulk updates bypass the signals
+INDEX_TIMEOUT = 300
+
+# Max number of values returned per facet
+MAX_FACET_VALUES = 50
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text) -> list:
+    """
+    Splits a text into lowercase word tokens.
+    Returns:
+        list: The tokens.
+    """
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def parse_filters(params) -> dict:
+    """
+    Reads the search filters from the query params.
+    Returns:
+        dict: category (code), min_price, max_price, in_stock and seller.
+    Raises:
+        ValueError: If a filter has an invalid value.
+    """
+    filters = {
+        "category": params.get("category") or None,
+        "min_price": None,
+        "max_price": None,
+        "in_stock": params.get("in_stock", "").lower() in ("1", "true"),
+        "seller": None,
+    }
+    for name in ("min_price", "max_price"):
+        if params.get(name):
+            try:
+                filters[name] = Decimal(params[name])
+            except InvalidOperation as e:
+                raise ValueError(f"{name} must be a valid number") from e
+            # NaN and infinities can't be compared to prices
+            if not filters[name].is_finite():
+                raise ValueError(f"{name} must be a valid number")
+    if params.get("seller"):
+        try:
+            filters["seller"] = int(params["seller"])
+        except ValueError as e:
+            raise ValueError("seller must be a valid ID") from e
+    return filters
+
+
+def filter_queryset(queryset, filters):
+    """
+    Applies the search filters to a products queryset.
+    Returns:
+        QuerySet: The filtered queryset.
+    """
+    if filters["category"]:
+        queryset = queryset.filter(category__code=filters["category"])
+    if filters["min_price"] is not None:
+        queryset = queryset.filter(price__gte=filters["min_price"])
+    if filters["max_price"] is not None:
+        queryset = queryset.filter(price__lte=filters["max_price"])
+    if filters["in_stock"]:
+        queryset = queryset.filter(stock__gt=0)
+    if filters["seller"] is not None:
+        queryset = queryset.filter(seller_id=filters["seller"])
+    return queryset
+
+
+def queryset_facets(queryset) -> dict:
+    """
+    Counts the matching products per category and per brand.
+    Returns:
+        dict: {"categories": [...], "brands": [...]}, largest counts first.
+    """
+    categories = (
+        queryset.values("category__code", "category__name")
+        .annotate(count=Count("id"))
+        .order_by("-count", "category__code")[:MAX_FACET_VALUES]
+    )
+    brands = (
+        queryset.values("brand")
+        .annotate(count=Count("id"))
+        .order_by("-count", "brand")[:MAX_FACET_VALUES]
+    )
+    return {
+        "categories": [
+            {
+                "code": c["category__code"],
+                "name": c["category__name"],
+                "count": c["count"],
+            }
+            for c in categories
+        ],
+        "brands": [{"brand": b["brand"], "count": b["count"]} for b in brands],
+    }
+
+
+class InvertedIndex:
+    """
+    Pure-Python full-text index used when the database is not PostgreSQL.
+    Maps every token to the products containing it, with the weight of the
+    fields it was found in, and keeps the filterable columns of each product
+    so filtering, faceting and ranking need no query.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        # pylint: disable=no-member
+        rows = Product.objects.values_list(
+            "id",
+            "name",
+            "brand",
+            "description",
+            "price",
+            "stock",
+            "seller_id",
+            "category__code",
+            "category__name",
+        ).iterator(chunk_size=2000)
+        for row in rows:
+            index.add(*row)
+        return index
+
+    def add(
+        self,
+        product_id,
+        name,
+        brand,
+        description,
+        price,
+        stock,
+        seller_id,
+        category_code,
+        category_name,
+    ):
+        self.documents[product_id] = {
+            "brand": brand,
+            "price": price,
+            "stock": stock,
+            "seller": seller_id,
+            "category": category_code,
+            "category_name": category_name,
+        }
+        fields = {
+            "name": name,
+            "brand": brand,
+            "category": category_name,
+            "description": description,
+        }
+        for field, text in fields.items():
+            for token in set(tokenize(text)):
+                postings = self.postings[token]
+                postings[product_id] = (
+                    postings.get(product_id, 0) + FIELD_WEIGHTS[field]
+                )
+
+    def search(self, query) -> dict:
+        """
+        Finds the products containing every token of the query.
+        Returns:
+            dict: Product id -> score.
+        """
+        tokens = set(tokenize(query))
+        if not tokens:
+            return {}
+        # Intersect from the rarest token, the candidate set only shrinks
+        postings = sorted((self.postings.get(token, {}) for token in tokens), key=len)
+        scores = dict(postings[0])
+        for other in postings[1:]:
+            scores = {
+                product_id: score + other[product_id]
+                for product_id, score in scores.items()
+                if product_id in other
+            }
+        return scores
+
+    def matches_filters(self, product_id, filters) -> bool:
+        document = self.documents[product_id]
+        return (
+            (not filters["category"] or document["category"] == filters["category"])
+            and (
+                filters["min_price"] is None
+                or document["price"] >= filters["min_price"]
+            )
+            and (
+                filters["max_price"] is None
+                or document["price"] <= filters["max_price"]
+            )
+            and (not filters["in_stock"] or document["stock"] > 0)
+            and (filters["seller"] is None or document["seller"] == filters["seller"])
+        )
+
+    def facets(self, product_ids) -> dict:
+        categories = defaultdict(int)
+        brands = defaultdict(int)
+        for product_id in product_ids:
+            document = self.documents[product_id]
+            categories[(document["category"], document["category_name"])] += 1
+            brands[document["brand"]] += 1
+        return {
+            "categories": [
+                {"code": code, "name": name, "count": count}
+                for (code, name), count in sorted(
+                    categories.items(), key=lambda item: (-item[1], item[0][0])
+                )[:MAX_FACET_VALUES]
+            ],
+            "brands": [
+                {"brand": brand, "count": count}
+                for brand, count in sorted(
+                    brands.items(), key=lambda item: (-item[1], item[0])
+                )[:MAX_FACET_VALUES]
+            ],
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> InvertedIndex:
+    """
+    Returns the in-memory index, (re)building it when it was invalidated or
+    is older than INDEX_TIMEOUT.
+    Returns:
+        InvertedIndex: The index.
+    """
+    global _index  # pylint: disable=global-statement
+    with _index_lock:
+        if _index is None or time.monotonic() - _index.built_at > INDEX_TIMEOUT:
+            _index = InvertedIndex.build()
+        return _index
+
+
+def invalidate_index():
+    """
+    Drops the in-memory index, it is rebuilt by the next search.
+    """
+    global _index  # pylint: disable=global-statement
+    with _index_lock:
+        _index = None
+
+
+def uses_postgres_search() -> bool:
+    return connection.vendor == "postgresql"
+
+
+def search_products(request, query, filters):
+    """
+    Searches the catalog and returns one page of results, ranked by relevance
+    (or ordered by pk without a query), with per-category and per-brand
+    facet counts of all the matches.
+    Returns:
+        tuple: The products of the page, the "pagination_info" dict and the facets.
+    """
+    # pylint: disable=no-member
+    if not query:
+        queryset = filter_queryset(Product.objects.all(), filters)
+        products, pagination_info = paginate_by_page(
+            request, product_queryset(queryset).order_by("pk")
+        )
+        return products, pagination_info, queryset_facets(queryset)
+
+    if uses_postgres_search():
+        # search_vector isn't a model field, PostgreSQL maintains it
+        matches = RawSQL(
+            f"(cmscommerce_product.search_vector @@ {TSQUERY} OR "
+            "cmscommerce_product.category_id IN "
+            "(SELECT id FROM cmscommerce_category "
+            f"WHERE to_tsvector('{SEARCH_CONFIG}', name) @@ {TSQUERY}))",
+            (query, query),
+            output_field=BooleanField(),
+        )
+        queryset = filter_queryset(Product.objects.all(), filters).filter(matches)
+        ranked = product_queryset(queryset).annotate(
+            rank=RawSQL(
+                f"ts_rank(cmscommerce_product.search_vector, {TSQUERY})", (query,)
+            )
+        )
+        products, pagination_info = paginate_by_page(
+            request, ranked.order_by("-rank", "pk")
+        )
+        return products, pagination_info, queryset_facets(queryset)
+
+    index = get_index()
+    scores = index.search(query)
+    matches = sorted(
+        (
+            product_id
+            for product_id in scores
+            if index.matches_filters(product_id, filters)
+        ),
+        key=lambda product_id: (-scores[product_id], product_id),
+    )
+    page_ids, pagination_info = paginate_by_page(request, matches)
+    # Products deleted since the index was built are skipped
+    products_by_id = product_queryset().in_bulk(page_ids)
+    products = [products_by_id[pk] for pk in page_ids if pk in products_by_id]
+    return products, pagination_info, index.facets(matches)
@@ -0,0 +1,277 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Sum
+
+from .metrics import timed_serializer
+from .models import Product, CartItem
+
+
+# Columns read by serialize_product, everything else is deferred
+PRODUCT_ONLY_FIELDS = (
+    "id",
+    "name",
+    "brand",
+    "description",
+    "base_price",
+    "price",
+    "stock",
+    "image",
+    "image_thumbnail",
+    "image_medium",
+    "version",
+    "category__id",
+    "category__name",
+    "category__code",
+    "seller__id",
+    "seller__user__id",
+    "seller__user__username",
+)
+
+
+def product_queryset(queryset=None):
+    """
+    Plans the query for a list of products that will go through
+    serialize_product: category, seller and seller's user are joined in the
+    same SELECT and only the emitted columns are read.
+    Returns:
+        QuerySet: The planned products queryset.
+    """
+    if queryset is None:
+        # pylint: disable=no-member
+        queryset = Product.objects.all()
+    return queryset.select_related("category", "seller__user").only(
+        *PRODUCT_ONLY_FIELDS
+    )
+
+
+def format_price(value) -> str:
+    """
+    Formats a price with two decimals, whether it was loaded from the database
+    (Decimal) or just assigned from the request (float or str).
+    Returns:
+        str: The price, e.g. "10.50".
+    """
+    return format(Decimal(str(value)), ".2f")
+
+
+def image_urls(product) -> dict:
+    """
+    URLs of every size of the product image. Sizes that are still being
+    generated fall back to the original image.
+    Returns:
+        dict: {"original", "thumbnail", "medium"} URLs, None without image.
+    """
+    if not product.image:
+        return {"original": None, "thumbnail": None, "medium": None}
+    original = product.image.url
+    return {
+        "original": original,
+        "thumbnail": (
+            product.image_thumbnail.url if product.image_thumbnail else original
+        ),
+        "medium": product.image_medium.url if product.image_medium else original,
+    }
+
+
+@timed_serializer
+def serialize_product(product) -> dict:
+    """
+    Serializes a product with its category and seller for the JSON responses.
+    The product should come from product_queryset (or have its category and
+    seller's user already loaded) to avoid extra queries.
+    Returns:
+        dict: The product data.
+    """
+    return {
+        "id": product.pk,
+        "name": product.name,
+        "brand": product.brand,
+        "description": product.description,
+        "base_price": format_price(product.base_price),
+        "price": format_price(product.price),
+        "stock": product.stock,
+        "image": product.image.url if product.image else None,
+        "images": image_urls(product),
+        # Send it back in If-Match (as "<id>-<version>") to PATCH the product
+        "version": product.version,
+        "category": {
+            "id": product.category.id,
+            "name": product.category.name,
+            "code": product.category.code,
+        },
+        "seller": {
+            "id": product.seller.id,
+            "username": product.seller.user.username,
+        },
+    }
+
+
+@timed_serializer
+def serialize_products(products) -> list:
+    """
+    Serializes an iterable of products with serialize_product.
+    Returns:
+        list: The list of product data.
+    """
+    return [serialize_product(product) for product in products]
+
+
+def listing_image_urls(listing) -> dict:
+    """
+    URLs of every size of a listing's image, built from the stored names
+    like image_urls so signed storage URLs never go stale in the table.
+    Returns:
+        dict: {"original", "thumbnail", "medium"} URLs, None without image.
+    """
+    if not listing.image:
+        return {"original": None, "thumbnail": None, "medium": None}
+    # pylint: disable=no-member
+    storage = Product._meta.get_field("image").storage
+    return {
+        "original": storage.url(listing.image),
+        "thumbnail": storage.url(listing.image_thumbnail),
+        "medium": storage.url(listing.image_medium),
+    }
+
+
+@timed_serializer
+def serialize_listing(listing) -> dict:
+    """
+    Serializes a ProductListing into the same data as serialize_product,
+    without any join.
+    Returns:
+        dict: The product data.
+    """
+    images = listing_image_urls(listing)
+    return {
+        "id": listing.pk,
+        "name": listing.name,
+        "brand": listing.brand,
+        "description": listing.description,
+        "base_price": format_price(listing.base_price),
+        "price": format_price(listing.price),
+        "stock": listing.stock,
+        "image": images["original"],
+        "images": images,
+        "version": listing.version,
+        "category": {
+            "id": listing.category_id,
+            "name": listing.category_name,
+            "code": listing.category_code,
+        },
+        "seller": {
+            "id": listing.seller_id,
+            "username": listing.seller_username,
+        },
+    }
+
+
+@timed_serializer
+def serialize_listings(listings) -> list:
+    """
+    Serializes an iterable of listings with serialize_listing.
+    Returns:
+        list: The list of product data.
+    """
+    return [serialize_listing(listing) for listing in listings]
+
+
+def cart_lines(cart_id):
+    """
+    Aggregates the items of a cart into one row per product in a single query.
+    Quantities of duplicated rows are summed and every line total
+    (quantity * price) is computed by the database with decimal precision.
+    Returns:
+        QuerySet: Dicts with the product, category and seller columns plus
+        "total_quantity" and "line_total".
+    """
+    # pylint: disable=no-member
+    return (
+        CartItem.objects.filter(cart_id=cart_id)
+        .values(
+            "product_id",
+            "product__name",
+            "product__brand",
+            "product__description",
+            "product__base_price",
+            "product__price",
+            "product__stock",
+            "product__image",
+            "product__image_thumbnail",
+            "product__category__name",
+            "product__seller__user__username",
+        )
+        .annotate(
+            total_quantity=Sum("quantity"),
+            line_total=Sum(
+                F("quantity") * F("product__price"),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+        .order_by("product_id")
+    )
+
+
+@timed_serializer
+def serialize_cart(lines) -> dict:
+    """
+    Serializes the rows returned by cart_lines for the get_cart response.
+    Returns:
+        dict: The cart items and the cart totals.
+    """
+    image_storage = Product._meta.get_field("image").storage
+    cart_items_data = []
+    cart_total_quantity = 0
+    cart_total_price = Decimal("0")
+
+    for line in lines:
+        image = line["product__image"]
+        thumbnail = line["product__image_thumbnail"] or image
+        cart_items_data.append(
+            {
+                "id": line["product_id"],
+                "name": line["product__name"],
+                "brand": line["product__brand"],
+                "description": line["product__description"],
+                "base_price": round(float(line["product__base_price"]), 2),
+                "price": round(float(line["product__price"]), 2),
+                "stock": line["product__stock"],
+                "category": line["product__category__name"],
+                "seller": line["product__seller__user__username"],
+                "quantity": line["total_quantity"],
+                "image_url": image_storage.url(image) if image else None,
+                "thumbnail_url": image_storage.url(thumbnail) if thumbnail else None,
+            }
+        )
+        cart_total_quantity += line["total_quantity"]
+        cart_total_price += Decimal(line["line_total"]).quantize(Decimal("0.01"))
+
+    return {
+        "cartItems": cart_items_data,
+        "cartTotalQuantity": cart_total_quantity,
+        "cartTotalPrice": round(float(cart_total_price), 2),
+    }
+
+
+@timed_serializer
+def serialize_order(order, items) -> dict:
+    """
+    Serializes an order and its (OrderItem) items for the JSON responses.
+    Returns:
+        dict: The order data.
+    """
+    return {
+        "id": order.pk,
+        "order_date": order.order_date,
+        "status": order.status,
+        "total_price": str(order.total_price),
+        "shipping_information": order.shipping_information,
+        "items": [
+            {
+                "product_id": item.product_id,
+                "quantity": item.quantity,
+                "price": str(item.price),
+            }
+            for item in items
+        ],
+    }
@@ -0,0 +1,192 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.expressions import BaseExpression
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .models import User, Customer, Seller, Category, Product, ProductListing
+from .categories import invalidate_categories
+from .counters import category_key, create_counters, delete_counters, seller_key
+from .listings import forget_listings, listing_for, refresh_listings, save_listings
+from .metrics import install_query_recorder
+from .response_cache import invalidate_responses
+from .search import invalidate_index
+from .token_cache import invalidate_token, invalidate_user
+
+
+# User fields copied into the token cache entries
+TOKEN_CACHE_USER_FIELDS = {"username", "role", "is_active"}
+
+
+# Product fields copied into its listing
+LISTING_PRODUCT_FIELDS = {
+    "name",
+    "brand",
+    "description",
+    "base_price",
+    "price",
+    "stock",
+    "version",
+    "image",
+    "image_thumbnail",
+    "image_medium",
+    "category",
+    "seller",
+}
+
+
+# Per-request query counts of the MetricsMiddleware
+connection_created.connect(install_query_recorder)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """
+    Drops the cached tokens of a user whose role (or any cached field) may
+    have changed. Saves limited to other fields, like login()'s last_login, are ignored.
+    """
+    if kwargs.get("created"):
+        return
+    if update_fields is not None and not TOKEN_CACHE_USER_FIELDS & set(update_fields):
+        return
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Seller)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Seller)
+def invalidate_profile_tokens(sender, instance, **kwargs):
+    """
+    Drops the cached tokens of a user whose Customer / Seller row changed.
+    """
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """
+    Drops a deleted token from the cache.
+    """
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_search_index(sender, **kwargs):
+    """
+    Drops the in-memory search index once a catalog change is committed, so
+    no request can rebuild it from the rows of before the change.
+    """
+    transaction.on_commit(invalidate_index)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories_cache(sender, **kwargs):
+    """
+    Bumps the categories version once the change is committed, so no request
+    can cache the old rows under the new version.
+    """
+    transaction.on_commit(invalidate_categories)
+    # Product responses embed the category name and code
+    transaction.on_commit(lambda: invalidate_responses("all_products"))
+
+
+@receiver(post_save, sender=Product)
+def sync_product_listing(
+    sender, instance, created=False, raw=False, update_fields=None, **kwargs
+):
+    """
+    Rewrites the listing of a saved product and its counters in the same
+    transaction, from the instance when it has every listed field loaded.
+    Fixtures (raw) need a rebuild_listings and a reconcile_counters.
+    """
+    if raw:
+        return
+    if update_fields is not None and not LISTING_PRODUCT_FIELDS & set(update_fields):
+        return
+    # The save itself may run in autocommit, the listing and counters must
+    # not be written without each other
+    with transaction.atomic(savepoint=False):
+        if _has_listing_fields(instance):
+            save_listings([listing_for(instance)], created=created)
+        else:
+            refresh_listings([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def uncount_deleted_product(sender, instance, **kwargs):
+    """
+    Removes a product from the counters, in the transaction of the delete.
+    Its listing is deleted by the cascade.
+    """
+    forget_listings([instance.pk])
+
+
+def _has_listing_fields(product) -> bool:
+    # Deferred fields and F() expressions must be read back from the database
+    deferred = product.get_deferred_fields()
+    for name in LISTING_PRODUCT_FIELDS:
+        attname = Product._meta.get_field(name).attname
+        if attname in deferred or isinstance(getattr(product, attname), BaseExpression):
+            return False
+    return True
+
+
+@receiver(post_save, sender=Category)
+def sync_category_listings(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Copies a renamed category into the listings of its products.
+    """
+    if created or raw:
+        return
+    # pylint: disable=no-member
+    ProductListing.objects.filter(category_id=instance.pk).exclude(
+        category_name=instance.name, category_code=instance.code
+    ).update(category_name=instance.name, category_code=instance.code)
+
+
+@receiver(post_save, sender=User)
+def sync_seller_listings(
+    sender, instance, created=False, raw=False, update_fields=None, **kwargs
+):
+    """
+    Copies a seller's new username into the listings of their products.
+    """
+    if created or raw or instance.role != "Seller":
+        return
+    if update_fields is not None and "username" not in update_fields:
+        return
+    # pylint: disable=no-member
+    ProductListing.objects.filter(
+        seller_id__in=Seller.objects.filter(user=instance).values("pk")
+    ).exclude(seller_username=instance.username).update(
+        seller_username=instance.username
+    )
+
+
+@receiver(post_save, sender=Seller)
+@receiver(post_save, sender=Category)
+def create_product_counters(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Creates the empty product counter of a new seller or category, so
+    product writes only have to update it.
+    """
+    if created and not raw:
+        key_for = seller_key if sender is Seller else category_key
+        create_counters(key_for(instance.pk))
+
+
+@receiver(post_delete, sender=Seller)
+@receiver(post_delete, sender=Category)
+def delete_product_counters(sender, instance, **kwargs):
+    """
+    Drops the product counter of a deleted seller or category, its products
+    were already uncounted by the cascade.
+    """
+    key_for = seller_key if sender is Seller else category_key
+    delete_counters(key_for(instance.pk))
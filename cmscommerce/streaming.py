@@ -0,0 +1,62 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+# Rows fetched from the database per round trip
+ITERATOR_CHUNK_SIZE = 2000
+
+# Encoded items joined into one chunk of the response body
+ITEMS_PER_CHUNK = 200
+
+
+def stream_json_object(list_key, items, serialize=None, extra=None, encoder=None):
+    """
+    Encodes {**extra, list_key: [serialize(item), ...]} piece by piece.
+    Only one chunk of ITEMS_PER_CHUNK encoded items is held in memory at a
+    time, whatever the number of items.
+    Yields:
+        bytes: The next part of the JSON document.
+    """
+    encoder = encoder or DjangoJSONEncoder(separators=(",", ":"))
+    head = encoder.encode(extra or {})[:-1]
+    yield f'{head}{"," if extra else ""}{json.dumps(list_key)}:['.encode()
+
+    chunk = []
+    first = True
+    for item in items:
+        chunk.append(encoder.encode(serialize(item) if serialize else item))
+        if len(chunk) == ITEMS_PER_CHUNK:
+            yield (("" if first else ",") + ",".join(chunk)).encode()
+            first = False
+            chunk = []
+    if chunk:
+        yield (("" if first else ",") + ",".join(chunk)).encode()
+    yield b"]}"
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    Streams a JSON object whose list_key holds every item of a queryset.
+    The queryset is read with .iterator(), model instances are serialized
+    and encoded as they arrive and none of them is kept, so the peak memory
+    of the worker doesn't grow with the result.
+    """
+
+    def __init__(
+        self,
+        list_key,
+        queryset,
+        serialize=None,
+        extra=None,
+        chunk_size=ITERATOR_CHUNK_SIZE,
+        **kwargs,
+    ):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(
+            stream_json_object(
+                list_key, queryset.iterator(chunk_size=chunk_size), serialize, extra
+            ),
+            **kwargs,
+        )
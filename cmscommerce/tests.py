@@ -1,3 +1,1844 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from .models import (
+    User,
+    Seller,
+    Customer,
+    Category,
+    Product,
+    ProductListing,
+    ProductCounter,
+    Cart,
+    CartItem,
+    Order,
+)
+from .token_cache import DjangoTokenCache, get_token_cache, entry_for_user
+from .categories import invalidate_categories
+from .response_cache import (
+    get_response_cache,
+    invalidate_responses,
+    response_cache_key,
+)
+from .routers import read_from_replica
+from .products import apply_stock_price_updates
+from .search import get_index, invalidate_index
+from .serializers import product_queryset, serialize_listing, serialize_product
+from .cart import MAX_ITEM_QUANTITY, CartQuantityError, add_item
+from .counters import (
+    ALL_PRODUCTS,
+    category_key,
+    get_counts,
+    reconcile_counters,
+    seller_key,
+)
+from .listings import rebuild_listings, refresh_listings
+from .urls import build_urlpatterns
+from .benchmarks import (
+    ENDPOINTS,
+    clear_caches,
+    compare_results,
+    run_benchmark,
+    seed_data,
+)
+
+
+def warm_token_cache(token):
+    """
+    Caches the token like a first authenticated request would.
+    """
+    get_token_cache().set(token.key, entry_for_user(token.user))
+
+
+class ProductSerializationQueriesTest(TestCase):
+    """
+    The product endpoints must cost a constant number of queries, no matter
+    how many products are serialized. Tokens are already cached.
+    """
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        # pylint: disable=no-member
+        self.category = Category.objects.create(name="Technology", code="tech")
+        Category.objects.create(name="No Category", code="no-category")
+        self.user = User.objects.create_user("seller", "", "secret123")
+        self.user.role = "Seller"
+        self.user.save()
+        self.seller = Seller.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+        warm_token_cache(self.token)
+
+    def create_products(self, amount):
+        # pylint: disable=no-member
+        products = Product.objects.bulk_create(
+            Product(
+                name=f"Product {i}",
+                brand="Brand",
+                description="Description",
+                base_price="10.00",
+                price="9.50",
+                stock=5,
+                category=self.category,
+                seller=self.seller,
+            )
+            for i in range(amount)
+        )
+        refresh_listings(product.pk for product in products)
+
+    def test_all_products_queries(self):
+        self.create_products(30)
+        # The catalog counters and the page itself
+        with self.assertNumQueries(2):
+            response = self.client.get("/all_products", {"page": 1, "per_page": 25})
+        self.assertEqual(len(response.json()["products"]), 25)
+        self.assertEqual(response.json()["products"][0]["seller"]["username"], "seller")
+
+    def test_per_page_is_clamped(self):
+        self.create_products(3)
+        for params in ({"per_page": 1000}, {"per_page": 1000, "cursor": ""}):
+            response = self.client.get("/all_products", params)
+            self.assertEqual(
+                response.json()["pagination_info"]["products_per_page"], 100
+            )
+
+    def test_current_page_is_the_served_page(self):
+        self.create_products(3)
+        for page, current_page in (("2", 2), ("abc", 1), ("999", 1)):
+            response = self.client.get("/all_products", {"page": page, "per_page": 1})
+            self.assertEqual(
+                response.json()["pagination_info"]["current_page"], current_page
+            )
+
+    def test_all_products_cursor_queries(self):
+        self.create_products(30)
+        # The catalog counters and the page itself
+        self.client.get("/all_products", {"per_page": 25})
+        with self.assertNumQueries(2):
+            response = self.client.get("/all_products", {"cursor": "", "per_page": 25})
+        self.assertEqual(len(response.json()["products"]), 25)
+
+    def test_seller_dashboard_queries(self):
+        self.create_products(30)
+        # User, seller, the seller's counters and the page itself
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                f"/seller_dashboard/{self.user.pk}", {"per_page": 25}, **self.auth
+            )
+        self.assertEqual(len(response.json()["products"]), 25)
+        self.assertEqual(response.json()["products"][0]["category"]["code"], "tech")
+
+    def test_create_product_queries(self):
+        # User, seller, category, the insert, the listing upsert and the
+        # counters update, in a transaction (a savepoint and its release here)
+        with self.assertNumQueries(8):
+            response = self.client.post(
+                "/create_product",
+                {
+                    "name": "Laptop",
+                    "brand": "Brand",
+                    "description": "Description",
+                    "base_price": "10",
+                    "price": "9.5",
+                    "stock": "3",
+                    "category_code": "tech",
+                    "seller_id": self.user.pk,
+                },
+                **self.auth,
+            )
+        product = response.json()["product"]
+        self.assertEqual(product["price"], "9.50")
+        self.assertEqual(product["seller"]["username"], "seller")
+
+    def test_product_is_not_saved_without_its_listing(self):
+        fields = {
+            "name": "Laptop",
+            "brand": "Brand",
+            "description": "Description",
+            "base_price": "10",
+            "price": "9.5",
+            "stock": "3",
+            "category_code": "tech",
+            "seller_id": self.user.pk,
+        }
+        with mock.patch(
+            "cmscommerce.signals.save_listings", side_effect=DatabaseError("down")
+        ):
+            with self.assertRaises(DatabaseError):
+                self.client.post("/create_product", fields, **self.auth)
+        # pylint: disable=no-member
+        self.assertFalse(Product.objects.exists())
+
+        self.create_products(1)
+        product = Product.objects.get()
+        with mock.patch(
+            "cmscommerce.signals.save_listings", side_effect=DatabaseError("down")
+        ):
+            with self.assertRaises(DatabaseError):
+                self.client.post(
+                    f"/update_product/{product.pk}",
+                    {**fields, "price": "1"},
+                    **self.auth,
+                )
+        self.assertEqual(Product.objects.get().price, product.price)
+
+    def test_update_product_queries(self):
+        self.create_products(1)
+        # pylint: disable=no-member
+        product = Product.objects.get()
+        # Product, user, seller, category, the update, the previous listing,
+        # the listing upsert and the counters of the old and new categories,
+        # in a transaction (a savepoint and its release here)
+        with self.assertNumQueries(11):
+            response = self.client.post(
+                f"/update_product/{product.pk}",
+                {
+                    "name": "Laptop",
+                    "brand": "Brand",
+                    "description": "Description",
+                    "base_price": "10",
+                    "price": "8",
+                    "stock": "3",
+                    "seller_id": self.user.pk,
+                },
+                **self.auth,
+            )
+        self.assertEqual(response.json()["product"]["category"]["code"], "no-category")
+
+
+class GetCartTest(TestCase):
+    """
+    get_cart aggregates the cart in the database with a constant number of queries.
+    """
+
+    def setUp(self):
+        # pylint: disable=no-member
+        category = Category.objects.create(name="Technology", code="tech")
+        seller_user = User.objects.create_user("seller", "", "secret123")
+        seller = Seller.objects.create(user=seller_user)
+        self.user = User.objects.create_user("customer", "", "secret123")
+        self.user.role = "Customer"
+        self.user.save()
+        customer = Customer.objects.create(user=self.user)
+        self.cart = Cart.objects.create(customer=customer, total_quantity=0)
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+        warm_token_cache(self.token)
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}",
+                brand="Brand",
+                description="Description",
+                base_price="20.00",
+                price=price,
+                stock=5,
+                category=category,
+                seller=seller,
+            )
+            for i, price in enumerate(["0.10", "19.99", "5.25"])
+        ]
+
+    def test_get_cart_totals_and_queries(self):
+        # pylint: disable=no-member
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart=self.cart, product=self.products[0], quantity=3),
+                CartItem(cart=self.cart, product=self.products[1], quantity=3),
+                CartItem(cart=self.cart, product=self.products[2], quantity=4),
+            ]
+        )
+        # Cart and the aggregated items
+        with self.assertNumQueries(2):
+            response = self.client.get("/get_cart", **self.auth)
+
+        data = response.json()
+        self.assertEqual(
+            [(item["id"], item["quantity"]) for item in data["cartItems"]],
+            [
+                (self.products[0].pk, 3),
+                (self.products[1].pk, 3),
+                (self.products[2].pk, 4),
+            ],
+        )
+        self.assertEqual(data["cartTotalQuantity"], 10)
+        self.assertEqual(data["cartTotalPrice"], 81.27)
+        self.assertEqual(data["cartItems"][0]["seller"], "seller")
+
+
+class TokenCacheTest(TestCase):
+    """
+    role_required resolves cached tokens without the database and drops them
+    when they stop being valid.
+    """
+
+    def setUp(self):
+        self.token_cache = get_token_cache()
+        # pylint: disable=no-member
+        self.user = User.objects.create_user("seller", "", "secret123")
+        self.user.role = "Seller"
+        self.user.save()
+        self.seller = Seller.objects.create(user=self.user)
+        Category.objects.create(name="Technology", code="tech")
+        invalidate_categories()
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+
+    def test_miss_then_hit(self):
+        misses, hits = self.token_cache.misses, self.token_cache.hits
+        # Token, seller id and categories
+        with self.assertNumQueries(3):
+            self.client.get("/categories", **self.auth)
+        # Both the token and the categories are cached
+        with self.assertNumQueries(0):
+            response = self.client.get("/categories", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.token_cache.misses, misses + 1)
+        self.assertEqual(self.token_cache.hits, hits + 1)
+        entry = self.token_cache.get(self.token.key)
+        self.assertEqual((entry.role, entry.seller_id), ("Seller", self.seller.pk))
+
+    def test_role_change_invalidates(self):
+        self.client.get("/categories", **self.auth)
+        self.user.role = "Customer"
+        self.user.save()
+        self.assertIsNone(self.token_cache.get(self.token.key))
+        response = self.client.get("/categories", **self.auth)
+        self.assertEqual(response.status_code, 403)
+
+    def test_token_deletion_invalidates(self):
+        self.client.get("/categories", **self.auth)
+        self.token.delete()
+        self.assertIsNone(self.token_cache.get(self.token.key))
+        response = self.client.get("/categories", **self.auth)
+        self.assertEqual(response.status_code, 403)
+
+    def test_logout_invalidates(self):
+        self.client.get("/categories", **self.auth)
+        self.client.get("/logout_view", **self.auth)
+        self.assertIsNone(self.token_cache.get(self.token.key))
+
+    def test_shared_cache_clear_only_drops_tokens(self):
+        token_cache = DjangoTokenCache("default", 60)
+        token_cache.set(self.token.key, entry_for_user(self.user))
+        cache.set("other", 1)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        token_cache.clear()
+        self.assertIsNone(token_cache.get(self.token.key))
+        # Another worker's instance sees the new version too
+        self.assertIsNone(DjangoTokenCache("default", 60).get(self.token.key))
+        self.assertEqual(cache.get("other"), 1)
+        self.assertEqual(token_cache.stats(), {"hits": 1, "misses": 1})
+
+
+class CategoriesCacheTest(TestCase):
+    """
+    Categories are served from a versioned cache with conditional request
+    support, and rebuilt once a category change is committed.
+    """
+
+    def setUp(self):
+        # pylint: disable=no-member
+        Category.objects.create(name="Technology", code="tech")
+        invalidate_categories()
+
+    def test_public_endpoint_is_cached(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/public/categories")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["categories"][0]["code"], "tech")
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(0):
+            self.client.get("/public/categories")
+
+    def test_if_none_match(self):
+        etag = self.client.get("/public/categories")["ETag"]
+        response = self.client.get("/public/categories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_change_invalidates(self):
+        etag = self.client.get("/public/categories")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Books", code="books")
+        response = self.client.get("/public/categories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.json()["categories"]), 2)
+
+    @override_settings(CATEGORIES_CACHE_TIMEOUT=0)
+    def test_unsignaled_change_expires(self):
+        # The version expires at once, as it would after the timeout
+        invalidate_categories()
+        self.client.get("/public/categories")
+        # pylint: disable=no-member
+        Category.objects.filter(code="tech").update(name="Tech")
+        response = self.client.get("/public/categories")
+        self.assertEqual(response.json()["categories"][0]["name"], "Tech")
+
+    def test_private_endpoint_requires_seller(self):
+        response = self.client.get("/categories")
+        self.assertEqual(response.status_code, 403)
+
+
+def create_customer_cart(username="customer"):
+    """
+    Creates a customer user with its cart and a product to put in it.
+    Returns:
+        tuple: The customer user, the cart and the product.
+    """
+    # pylint: disable=no-member
+    category = Category.objects.create(name="Technology", code="tech")
+    seller = Seller.objects.create(user=User.objects.create_user("seller", "", "x"))
+    user = User.objects.create_user(username, "", "secret123")
+    user.role = "Customer"
+    user.save()
+    cart = Cart.objects.create(
+        customer=Customer.objects.create(user=user), total_quantity=0
+    )
+    product = Product.objects.create(
+        name="Product",
+        brand="Brand",
+        description="Description",
+        base_price="10.00",
+        price="9.50",
+        stock=100,
+        category=category,
+        seller=seller,
+    )
+    return user, cart, product
+
+
+class CartMutationsTest(TestCase):
+    """
+    Cart mutations update quantities in place and keep Cart.total_quantity in sync.
+    """
+
+    def setUp(self):
+        self.user, self.cart, self.product = create_customer_cart()
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+        warm_token_cache(self.token)
+
+    def assertCart(self, quantity):
+        self.cart.refresh_from_db()
+        # pylint: disable=no-member
+        items = list(
+            CartItem.objects.filter(cart=self.cart).values_list("quantity", flat=True)
+        )
+        self.assertEqual(items, [quantity] if quantity else [])
+        self.assertEqual(self.cart.total_quantity, quantity)
+
+    def test_add_update_remove(self):
+        url = f"/add_to_cart/{self.product.pk}"
+        self.client.post(url, {"quantity": 2}, **self.auth)
+        self.client.post(url, {"quantity": 3}, **self.auth)
+        self.assertCart(5)
+
+        response = self.client.put(
+            f"/update_quantity/{self.product.pk}",
+            '{"quantity": -1}',
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertCart(4)
+
+        response = self.client.put(
+            f"/update_quantity/{self.product.pk}",
+            '{"quantity": -10}',
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertCart(4)
+
+        response = self.client.delete(
+            f"/remove_from_cart/{self.product.pk}", **self.auth
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertCart(0)
+
+        response = self.client.delete(
+            f"/remove_from_cart/{self.product.pk}", **self.auth
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_cart(self):
+        # pylint: disable=no-member
+        other = Product.objects.create(
+            name="Other",
+            brand="Brand",
+            description="Description",
+            base_price="3.00",
+            price="2.00",
+            stock=10,
+            category=self.product.category,
+            seller=self.product.seller,
+        )
+        add_item(self.cart.pk, self.product.pk, 2)
+        operations = [
+            {"op": "add", "product_id": other.pk, "quantity": 4},
+            {"op": "update", "product_id": self.product.pk, "quantity": 3},
+            {"op": "update", "product_id": other.pk, "quantity": -1},
+        ]
+        # Products, cart, savepoint, cart lock, items, insert, update, total,
+        # release and lines
+        with self.assertNumQueries(10):
+            response = self.client.post(
+                "/batch_cart",
+                {"operations": operations},
+                content_type="application/json",
+                **self.auth,
+            )
+        data = response.json()
+        self.assertEqual(
+            [(item["id"], item["quantity"]) for item in data["cartItems"]],
+            [(self.product.pk, 5), (other.pk, 3)],
+        )
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_quantity, 8)
+
+        # An invalid operation rolls the whole batch back
+        response = self.client.post(
+            "/batch_cart",
+            {
+                "operations": [
+                    {"op": "remove", "product_id": other.pk},
+                    {"op": "remove", "product_id": other.pk},
+                ]
+            },
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["index"], 1)
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+
+    def test_batch_cart_rejects_bad_quantities(self):
+        for operations in (
+            [{"op": "add", "product_id": self.product.pk, "quantity": True}],
+            [{"op": "add", "product_id": self.product.pk, "quantity": 10**12}],
+            [
+                {"op": "add", "product_id": self.product.pk, "quantity": 600},
+                {"op": "update", "product_id": self.product.pk, "quantity": 600},
+            ],
+        ):
+            response = self.client.post(
+                "/batch_cart",
+                {"operations": operations},
+                content_type="application/json",
+                **self.auth,
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["index"], len(operations) - 1)
+        # pylint: disable=no-member
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+
+    def test_single_item_views_reject_bad_quantities(self):
+        url = f"/add_to_cart/{self.product.pk}"
+        for quantity in ("abc", "", "-2", "0", "1001"):
+            response = self.client.post(url, {"quantity": quantity}, **self.auth)
+            self.assertEqual(response.status_code, 400, quantity)
+        self.assertCart(0)
+
+        self.client.post(url, {"quantity": 2}, **self.auth)
+        url = f"/update_quantity/{self.product.pk}"
+        for body in ('{"quantity": "abc"}', '{"quantity": true}', "[]", "{"):
+            response = self.client.put(
+                url, body, content_type="application/json", **self.auth
+            )
+            self.assertEqual(response.status_code, 400, body)
+        self.assertCart(2)
+
+    def test_single_item_views_apply_the_item_cap(self):
+        url = f"/add_to_cart/{self.product.pk}"
+        self.client.post(url, {"quantity": 600}, **self.auth)
+        response = self.client.post(url, {"quantity": 600}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertCart(600)
+        response = self.client.put(
+            f"/update_quantity/{self.product.pk}",
+            '{"quantity": 401}',
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertCart(600)
+        with self.assertRaises(CartQuantityError):
+            add_item(self.cart.pk, self.product.pk, MAX_ITEM_QUANTITY + 1)
+        add_item(self.cart.pk, self.product.pk, 400)
+        self.assertCart(MAX_ITEM_QUANTITY)
+
+    def test_checkout(self):
+        add_item(self.cart.pk, self.product.pk, 4)
+        response = self.client.post(
+            "/checkout",
+            {"shipping_information": "Somewhere"},
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        order = response.json()["order"]
+        self.assertEqual(order["total_price"], "38.00")
+        self.assertEqual(order["items"][0]["quantity"], 4)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 96)
+        self.assertCart(0)
+
+    def test_checkout_out_of_stock(self):
+        add_item(self.cart.pk, self.product.pk, 101)
+        response = self.client.post(
+            "/checkout",
+            {"shipping_information": "Somewhere"},
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 409)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 100)
+        self.assertCart(101)
+        # pylint: disable=no-member
+        self.assertFalse(Order.objects.exists())
+
+
+@skipUnless(
+    connection.vendor == "postgresql",
+    "Concurrent writers need a database with row level locking.",
+)
+class CartConcurrencyTest(TransactionTestCase):
+    """
+    Many threads adding to the same cart item must not lose any unit.
+    """
+
+    threads = 16
+    adds_per_thread = 25
+
+    def test_concurrent_adds(self):
+        _, cart, product = create_customer_cart()
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(self.adds_per_thread):
+                    add_item(cart.pk, product.pk, 1)
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        expected = self.threads * self.adds_per_thread
+        cart.refresh_from_db()
+        # pylint: disable=no-member
+        self.assertEqual(CartItem.objects.get(cart=cart).quantity, expected)
+        self.assertEqual(cart.total_quantity, expected)
+
+
+class ProductImagePipelineTest(TestCase):
+    """
+    Uploaded images are checked by content, stripped of metadata and resized.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        storage_settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {
+                    "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+                },
+            },
+            IMAGE_PIPELINE={"WORKERS": 0, "FORMAT": "WEBP"},
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+        # pylint: disable=no-member
+        Category.objects.create(name="No Category", code="no-category")
+        self.user = User.objects.create_user("seller", "", "secret123")
+        self.user.role = "Seller"
+        self.user.save()
+        Seller.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+
+    def create_product(self, image):
+        return self.client.post(
+            "/create_product",
+            {
+                "name": "Camera",
+                "brand": "Brand",
+                "description": "Description",
+                "base_price": "10",
+                "price": "9",
+                "stock": "3",
+                "seller_id": self.user.pk,
+                "image": image,
+            },
+            **self.auth,
+        )
+
+    def test_upload_is_cleaned_and_resized(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        output = BytesIO()
+        Image.new("RGB", (1200, 800), "red").save(output, "JPEG", exif=exif)
+        image = SimpleUploadedFile("photo.jpg", output.getvalue(), "image/jpeg")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_product(image)
+        self.assertEqual(response.status_code, 200)
+
+        # pylint: disable=no-member
+        product = Product.objects.get()
+        with Image.open(product.image) as original:
+            self.assertEqual(original.size, (1200, 800))
+            self.assertEqual(len(original.getexif()), 0)
+        with Image.open(product.image_thumbnail) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ("WEBP", (200, 133)))
+        with Image.open(product.image_medium) as medium:
+            self.assertEqual(medium.size, (600, 400))
+
+        images = self.client.get("/all_products").json()["products"][0]["images"]
+        self.assertTrue(images["thumbnail"].endswith("_thumbnail.webp"))
+
+    def test_fake_image_is_rejected(self):
+        image = SimpleUploadedFile("photo.jpg", b"not an image", "image/jpeg")
+        response = self.create_product(image)
+        self.assertEqual(response.status_code, 400)
+        # pylint: disable=no-member
+        self.assertFalse(Product.objects.exists())
+
+
+class SearchTest(TestCase):
+    """
+    Search ranks matches over name, brand, description and category name,
+    filters them and counts facets.
+    """
+
+    def setUp(self):
+        # pylint: disable=no-member
+        tech = Category.objects.create(name="Technology", code="tech")
+        books = Category.objects.create(name="Books", code="books")
+        seller = Seller.objects.create(user=User.objects.create_user("seller", "", "x"))
+        rows = [
+            ("Gaming laptop", "Acme", "Fast laptop for games", "999.00", 3, tech),
+            ("Laptop sleeve", "Cover", "Protects your laptop", "20.00", 0, tech),
+            ("Laptop stand", "Acme", "Aluminium stand", "45.00", 10, tech),
+            ("Python cookbook", "Press", "Recipes", "35.00", 5, books),
+        ]
+        self.products = [
+            Product.objects.create(
+                name=name,
+                brand=brand,
+                description=description,
+                base_price=price,
+                price=price,
+                stock=stock,
+                category=category,
+                seller=seller,
+            )
+            for name, brand, description, price, stock, category in rows
+        ]
+        # Product saves drop it on commit, which TestCase never reaches
+        invalidate_index()
+
+    def search(self, **params):
+        return self.client.get("/search", params).json()
+
+    def test_ranking_and_facets(self):
+        data = self.search(q="laptop")
+        ids = [product["id"] for product in data["products"]]
+        # Matches in both name and description rank first
+        self.assertEqual(ids[:2], [self.products[0].pk, self.products[1].pk])
+        self.assertEqual(set(ids), {p.pk for p in self.products[:3]})
+        self.assertEqual(
+            data["facets"]["brands"],
+            [{"brand": "Acme", "count": 2}, {"brand": "Cover", "count": 1}],
+        )
+        self.assertEqual(data["facets"]["categories"][0]["count"], 3)
+
+    def test_category_name_and_filters(self):
+        data = self.search(q="books")
+        self.assertEqual([p["id"] for p in data["products"]], [self.products[3].pk])
+
+        data = self.search(q="laptop", in_stock="true", max_price="100")
+        self.assertEqual([p["id"] for p in data["products"]], [self.products[2].pk])
+
+    def test_index_follows_catalog_changes(self):
+        self.search(q="laptop")
+        index = get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[2].delete()
+            # Dropped on commit, a rebuild can't see the rows of before it
+            self.assertIs(get_index(), index)
+        self.assertIsNot(get_index(), index)
+        data = self.search(q="laptop")
+        self.assertEqual(len(data["products"]), 2)
+
+    def test_invalid_filter(self):
+        for value in ("cheap", "nan", "inf", "sNaN"):
+            response = self.client.get("/search", {"q": "laptop", "min_price": value})
+            self.assertEqual(response.status_code, 400)
+
+
+class ResponseCacheTest(TestCase):
+    """
+    all_products responses are cached per normalized query params, dropped
+    by product changes and rebuilt by a single worker.
+    """
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        # pylint: disable=no-member
+        category = Category.objects.create(name="Technology", code="tech")
+        self.user = User.objects.create_user("seller", "", "secret123")
+        self.user.role = "Seller"
+        self.user.save()
+        seller = Seller.objects.create(user=self.user)
+        self.product = Product.objects.create(
+            name="Laptop",
+            brand="Acme",
+            description="Laptop",
+            base_price="10.00",
+            price="9.50",
+            stock=5,
+            category=category,
+            seller=seller,
+        )
+        self.token = Token.objects.create(user=self.user)
+        warm_token_cache(self.token)
+
+    def test_hit_with_normalized_params(self):
+        response = self.client.get("/all_products", {"per_page": 5, "page": 1})
+        self.assertEqual(response["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/all_products", {"page": 1, "per_page": 5, "utm_source": "ad"}
+            )
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(response.json()["products"]), 1)
+
+    def test_product_change_invalidates(self):
+        self.client.get("/all_products")
+        response = self.client.delete(
+            f"/delete_product/{self.product.pk}",
+            HTTP_AUTHORIZATION=f"Token {self.token.key}",
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/all_products")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["products"], [])
+
+    def test_stale_served_while_another_worker_rebuilds(self):
+        self.client.get("/all_products")
+        response_cache = get_response_cache()
+        key = response_cache_key("all_products", [])
+        status, content_type, content, _ = response_cache.get(key)
+        response_cache.set(key, (status, content_type, content, 0))
+        # Another worker holds the rebuild lock
+        response_cache.add(f"{key}:lock", 1)
+        with self.assertNumQueries(0):
+            response = self.client.get("/all_products")
+        self.assertEqual(response["X-Cache"], "STALE")
+
+        response_cache.delete(f"{key}:lock")
+        response = self.client.get("/all_products")
+        self.assertEqual(response["X-Cache"], "MISS")
+
+
+class StreamingJsonTest(TestCase):
+    """
+    Large listings are streamed chunk by chunk as valid JSON documents.
+    """
+
+    def setUp(self):
+        # pylint: disable=no-member
+        category = Category.objects.create(name="Technology", code="tech")
+        self.user = User.objects.create_user("seller", "", "secret123")
+        self.user.role = "Seller"
+        self.user.save()
+        seller = Seller.objects.create(user=self.user)
+        products = Product.objects.bulk_create(
+            Product(
+                name=f"Product {i}",
+                brand="Brand",
+                description="Description",
+                base_price="10.00",
+                price="9.50",
+                stock=5,
+                category=category,
+                seller=seller,
+            )
+            for i in range(450)
+        )
+        refresh_listings(product.pk for product in products)
+        self.token = Token.objects.create(user=self.user)
+        warm_token_cache(self.token)
+
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        return chunks, json.loads(b"".join(chunks))
+
+    def test_catalog(self):
+        # One query, the products are read with a single iterator
+        with self.assertNumQueries(1):
+            chunks, data = self.read(
+                self.client.get(
+                    "/catalog", HTTP_AUTHORIZATION=f"Token {self.token.key}"
+                )
+            )
+        # Opening, 3 chunks of products and closing
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(data["message"], "Products retrieved successfully")
+        self.assertEqual(len(data["products"]), 450)
+        self.assertEqual(data["products"][0]["price"], "9.50")
+        self.assertEqual(data["products"][0]["seller"]["username"], "seller")
+
+    def test_catalog_requires_authentication(self):
+        self.assertEqual(self.client.get("/catalog").status_code, 403)
+
+    def test_seller_products(self):
+        response = self.client.get(
+            f"/seller_products/{self.user.pk}",
+            HTTP_AUTHORIZATION=f"Token {self.token.key}",
+        )
+        _, data = self.read(response)
+        self.assertEqual(len(data["products"]), 450)
+
+    def test_all_product_ids(self):
+        _, data = self.read(self.client.get("/all_product_ids"))
+        # pylint: disable=no-member
+        self.assertEqual(
+            data["all_product_ids"],
+            list(Product.objects.order_by("pk").values_list("pk", flat=True)),
+        )
+
+
+class ProductImportTest(TestCase):
+    """
+    Bulk imports validate every row like create_product, insert the valid
+    ones in batches and report the others.
+    """
+
+    def setUp(self):
+        # pylint: disable=no-member
+        Category.objects.create(name="No Category", code="no-category")
+        Category.objects.create(name="Technology", code="tech")
+        self.user = User.objects.create_user("seller", "", "secret123")
+        self.user.role = "Seller"
+        self.user.save()
+        self.seller = Seller.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        warm_token_cache(self.token)
+
+    def upload(self, name, content):
+        return self.client.post(
+            "/import_products",
+            {"file": SimpleUploadedFile(name, content.encode())},
+            HTTP_AUTHORIZATION=f"Token {self.token.key}",
+        )
+
+    def test_csv_import(self):
+        rows = "".join(
+            f"Product {i},Brand,Description,10,9.5,{i},tech\n" for i in range(2500)
+        )
+        content = (
+            "name,brand,description,base_price,price,stock,category_code\n"
+            + rows
+            + "Bad,Brand,Description,10,cheap,1,tech\n"
+            + "Unknown,Brand,Description,10,9.5,1,toys\n"
+        )
+        # Inserted in batches, SQLite splits them further by its variables limit
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload("products.csv", content)
+        self.assertLess(len(queries), 100)
+        data = response.json()
+        self.assertEqual(data["created"], 2500)
+        self.assertEqual(
+            data["errors"],
+            [
+                {"row": 2501, "error": "Price must be a valid number"},
+                {"row": 2502, "error": "Category with code toys does not exist."},
+            ],
+        )
+        # pylint: disable=no-member
+        product = Product.objects.get(name="Product 7")
+        self.assertEqual((product.stock, product.seller_id), (7, self.seller.pk))
+        self.assertEqual(str(product.price), "9.50")
+
+    def test_jsonl_import(self):
+        content = "\n".join(
+            [
+                json.dumps(
+                    {
+                        "name": "Laptop",
+                        "brand": "Acme",
+                        "description": "Laptop",
+                        "base_price": 100,
+                        "price": 90,
+                        "stock": 3,
+                    }
+                ),
+                "not json",
+                json.dumps({"name": "Mouse"}),
+            ]
+        )
+        data = self.upload("products.jsonl", content).json()
+        self.assertEqual(data["created"], 1)
+        self.assertEqual(
+            [error["error"] for error in data["errors"]],
+            ["Row couldn't be parsed.", "Brand is required"],
+        )
+        # pylint: disable=no-member
+        self.assertEqual(Product.objects.get().category.code, "no-category")
+
+    def test_out_of_range_rows_are_reported(self):
+        content = (
+            "name,brand,description,base_price,price,stock,category_code\n"
+            "Good,Brand,Description,10,9.5,1,tech\n"
+            "Nan,Brand,Description,10,nan,1,tech\n"
+            "Inf,Brand,Description,inf,9.5,1,tech\n"
+            "Huge,Brand,Description,10,1000000000,1,tech\n"
+            "Stock,Brand,Description,10,9.5,1000000000000,tech\n"
+        )
+        data = self.upload("products.csv", content).json()
+        self.assertEqual(data["created"], 1)
+        self.assertEqual(
+            [error["error"] for error in data["errors"]],
+            [
+                "Price must be a valid number",
+                "Base price must be a valid number",
+                "Price can't be higher than 99999999.99",
+                "Stock can't be higher than 2147483647",
+            ],
+        )
+
+    def test_unknown_format(self):
+        response = self.upload("products.xlsx", "")
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogExportTest(TestCase):
+    """
+    The catalog export streams CSV / NDJSON, gzipped on demand, and can be
+    limited to the products updated since a date.
+    """
+
+    def setUp(self):
+        # pylint: disable=no-member
+        category = Category.objects.create(name="Technology", code="tech")
+        self.user = User.objects.create_user("seller", "", "secret123")
+        self.user.role = "Seller"
+        self.user.save()
+        seller = Seller.objects.create(user=self.user)
+        self.products = Product.objects.bulk_create(
+            Product(
+                name=f"Product, {i}",
+                brand="Brand",
+                description="Description",
+                base_price="10.00",
+                price="9.50",
+                stock=i,
+                category=category,
+                seller=seller,
+            )
+            for i in range(1200)
+        )
+        self.token = Token.objects.create(user=self.user)
+        warm_token_cache(self.token)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+
+    def export(self, headers=None, **params):
+        response = self.client.get(
+            "/export_products", params, headers=headers, **self.auth
+        )
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export()
+        rows = list(csv.DictReader(content.decode().splitlines()))
+        self.assertEqual(len(rows), 1200)
+        self.assertEqual(rows[3]["name"], "Product, 3")
+        self.assertEqual(rows[3]["category_code"], "tech")
+        self.assertEqual(rows[3]["seller_username"], "seller")
+        self.assertIn("X-Export-Started-At", response)
+
+    def test_ndjson_gzip_since(self):
+        since = timezone.now()
+        # pylint: disable=no-member
+        Product.objects.filter(pk=self.products[0].pk).update(
+            updated_at=since + timedelta(seconds=1)
+        )
+        response, content = self.export(
+            headers={"Accept-Encoding": "gzip"},
+            format="ndjson",
+            since=since.isoformat(),
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        lines = gzip.decompress(content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])["id"], self.products[0].pk)
+
+    def test_since_follows_category_and_seller_changes(self):
+        # pylint: disable=no-member
+        books = Category.objects.create(name="Books", code="books")
+        Product.objects.filter(pk=self.products[0].pk).update(category=books)
+        since = timezone.now()
+
+        books.name = "Novels"
+        books.save()
+        _, content = self.export(format="ndjson", since=since.isoformat())
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(
+            [(row["id"], row["category_name"]) for row in rows],
+            [(self.products[0].pk, "Novels")],
+        )
+
+        self.user.username = "renamed"
+        self.user.save()
+        _, content = self.export(format="ndjson", since=since.isoformat())
+        self.assertEqual(len(content.decode().splitlines()), 1200)
+
+    def test_invalid_since(self):
+        response = self.client.get(
+            "/export_products", {"since": "yesterday"}, **self.auth
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_authentication(self):
+        response = self.client.get("/export_products")
+        self.assertEqual(response.status_code, 403)
+
+
+class BulkUpdateProductsTest(TestCase):
+    """
+    Bulk stock / price updates are applied in one transaction, only to the
+    seller's own products, and only touch the stock, price and updated_at.
+    """
+
+    def setUp(self):
+        # pylint: disable=no-member
+        category = Category.objects.create(name="Technology", code="tech")
+        self.user = User.objects.create_user("seller", "", "secret123")
+        self.user.role = "Seller"
+        self.user.save()
+        seller = Seller.objects.create(user=self.user)
+        other_user = User.objects.create(username="other", role="Seller")
+        other_seller = Seller.objects.create(user=other_user)
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}",
+                brand="Brand",
+                description="Description",
+                base_price="10.00",
+                price="9.50",
+                stock=5,
+                category=category,
+                seller=other_seller if i == 2 else seller,
+            )
+            for i in range(3)
+        ]
+        self.token = Token.objects.create(user=self.user)
+        warm_token_cache(self.token)
+
+    def post(self, updates):
+        return self.client.post(
+            "/bulk_update_products",
+            {"updates": updates},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Token {self.token.key}",
+        )
+
+    def test_absolute_and_delta_updates(self):
+        first, second = self.products[0].pk, self.products[1].pk
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(
+                [
+                    {"product_id": first, "stock": 20, "price_delta": "-0.50"},
+                    {"product_id": second, "stock_delta": -2},
+                    {"product_id": second, "price": "12.345"},
+                ]
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["products"],
+            [
+                {"id": first, "stock": 20, "price": "9.00", "version": 2},
+                {"id": second, "stock": 3, "price": "12.35", "version": 2},
+            ],
+        )
+        # pylint: disable=no-member
+        self.assertEqual(Product.objects.get(pk=second).version, 2)
+        update = next(q["sql"] for q in queries if q["sql"].startswith("UPDATE"))
+        self.assertIn('"stock"', update)
+        self.assertNotIn('"image"', update)
+        self.assertNotIn('"name"', update)
+
+    def test_missing_seller_is_rejected(self):
+        with self.assertRaises(ValueError):
+            apply_stock_price_updates(None, [{"product_id": 1, "stock": 1}])
+        # pylint: disable=no-member
+        user = User.objects.create(username="no-seller", role="Seller")
+        self.token = Token.objects.create(user=user)
+        response = self.post([{"product_id": self.products[0].pk, "stock": 1}])
+        self.assertEqual(response.status_code, 404)
+
+    def test_other_sellers_products_are_rejected(self):
+        response = self.post(
+            [
+                {"product_id": self.products[0].pk, "stock": 1},
+                {"product_id": self.products[2].pk, "stock": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["index"], 1)
+        # pylint: disable=no-member
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 5)
+
+    def test_negative_stock_is_rejected(self):
+        response = self.post([{"product_id": self.products[0].pk, "stock_delta": -6}])
+        self.assertEqual(response.status_code, 400)
+        response = self.post([{"product_id": self.products[0].pk}])
+        self.assertEqual(response.json()["error"], "Nothing to update")
+
+    def test_out_of_range_values_are_rejected(self):
+        first, second = self.products[0].pk, self.products[1].pk
+        for updates, index in (
+            ([{"product_id": first, "stock": 2**31}], 0),
+            (
+                [
+                    {"product_id": first, "stock": 1},
+                    {"product_id": second, "stock_delta": -(2**63)},
+                ],
+                1,
+            ),
+            ([{"product_id": first, "price": "1e12"}], 0),
+            ([{"product_id": first, "price": "NaN"}], 0),
+        ):
+            response = self.post(updates)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["index"], index)
+        # Each delta is in range, their sum isn't
+        response = self.post(
+            [
+                {"product_id": first, "stock": 2**31 - 1},
+                {"product_id": first, "stock_delta": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["index"], 1)
+        response = self.post(
+            [
+                {"product_id": first, "price": "99999999.99"},
+                {"product_id": first, "price_delta": "0.01"},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["index"], 1)
+        # pylint: disable=no-member
+        self.assertEqual(Product.objects.get(pk=first).stock, 5)
+
+
+class PatchProductTest(TestCase):
+    """
+    PATCH writes only the given fields and rejects stale versions.
+    """
+
+    def setUp(self):
+        # pylint: disable=no-member
+        self.category = Category.objects.create(name="Technology", code="tech")
+        self.user = User.objects.create_user("seller", "", "secret123")
+        self.user.role = "Seller"
+        self.user.save()
+        seller = Seller.objects.create(user=self.user)
+        self.product = Product.objects.create(
+            name="Laptop",
+            brand="Acme",
+            description="Laptop",
+            base_price="10.00",
+            price="9.50",
+            stock=5,
+            category=self.category,
+            seller=seller,
+        )
+        self.token = Token.objects.create(user=self.user)
+        warm_token_cache(self.token)
+
+    def patch(self, data, **headers):
+        return self.client.patch(
+            f"/update_product/{self.product.pk}",
+            data,
+            content_type="application/json",
+            headers=headers,
+            HTTP_AUTHORIZATION=f"Token {self.token.key}",
+        )
+
+    def test_only_given_fields_are_written(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch({"stock": 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], f'"{self.product.pk}-2"')
+        self.assertEqual(response.json()["product"]["stock"], 7)
+        self.assertEqual(response.json()["product"]["name"], "Laptop")
+        updates = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+        # The version compare-and-set, then the stock
+        self.assertEqual(len(updates), 2)
+        self.assertNotIn('"name"', updates[1])
+        # No separate seller or category lookup
+        self.assertFalse(
+            any('FROM "cmscommerce_category"' in q["sql"] for q in queries)
+        )
+        self.assertFalse(any('FROM "cmscommerce_seller"' in q["sql"] for q in queries))
+
+    def test_stale_if_match_is_rejected(self):
+        etag = self.patch({"price": "8"})["ETag"]
+        self.patch({"price": "7"}, **{"If-Match": etag})
+        response = self.patch({"price": "6"}, **{"If-Match": etag})
+        self.assertEqual(response.status_code, 412)
+        # pylint: disable=no-member
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((str(product.price), product.version), ("7.00", 3))
+
+    def test_invalid_field(self):
+        response = self.patch({"stock": "-1"})
+        self.assertEqual(response.status_code, 400)
+        response = self.patch({"name": ""})
+        self.assertEqual(response.json()["error"], "Name is required")
+        for data in ({"version": [1]}, {"seller_id": {"id": 1}}):
+            response = self.patch({"stock": 7, **data})
+            self.assertEqual(response.status_code, 400)
+
+    def test_post_uses_the_same_rules(self):
+        fields = {
+            "name": "Laptop",
+            "brand": "Acme",
+            "description": "Laptop",
+            "base_price": "10",
+            "price": "8",
+            "stock": "3",
+            "seller_id": self.user.pk,
+        }
+        for invalid in (
+            {"price": "nan"},
+            {"price": "1e12"},
+            {"stock": "2147483648"},
+            {"name": "x" * 1000},
+            {"seller_id": ""},
+        ):
+            response = self.client.post(
+                f"/update_product/{self.product.pk}",
+                {**fields, **invalid},
+                HTTP_AUTHORIZATION=f"Token {self.token.key}",
+            )
+            self.assertEqual(response.status_code, 400, invalid)
+        # pylint: disable=no-member
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 5)
+
+
+class MetricsTest(TestCase):
+    """
+    Every request reports its queries and timings in Server-Timing and in
+    the /metrics histograms of its URL name.
+    """
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        # pylint: disable=no-member
+        category = Category.objects.create(name="Technology", code="tech")
+        user = User.objects.create(username="seller", role="Seller")
+        Product.objects.create(
+            name="Laptop",
+            brand="Acme",
+            description="Laptop",
+            base_price="10.00",
+            price="9.50",
+            stock=5,
+            category=category,
+            seller=Seller.objects.create(user=user),
+        )
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get("/all_products")
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="2 queries", serialize;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+        text = self.client.get("/metrics").content.decode()
+        self.assertIn(
+            'cmscommerce_responses_total{view="all_products",status="200"}', text
+        )
+        self.assertRegex(
+            text, r'cmscommerce_request_queries_bucket\{view="all_products",le="2"\} \d'
+        )
+        self.assertIn(
+            'cmscommerce_request_serialize_duration_seconds_count{view="all_products"}',
+            text,
+        )
+        hits = get_token_cache().stats()["hits"]
+        self.assertIn(f"cmscommerce_token_cache_hits_total {hits}\n", text)
+        self.assertIn("cmscommerce_token_cache_misses_total ", text)
+
+    def test_metrics_are_restricted(self):
+        with override_settings(METRICS={"ALLOWED_IPS": ["10.0.0.1"]}):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.1")
+            self.assertEqual(response.status_code, 200)
+        with override_settings(METRICS={"ALLOWED_IPS": None}):
+            response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.2")
+            self.assertEqual(response.status_code, 200)
+
+    def test_log_queries_over(self):
+        with override_settings(METRICS={"LOG_QUERY_COUNT_OVER": 1}):
+            with self.assertLogs("cmscommerce.metrics", "WARNING") as logs:
+                self.client.get("/all_products")
+        self.assertIn("ran 2 queries", logs.output[0])
+
+
+class BenchmarkTest(TestCase):
+    """
+    The seeder fills the database with bulk inserts and the benchmark flags
+    query count and latency regressions.
+    """
+
+    def test_seed_and_run(self):
+        ids = seed_data(sellers=2, customers=3, products=20, cart_items=2)
+        # pylint: disable=no-member
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(Customer.objects.count(), 3)
+        self.assertEqual(CartItem.objects.count(), 6)
+        for name in ("all_products", "get_cart", "update_product"):
+            result = run_benchmark(ids, name, iterations=2)
+            self.assertEqual(result["status"], 200, name)
+        # Requests are rolled back
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertIn("bulk_update_products", ENDPOINTS)
+
+    def test_clear_caches_keeps_other_keys(self):
+        cache.set("session:other", 1)
+        get_response_cache().set("other", 2)
+        self.client.get("/all_products")
+        self.assertEqual(self.client.get("/all_products")["X-Cache"], "HIT")
+        clear_caches()
+        self.assertEqual(self.client.get("/all_products")["X-Cache"], "MISS")
+        self.assertEqual(cache.get("session:other"), 1)
+        self.assertEqual(get_response_cache().get("other"), 2)
+
+    def test_compare_results(self):
+        def report(queries, p50_ms):
+            result = {"queries": queries, "p50_ms": p50_ms, "p95_ms": p50_ms}
+            return {"endpoints": {"index": {**result, "peak_memory_kb": 10.0}}}
+
+        self.assertEqual(compare_results(report(2, 5.0), report(2, 5.5)), [])
+        self.assertEqual(compare_results(report(2, 0.1), report(2, 0.5)), [])
+        self.assertEqual(
+            compare_results(report(2, 5.0), report(3, 7.0)),
+            [
+                ("index", "queries", 2, 3),
+                ("index", "p50_ms", 5.0, 7.0),
+                ("index", "p95_ms", 5.0, 7.0),
+            ],
+        )
+
+
+class AsgiUrls:
+    """
+    URLconf of an ASGI deployment (SERVER_INTERFACE = "asgi").
+    """
+
+    urlpatterns = build_urlpatterns(async_views=True)
+
+
+READ_URLS = (
+    "/all_products",
+    "/get_cart",
+    "/categories",
+    "/public/categories",
+    "/seller_dashboard/1",
+)
+
+
+class ServerInterfaceTest(TestCase):
+    """
+    The catalog and cart read views are sync under WSGI, the default, and
+    async under ASGI.
+    """
+
+    def test_read_views_follow_the_server_interface(self):
+        self.assertEqual(settings.SERVER_INTERFACE, "wsgi")
+        for url in READ_URLS:
+            self.assertFalse(iscoroutinefunction(resolve(url).func), url)
+            self.assertTrue(iscoroutinefunction(resolve(url, AsgiUrls).func), url)
+
+
+@override_settings(ROOT_URLCONF=AsgiUrls)
+class AsyncViewsTest(TestCase):
+    """
+    The catalog and cart read views are async end to end under ASGI:
+    authentication, caches and queries never leave the event loop.
+    """
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        get_token_cache().clear()
+        self.user, self.cart, self.product = create_customer_cart()
+        # pylint: disable=no-member
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        self.token = Token.objects.create(user=self.user)
+        seller = Seller.objects.get()
+        seller.user.role = "Seller"
+        seller.user.save()
+        self.seller_token = Token.objects.create(user=seller.user)
+        self.seller_user_id = seller.user_id
+        self.async_client = AsyncClient()
+
+    def test_views_are_async(self):
+        for url in READ_URLS:
+            self.assertTrue(iscoroutinefunction(resolve(url).func), url)
+
+    async def test_get_cart(self):
+        headers = {"Authorization": f"Token {self.token.key}"}
+        response = await self.async_client.get("/get_cart", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cartTotalQuantity"], 2)
+        self.assertIn('desc="4 queries"', response["Server-Timing"])
+        # The token is cached by the first request
+        response = await self.async_client.get("/get_cart", headers=headers)
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+
+        response = await self.async_client.get(
+            "/get_cart", headers={"Authorization": "Token invalid"}
+        )
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get(
+            "/categories", headers={"Authorization": f"Token {self.token.key}"}
+        )
+        self.assertEqual(response.status_code, 403)
+
+    async def test_all_products_and_dashboard(self):
+        response = await self.async_client.get("/all_products", {"cursor": ""})
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(
+            [product["id"] for product in response.json()["products"]],
+            [self.product.pk],
+        )
+        response = await self.async_client.get("/all_products", {"cursor": ""})
+        self.assertEqual(response["X-Cache"], "HIT")
+
+        response = await self.async_client.get(
+            f"/seller_dashboard/{self.seller_user_id}",
+            headers={"Authorization": f"Token {self.seller_token.key}"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["pagination_info"]["total_pages"], 1)
+
+    async def test_categories_conditional(self):
+        headers = {"Authorization": f"Token {self.seller_token.key}"}
+        response = await self.async_client.get("/categories", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["categories"][0]["code"], "tech")
+        response = await self.async_client.get(
+            "/categories", headers={**headers, "If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(DATABASE_ROUTING={"REPLICAS": ["replica"]})
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    With a second SQLite database standing in for a replica, read-only views
+    read from it and writes go to the primary, except for a user who just
+    wrote: they read from the primary for STICKY_SECONDS.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added after the test databases are set up, it is managed here
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings["replica"] = {
+            **connections.settings["default"],
+            "NAME": os.path.join(cls.replica_dir, "replica.sqlite3"),
+        }
+        call_command("migrate", database="replica", verbosity=0)
+        # Drop the rows created by data migrations, setUp copies the primary's
+        call_command("flush", database="replica", interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+        shutil.rmtree(cls.replica_dir)
+        super().tearDownClass()
+
+    def tearDown(self):
+        call_command("flush", database="replica", interactive=False, verbosity=0)
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        get_token_cache().clear()
+        self.user, self.cart, self.product = create_customer_cart()
+        self.auth = {
+            "HTTP_AUTHORIZATION": f"Token {Token.objects.create(user=self.user).key}"
+        }
+        # The replica is up to date with everything so far
+        for model in (
+            Category,
+            User,
+            Seller,
+            Customer,
+            Cart,
+            Product,
+            ProductListing,
+            ProductCounter,
+        ):
+            # pylint: disable=no-member
+            for obj in model.objects.all():
+                obj.save(using="replica", force_insert=True)
+
+    def test_reads_from_replica(self):
+        # pylint: disable=no-member
+        Product.objects.create(
+            name="Not replicated yet",
+            brand="Brand",
+            description="Description",
+            base_price="10.00",
+            price="9.50",
+            stock=1,
+            category=self.product.category,
+            seller=self.product.seller,
+        )
+        self.assertEqual(Product.objects.using("replica").count(), 1)
+        invalidate_responses("all_products")
+        config = {**settings.RESPONSE_CACHE, "PRIMARY_SECONDS": 0}
+        with override_settings(RESPONSE_CACHE=config):
+            response = self.client.get("/all_products")
+        self.assertEqual(
+            [product["name"] for product in response.json()["products"]], ["Product"]
+        )
+        with read_from_replica():
+            self.assertEqual(Product.objects.all().db, "replica")
+        self.assertEqual(Product.objects.all().db, "default")
+
+    def test_invalidated_responses_are_rebuilt_from_primary(self):
+        self.client.get("/all_products")
+        # pylint: disable=no-member
+        Product.objects.create(
+            name="Not replicated yet",
+            brand="Brand",
+            description="Description",
+            base_price="10.00",
+            price="9.50",
+            stock=1,
+            category=self.product.category,
+            seller=self.product.seller,
+        )
+        invalidate_responses("all_products")
+        response = self.client.get("/all_products")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()["products"]), 2)
+
+    def test_sticky_after_write(self):
+        response = self.client.get("/get_cart", **self.auth)
+        self.assertEqual(response.json()["cartItems"], [])
+
+        response = self.client.post(f"/add_to_cart/{self.product.pk}", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        # pylint: disable=no-member
+        self.assertFalse(CartItem.objects.using("replica").exists())
+        # The customer sees their own write
+        response = self.client.get("/get_cart", **self.auth)
+        self.assertEqual(response.json()["cartTotalQuantity"], 1)
+
+        routing = {"REPLICAS": ["replica"], "STICKY_SECONDS": 0}
+        with override_settings(DATABASE_ROUTING=routing):
+            self.client.post(f"/add_to_cart/{self.product.pk}", **self.auth)
+        response = self.client.get("/get_cart", **self.auth)
+        self.assertEqual(response.json()["cartItems"], [])
+
+
+class ProductListingTest(TestCase):
+    """
+    The ProductListing table follows every product, category and seller
+    change and serializes like the joined products.
+    """
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        self.user, self.cart, self.product = create_customer_cart()
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+
+    def listing(self):
+        # pylint: disable=no-member
+        return ProductListing.objects.get(pk=self.product.pk)
+
+    @override_settings(
+        STORAGES={
+            "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+            "staticfiles": {
+                "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+            },
+        }
+    )
+    def test_serializes_like_product(self):
+        self.product.image = "product_images/photo.jpg"
+        self.product.image_thumbnail = "product_images/variants/photo_thumbnail.webp"
+        self.product.save()
+        product = product_queryset().get(pk=self.product.pk)
+        self.assertEqual(serialize_listing(self.listing()), serialize_product(product))
+
+    def test_follows_product_changes(self):
+        self.product.price = "7.25"
+        self.product.save(update_fields=["price"])
+        self.assertEqual(self.listing().price, Decimal("7.25"))
+
+        add_item(self.cart.pk, self.product.pk, 4)
+        response = self.client.post(
+            "/checkout",
+            {"shipping_information": "Somewhere"},
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.listing().stock, 96)
+
+        self.product.delete()
+        # pylint: disable=no-member
+        self.assertFalse(ProductListing.objects.exists())
+
+    def test_follows_category_and_seller_changes(self):
+        category = self.product.category
+        category.name = "Tech"
+        category.save()
+        seller_user = self.product.seller.user
+        seller_user.role = "Seller"
+        seller_user.username = "renamed"
+        seller_user.save()
+        listing = self.listing()
+        self.assertEqual(listing.category_name, "Tech")
+        self.assertEqual(listing.seller_username, "renamed")
+
+    def test_rebuild(self):
+        # pylint: disable=no-member
+        Product.objects.filter(pk=self.product.pk).update(name="Renamed")
+        ProductListing.objects.all().delete()
+        self.assertEqual(rebuild_listings(), 1)
+        self.assertEqual(self.listing().name, "Renamed")
+        response = self.client.get("/all_products")
+        self.assertEqual(response.json()["products"][0]["name"], "Renamed")
+
+
+class ProductCounterTest(TestCase):
+    """
+    The product counters follow product creations, deletions and stock
+    changes, are served in pagination_info and can be reconciled.
+    """
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        self.user, self.cart, self.product = create_customer_cart()
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+        self.seller_key = seller_key(self.product.seller_id)
+        self.category_key = category_key(self.product.category_id)
+
+    def assertCounts(self, key, products, in_stock):
+        self.assertEqual(get_counts(key), (products, in_stock))
+
+    def test_follows_products(self):
+        # pylint: disable=no-member
+        other = Product.objects.create(
+            name="Other",
+            brand="Brand",
+            description="Description",
+            base_price="10.00",
+            price="9.50",
+            stock=0,
+            category=self.product.category,
+            seller=self.product.seller,
+        )
+        for key in (ALL_PRODUCTS, self.seller_key, self.category_key):
+            self.assertCounts(key, 2, 1)
+
+        add_item(self.cart.pk, self.product.pk, 100)
+        response = self.client.post(
+            "/checkout",
+            {"shipping_information": "Somewhere"},
+            content_type="application/json",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertCounts(ALL_PRODUCTS, 2, 0)
+
+        no_category = Category.objects.create(name="No Category", code="no-category")
+        other.category = no_category
+        other.stock = 5
+        other.save()
+        self.assertCounts(self.category_key, 1, 0)
+        self.assertCounts(category_key(no_category.pk), 1, 1)
+
+        other.delete()
+        self.assertCounts(ALL_PRODUCTS, 1, 0)
+        self.assertCounts(self.seller_key, 1, 0)
+        self.assertCounts(category_key(no_category.pk), 0, 0)
+
+    def test_pagination_info(self):
+        pagination_info = self.client.get("/all_products").json()["pagination_info"]
+        self.assertEqual(pagination_info["total_products"], 1)
+        self.assertEqual(pagination_info["in_stock_products"], 1)
+        self.assertEqual(
+            pagination_info["category_counts"], {str(self.product.category_id): 1}
+        )
+
+    def test_reconcile(self):
+        # pylint: disable=no-member
+        ProductCounter.objects.filter(key=ALL_PRODUCTS).update(products=7)
+        ProductCounter.objects.filter(key=self.seller_key).delete()
+        fixed = reconcile_counters()
+        self.assertEqual([key for key, _, _ in fixed], [ALL_PRODUCTS, self.seller_key])
+        self.assertCounts(ALL_PRODUCTS, 1, 1)
+        self.assertCounts(self.seller_key, 1, 1)
+        self.assertEqual(reconcile_counters(), [])
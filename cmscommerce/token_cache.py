@@ -0,0 +1,328 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Everything role_required needs to know about the owner of a token
+TokenEntry = namedtuple(
+    "TokenEntry", ["user_id", "username", "role", "customer_id", "seller_id"]
+)
+
+DEFAULT_TOKEN_CACHE = {
+    # "lru" (in-process), "django" (a CACHES alias, e.g. locmem or file based) or "none"
+    "BACKEND": "lru",
+    "MAX_SIZE": 10000,
+    "TIMEOUT": 300,
+    "CACHE_ALIAS": "default",
+}
+
+
+def entry_for_user(user) -> TokenEntry:
+    """
+    Builds the cache entry of an authenticated user, looking up the id of its
+    Customer or Seller row depending on the role.
+    Returns:
+        TokenEntry: The entry to store under the user's token key.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .models import Customer, Seller
+
+    customer_id = seller_id = None
+    if user.role == "Customer":
+        # pylint: disable=no-member
+        customer_id = (
+            Customer.objects.filter(user_id=user.pk)
+            .values_list("pk", flat=True)
+            .first()
+        )
+    elif user.role == "Seller":
+        # pylint: disable=no-member
+        seller_id = (
+            Seller.objects.filter(user_id=user.pk).values_list("pk", flat=True).first()
+        )
+    return TokenEntry(user.pk, user.username, user.role, customer_id, seller_id)
+
+
+async def aentry_for_user(user) -> TokenEntry:
+    """
+    Async version of entry_for_user, for the async views.
+    Returns:
+        TokenEntry: The entry to store under the user's token key.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .models import Customer, Seller
+
+    customer_id = seller_id = None
+    if user.role == "Customer":
+        # pylint: disable=no-member
+        customer_id = (
+            await Customer.objects.filter(user_id=user.pk)
+            .values_list("pk", flat=True)
+            .afirst()
+        )
+    elif user.role == "Seller":
+        # pylint: disable=no-member
+        seller_id = (
+            await Seller.objects.filter(user_id=user.pk)
+            .values_list("pk", flat=True)
+            .afirst()
+        )
+    return TokenEntry(user.pk, user.username, user.role, customer_id, seller_id)
+
+
+def user_from_entry(entry):
+    """
+    Rebuilds the User of a cache entry without touching the database.
+    Fields missing from the entry are deferred, so they are loaded on first
+    access and a save() never overwrites them with blanks.
+    Returns:
+        User: The authenticated user.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .models import User
+
+    known_values = {
+        "id": entry.user_id,
+        "username": entry.username,
+        "role": entry.role,
+        "is_active": True,
+    }
+    # from_db expects the values in the order of the model's fields
+    field_names = [
+        field.attname
+        for field in User._meta.concrete_fields
+        if field.attname in known_values
+    ]
+    return User.from_db(
+        DEFAULT_DB_ALIAS, field_names, [known_values[name] for name in field_names]
+    )
+
+
+class BaseTokenCache:
+    """
+    Maps token keys to TokenEntry objects and counts hits and misses.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # Threaded and async workers share the cache and its counters
+        self._lock = threading.Lock()
+
+    def _count(self, entry):
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def get(self, key):
+        entry = self._get(key)
+        self._count(entry)
+        return entry
+
+    async def aget(self, key):
+        entry = await self._aget(key)
+        self._count(entry)
+        return entry
+
+    async def aset(self, key, entry):
+        # In-process caches never block, shared ones override this
+        self.set(key, entry)
+
+    async def _aget(self, key):
+        return self._get(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, entry):
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUTokenCache(BaseTokenCache):
+    """
+    Thread-safe, in-process LRU cache whose entries expire after `timeout` seconds.
+    """
+
+    def __init__(self, max_size, timeout):
+        super().__init__()
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            return {**stats, "size": len(self._entries)}
+
+
+class DjangoTokenCache(BaseTokenCache):
+    """
+    Stores the entries in one of the CACHES aliases, so several workers can
+    share them (e.g. with a file based or memcached backend). The keys embed
+    a version stored in the cache too: clear() bumps it, which drops the
+    token entries without touching the other data of the cache.
+    """
+
+    prefix = "token_auth:"
+    version_key = "token_auth_version"
+
+    def __init__(self, alias, timeout):
+        super().__init__()
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def _version(self) -> int:
+        version = self.cache.get(self.version_key)
+        if version is None:
+            # The first worker to get there sets it
+            version = time.time_ns()
+            self.cache.add(self.version_key, version, None)
+            version = self.cache.get(self.version_key, version)
+        return version
+
+    async def _aversion(self) -> int:
+        version = await self.cache.aget(self.version_key)
+        if version is None:
+            version = time.time_ns()
+            await self.cache.aadd(self.version_key, version, None)
+            version = await self.cache.aget(self.version_key, version)
+        return version
+
+    def _key(self, version, key) -> str:
+        return f"{self.prefix}{version}:{key}"
+
+    def _get(self, key):
+        value = self.cache.get(self._key(self._version(), key))
+        return TokenEntry(*value) if value is not None else None
+
+    async def _aget(self, key):
+        value = await self.cache.aget(self._key(await self._aversion(), key))
+        return TokenEntry(*value) if value is not None else None
+
+    def set(self, key, entry):
+        self.cache.set(self._key(self._version(), key), tuple(entry), self.timeout)
+
+    async def aset(self, key, entry):
+        await self.cache.aset(
+            self._key(await self._aversion(), key), tuple(entry), self.timeout
+        )
+
+    def delete(self, *keys):
+        version = self._version()
+        self.cache.delete_many([self._key(version, key) for key in keys])
+
+    def clear(self):
+        # Only the token entries should go, the cache may be shared with other
+        # data: the old ones are left to expire
+        self.cache.set(self.version_key, time.time_ns(), None)
+
+
+class DummyTokenCache(BaseTokenCache):
+    """
+    Never caches anything, every request authenticates against the database.
+    """
+
+    def _get(self, key):
+        return None
+
+    def set(self, key, entry):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache() -> BaseTokenCache:
+    """
+    Returns the process-wide token cache configured by settings.TOKEN_CACHE.
+    Returns:
+        BaseTokenCache: The token cache.
+    """
+    global _token_cache  # pylint: disable=global-statement
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                config = {**DEFAULT_TOKEN_CACHE, **getattr(settings, "TOKEN_CACHE", {})}
+                backend = config["BACKEND"]
+                if backend == "lru":
+                    _token_cache = LRUTokenCache(config["MAX_SIZE"], config["TIMEOUT"])
+                elif backend == "django":
+                    _token_cache = DjangoTokenCache(
+                        config["CACHE_ALIAS"], config["TIMEOUT"]
+                    )
+                elif backend == "none":
+                    _token_cache = DummyTokenCache()
+                else:
+                    raise ValueError(f"Unknown TOKEN_CACHE backend: {backend}")
+    return _token_cache
+
+
+def invalidate_token(*keys):
+    """
+    Drops the cached entries of the given token keys.
+    """
+    get_token_cache().delete(*keys)
+
+
+def invalidate_user(user_id):
+    """
+    Drops the cached entries of every token owned by the user.
+    """
+    # pylint: disable=import-outside-toplevel
+    from rest_framework.authtoken.models import Token
+
+    # pylint: disable=no-member
+    keys = list(Token.objects.filter(user_id=user_id).values_list("key", flat=True))
+    if keys:
+        invalidate_token(*keys)
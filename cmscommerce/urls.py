@@ -4,42 +4,99 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 
-urlpatterns = [
-    path("", views.index, name="index"),
-    path("register", views.register, name="register"),
-    path("login_view", views.login_view, name="login_view"),
-    path("logout_view", views.logout_view, name="logout_view"),
-    path(
-        "seller_dashboard/<int:seller_id>",
-        views.seller_dashboard,
-        name="seller_dashboard",
-    ),
-    path("categories", views.categories, name="categories"),
-    path("create_product", views.create_product, name="create_product"),
-    path("all_products", views.all_products, name="all_products"),
-    path(
-        "delete_product/<int:product_id>", views.delete_product, name="delete_product"
-    ),
-    path(
-        "update_product/<int:product_id>", views.update_product, name="update_product"
-    ),
-    path("add_to_cart/<int:product_id>", views.add_to_cart, name="add_to_cart"),
-    path(
-        "update_quantity/<int:product_id>",
-        views.update_quantity,
-        name="update_quantity",
-    ),
-    path(
-        "remove_from_cart/<int:product_id>",
-        views.remove_from_cart,
-        name="remove_from_cart",
-    ),
-    path(
-        "get_cart",
-        views.get_cart,
-        name="get_cart",
-    ),
-]
+def read_views(async_views) -> dict:
+    """
+    The catalog and cart read views of a deployment mode: the async ones stay
+    on the event loop under ASGI, the sync ones avoid an async_to_sync hop per
+    request under WSGI.
+    Returns:
+        dict: The view of every read URL name.
+    """
+    if async_views:
+        return {
+            "seller_dashboard": views.aseller_dashboard,
+            "categories": views.acategories,
+            "public_categories": views.apublic_categories,
+            "all_products": views.aall_products,
+            "get_cart": views.aget_cart,
+        }
+    return {
+        "seller_dashboard": views.seller_dashboard,
+        "categories": views.categories,
+        "public_categories": views.public_categories,
+        "all_products": views.all_products,
+        "get_cart": views.get_cart,
+    }
+
+
+def build_urlpatterns(async_views=False) -> list:
+    """
+    Returns:
+        list: The URL patterns, with the read views of the deployment mode.
+    """
+    read = read_views(async_views)
+    return [
+        path("", views.index, name="index"),
+        path("register", views.register, name="register"),
+        path("login_view", views.login_view, name="login_view"),
+        path("logout_view", views.logout_view, name="logout_view"),
+        path(
+            "seller_dashboard/<int:seller_id>",
+            read["seller_dashboard"],
+            name="seller_dashboard",
+        ),
+        path(
+            "seller_products/<int:seller_id>",
+            views.seller_products,
+            name="seller_products",
+        ),
+        path("categories", read["categories"], name="categories"),
+        path("public/categories", read["public_categories"], name="public_categories"),
+        path("create_product", views.create_product, name="create_product"),
+        path("import_products", views.import_products_view, name="import_products"),
+        path(
+            "bulk_update_products",
+            views.bulk_update_products,
+            name="bulk_update_products",
+        ),
+        path("all_products", read["all_products"], name="all_products"),
+        path("all_product_ids", views.all_product_ids, name="all_product_ids"),
+        path("catalog", views.catalog, name="catalog"),
+        path("export_products", views.export_products, name="export_products"),
+        path("search", views.search, name="search"),
+        path(
+            "delete_product/<int:product_id>",
+            views.delete_product,
+            name="delete_product",
+        ),
+        path(
+            "update_product/<int:product_id>",
+            views.update_product,
+            name="update_product",
+        ),
+        path("add_to_cart/<int:product_id>", views.add_to_cart, name="add_to_cart"),
+        path(
+            "update_quantity/<int:product_id>",
+            views.update_quantity,
+            name="update_quantity",
+        ),
+        path(
+            "remove_from_cart/<int:product_id>",
+            views.remove_from_cart,
+            name="remove_from_cart",
+        ),
+        path("batch_cart", views.batch_cart, name="batch_cart"),
+        path(
+            "get_cart",
+            read["get_cart"],
+            name="get_cart",
+        ),
+        path("checkout", views.checkout_view, name="checkout"),
+        path("metrics", views.metrics, name="metrics"),
+    ]
+
+
+urlpatterns = build_urlpatterns(async_views=settings.SERVER_INTERFACE == "asgi")
 
 
 # Serve media files during development
@@ -1,19 +1,101 @@
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import (
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseRedirect,
+    JsonResponse,
+    QueryDict,
+    StreamingHttpResponse,
+)
+from django.http.multipartparser import MultiPartParserError
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.db.models import F, Sum
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 import json
-from helpers import role_required
+from asgiref.sync import sync_to_async
+from helpers import role_required, get_token_key
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.authtoken.models import Token
 from django.core import serializers
-from django.core.paginator import Paginator, EmptyPage
 
 
-from .models import User, Product, Seller, Category, Cart, CartItem, Customer
+from .models import (
+    User,
+    Product,
+    ProductListing,
+    Seller,
+    Category,
+    Cart,
+    CartItem,
+    Customer,
+)
+from .counters import (
+    aget_catalog_counts,
+    aget_counts,
+    get_catalog_counts,
+    get_counts,
+    seller_key,
+)
+from .pagination import apaginate, paginate
+from .serializers import (
+    product_queryset,
+    format_price,
+    serialize_product,
+    serialize_products,
+    serialize_listing,
+    serialize_listings,
+    cart_lines,
+    serialize_cart,
+    serialize_order,
+)
+from .token_cache import invalidate_token
+from .cart import (
+    CartItemNotFound,
+    get_cart_id,
+    aget_cart_id,
+    add_item,
+    change_item_quantity,
+    remove_item,
+    CartOperationError,
+    CART_OPERATIONS,
+    CartQuantityError,
+    clean_quantity,
+    apply_operations,
+)
+from .categories import acategories_response, categories_response
+from .checkout import CheckoutError, checkout
+from .export import EXPORT_FORMATS, export_catalog, parse_since
+from .images import validate_upload, schedule_product_image
+from .metrics import can_read_metrics, registry as metrics_registry
+from .response_cache import cache_response, invalidate_responses
+from .routers import primary_writes, replica_reads
+from .products import (
+    IMPORT_FORMATS,
+    BulkUpdateError,
+    ProductValidationError,
+    validate_product_fields,
+    product_etag,
+    parse_if_match,
+    import_products,
+    clean_stock_price_update,
+    apply_stock_price_updates,
+)
+from .search import parse_filters, search_products
+from .streaming import StreamingJsonResponse
+
+
+# Number of product IDs read from the database per round trip
+ID_CHUNK_SIZE = 2000
+
+# Maximum number of operations accepted by batch_cart
+MAX_CART_OPERATIONS = 500
+
+# Max number of updates accepted by bulk_update_products
+MAX_BULK_UPDATES = 1000
 
 
 # Create your views here.
@@ -165,158 +247,171 @@ def logout_view(request):
 
     # If the user exists, log out as usual
     logout(request)
+    # The token stays valid, but role_required must authenticate it again
+    token_key = get_token_key(request)
+    if token_key:
+        invalidate_token(token_key)
     return JsonResponse({"message": "Logged out successfully."}, status=200)
 
 
+def _dashboard_response(page_listings, pagination_info, counts) -> JsonResponse:
+    pagination_info["total_products"] = counts.products
+    pagination_info["in_stock_products"] = counts.in_stock
+    return JsonResponse(
+        {
+            "message": "Seller dashboard data retrieved successfully",
+            # Serialize only the products of the requested page
+            "products": serialize_listings(page_listings),
+            "pagination_info": pagination_info,
+        },
+        status=200,
+    )
+
+
 @role_required("Seller")
+@replica_reads
 def seller_dashboard(request, seller_id):
     if request.method == "GET":
-        page_number = request.GET.get("page", 1)
-        products_per_page = request.GET.get("per_page", 10)
-        # print(f"page_number: {page_number};;; products_per_page: {products_per_page}")
         try:
-            # print(f"seller_id: {seller_id}")
             # pylint: disable=no-member
             seller_user = User.objects.get(pk=seller_id)
-            seller = Seller.objects.get(user=seller_user)
-            products = Product.objects.filter(seller=seller).order_by("pk")
-
-            paginator = Paginator(products, products_per_page)
-
-            try:
-                page_products = paginator.page(page_number)
-            except EmptyPage:
-                page_products = paginator.page(
-                    1
-                )  # Handle out-of-range pages by returning the first page
+            seller = Seller.objects.select_related("user").get(user=seller_user)
+        except (User.DoesNotExist, Seller.DoesNotExist):
+            return JsonResponse(
+                {"error": "Seller with provided ID does not exist."}, status=400
+            )
+        # Listings carry the category and seller, no join needed
+        # pylint: disable=no-member
+        listings = ProductListing.objects.filter(seller_id=seller.pk).order_by("pk")
+        counts = get_counts(seller_key(seller.pk))
+        page_listings, pagination_info = paginate(
+            request, listings, total_count=counts.products
+        )
+        logout(request)
+        return _dashboard_response(page_listings, pagination_info, counts)
 
-            total_pages = paginator.num_pages
-            # print(f"total_pages: {total_pages}")
 
-            # Serialize the products
-            products_json = [
-                {
-                    "id": p.pk,
-                    "name": p.name,
-                    "brand": p.brand,
-                    "description": p.description,
-                    "base_price": str(p.base_price),
-                    "price": str(p.price),
-                    "stock": p.stock,
-                    "image": p.image.url if p.image else None,
-                    "category": {
-                        "id": p.category.id,
-                        "name": p.category.name,
-                        "code": p.category.code,
-                    },
-                    "seller": {
-                        "id": p.seller.id,
-                        "username": p.seller.user.username,
-                    },
-                }
-                for p in products
-            ]
-            # print(f"seller products json are: {products_json}")
-            logout(request)
+@role_required("Seller")
+@replica_reads
+async def aseller_dashboard(request, seller_id):
+    """
+    Async version of seller_dashboard, routed under ASGI.
+    """
+    if request.method == "GET":
+        try:
+            # pylint: disable=no-member
+            seller_user = await User.objects.aget(pk=seller_id)
+            seller = await Seller.objects.select_related("user").aget(user=seller_user)
+        except (User.DoesNotExist, Seller.DoesNotExist):
             return JsonResponse(
-                {
-                    "message": "Seller dashboard data retrieved successfully",
-                    "products": products_json,
-                    "pagination_info": {
-                        "total_pages": total_pages,
-                        "current_page": page_number,
-                        "products_per_page": products_per_page,
-                        "has_next": page_products.has_next(),
-                        "has_previous": page_products.has_previous(),
-                    },
-                },
-                status=200,
+                {"error": "Seller with provided ID does not exist."}, status=400
             )
         # pylint: disable=no-member
+        listings = ProductListing.objects.filter(seller_id=seller.pk).order_by("pk")
+        counts = await aget_counts(seller_key(seller.pk))
+        page_listings, pagination_info = await apaginate(
+            request, listings, total_count=counts.products
+        )
+        await sync_to_async(logout)(request)
+        return _dashboard_response(page_listings, pagination_info, counts)
+
+
+@role_required("Seller")
+def seller_products(request, seller_id):
+    """
+    View that streams every product of a seller, for dashboards too large to
+    page through. Products are serialized one at a time as they are read
+    from the database.
+    Returns:
+        StreamingJsonResponse: {"message": ..., "products": [...]}
+    """
+    if request.method == "GET":
+        try:
+            # pylint: disable=no-member
+            seller = Seller.objects.get(user_id=seller_id)
         except Seller.DoesNotExist:
             return JsonResponse(
                 {"error": "Seller with provided ID does not exist."}, status=400
             )
+        products = product_queryset(Product.objects.filter(seller=seller)).order_by(
+            "pk"
+        )
+        return StreamingJsonResponse(
+            "products",
+            products,
+            serialize_product,
+            extra={"message": "Seller products retrieved successfully"},
+        )
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
 
 
 @role_required("Seller")
 def categories(request):
+    """
+    View for the product categories, served from a cache invalidated on every
+    category change, with ETag / Last-Modified validators.
+    Returns:
+        HttpResponse: The categories JSON, or 304 if the client's copy is current.
+    """
     if request.method == "GET":
-        # pylint: disable=no-member
-        categories_data = Category.objects.all()
-        categories_json = [
-            {"id": c.pk, "name": c.name, "code": c.code} for c in categories_data
-        ]
-        return JsonResponse(
-            {
-                "message": "Categories retrieved successfully",
-                "categories": categories_json,
-            },
-            status=200,
-        )
+        return categories_response(request)
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+@role_required("Seller")
+async def acategories(request):
+    """
+    Async version of categories, routed under ASGI.
+    """
+    if request.method == "GET":
+        return await acategories_response(request)
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+def public_categories(request):
+    """
+    Read-only categories view without authentication, cacheable by browsers
+    and CDNs.
+    Returns:
+        HttpResponse: The categories JSON, or 304 if the client's copy is current.
+    """
+    if request.method in ("GET", "HEAD"):
+        return categories_response(request, public=True)
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+async def apublic_categories(request):
+    """
+    Async version of public_categories, routed under ASGI.
+    """
+    if request.method in ("GET", "HEAD"):
+        return await acategories_response(request, public=True)
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
 
 
 @role_required("Seller")
+@primary_writes
 def create_product(request):
     if request.method == "POST":
-        name = request.POST.get("name")
-        brand = request.POST.get("brand")
-        description = request.POST.get("description")
-        base_price = request.POST.get("base_price")
-        price = request.POST.get("price")
-        stock = request.POST.get("stock")
         category_code = request.POST.get("category_code")
         seller_id = int(request.POST.get("seller_id"))
         image = request.FILES.get("image")  # Use request.FILES for file fields
 
         # Validate inputs
-        fields_to_validate = [
-            {"field": name, "message": "Name is required"},
-            {"field": brand, "message": "Brand is required"},
-            {"field": description, "message": "Description is required"},
-            {"field": base_price, "message": "Base price is required"},
-            {"field": price, "message": "Price is required"},
-            {"field": stock, "message": "Stock is required"},
-        ]
-
-        for field in fields_to_validate:
-            if not field["field"]:
-                return JsonResponse({"error": field["message"]}, status=400)
-
-        try:
-            float_base_price = round(float(base_price), 2)
-            if float_base_price < 0:
-                return JsonResponse(
-                    {"error": "Base price must be a positive number"}, status=400
-                )
-        except ValueError:
-            return JsonResponse(
-                {"error": "Base price must be a valid number"}, status=400
-            )
-
         try:
-            float_price = round(float(price), 2)
-            if float_price < 0:
-                return JsonResponse(
-                    {"error": "Price must be a positive number"}, status=400
-                )
-        except ValueError:
-            return JsonResponse({"error": "Price must be a valid number"}, status=400)
-
-        if not stock.isdigit() or int(stock) < 0:
-            return JsonResponse(
-                {"error": "Stock must be a positive integer"}, status=400
-            )
+            values = validate_product_fields(request.POST)
+        except ProductValidationError as e:
+            return JsonResponse({"error": e.message}, status=400)
 
         if image:
-            if not image.name.endswith((".jpg", ".png")):
-                return JsonResponse(
-                    {"error": "Image must be a .jpg or .png file."}, status=400
-                )
-            if image.size > 2 * 1024 * 1024:
-                return JsonResponse(
-                    {"error": "Image must be less than or equal to 2MB."}, status=400
-                )
+            image_error = validate_upload(image)
+            if image_error:
+                return JsonResponse({"error": image_error}, status=400)
 
         try:
             seller_user = User.objects.get(pk=seller_id)
@@ -328,7 +423,7 @@ def create_product(request):
             )
 
         # pylint: disable=no-member
-        seller = Seller.objects.get(user=seller_user)
+        seller = Seller.objects.select_related("user").get(user=seller_user)
         # If no category_code is provided, use the "no-category" category
         if not category_code:
             category_code = "no-category"
@@ -336,47 +431,27 @@ def create_product(request):
         # pylint: disable=no-member
         category = Category.objects.get(code=category_code)
 
-        # Attempt to create new product
+        # Attempt to create new product, with its listing and counters in the
+        # same transaction
         # pylint: disable=no-member
         try:
-            product = Product.objects.create(
-                name=name,
-                brand=brand,
-                description=description,
-                base_price=float_base_price,
-                price=float_price,
-                stock=stock,
-                category=category,
-                seller=seller,
-                image=image,
-            )
+            with transaction.atomic():
+                product = Product.objects.create(
+                    category=category, seller=seller, image=image, **values
+                )
 
         except IntegrityError:
             return JsonResponse({"error": "Product already exists."}, status=400)
 
+        # Metadata stripping and resized variants are done by a worker thread
+        schedule_product_image(product)
+
+        invalidate_responses("all_products")
+
         return JsonResponse(
             {
                 "message": "Product created successfully",
-                "product": {
-                    "id": product.id,
-                    "name": product.name,
-                    "brand": product.brand,
-                    "description": product.description,
-                    "base_price": product.base_price,
-                    "price": product.price,
-                    "stock": product.stock,  # Return the stock value
-                    "category": {
-                        "id": product.category.id,
-                        "name": product.category.name,
-                        "code": product.category.code,
-                    },
-                    "seller": {
-                        "id": product.seller.id,
-                        "username": product.seller.user.username,
-                    },
-                    "image": product.image.url if product.image else None,
-                    # Return the URL of the image
-                },
+                "product": serialize_product(product),
             },
             status=200,
         )
@@ -384,66 +459,176 @@ def create_product(request):
         return JsonResponse({"error": "Invalid request method."}, status=405)
 
 
-def all_products(request):
-    if request.method == "GET":
-        page_number = request.GET.get("page", 1)
-        products_per_page = request.GET.get("per_page", 10)
-        # print(f"page_number: {page_number};;; products_per_page: {products_per_page}")
+@role_required("Seller")
+@primary_writes
+def import_products_view(request):
+    """
+    View for creating many products of the authenticated seller at once from
+    an uploaded "file": CSV with a header line or JSON Lines, with the
+    create_product fields (image excepted) per row. The format is read from
+    the "format" field or the file extension. Valid rows are imported, the
+    others are reported.
+    Returns:
+        JsonResponse: The number of created products and the row errors.
+    """
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if upload is None:
+            return JsonResponse({"error": "File is required."}, status=400)
+        file_format = request.POST.get("format") or upload.name.rsplit(".", 1)[-1]
+        file_format = file_format.lower()
+        if file_format not in IMPORT_FORMATS:
+            return JsonResponse(
+                {"error": "File must be a .csv or .jsonl file."}, status=400
+            )
+
+        # pylint: disable=no-member
+        seller_id = request.token_entry.seller_id if request.token_entry else None
+        if seller_id is None:
+            seller_id = (
+                Seller.objects.filter(user=request.user)
+                .values_list("pk", flat=True)
+                .first()
+            )
+        if seller_id is None:
+            return JsonResponse({"error": "Seller does not exist."}, status=400)
+
+        report = import_products(Seller(pk=seller_id), upload, file_format)
+        return JsonResponse(
+            {"message": "Products imported", **report.as_dict()}, status=200
+        )
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
 
+@role_required("Seller")
+@primary_writes
+def bulk_update_products(request):
+    """
+    View for changing the stock and / or price of many of the seller's own
+    products at once. Body: {"updates": [{"product_id": int, "stock": int or
+    "stock_delta": int, "price": str or "price_delta": str}, ...]}. Absolute
+    values replace the current ones, deltas are added to them. Either every
+    update is applied or none is.
+    Returns:
+        JsonResponse: The id, stock, price and version of the updated products.
+    """
+    if request.method == "POST":
         try:
-            # pylint: disable=no-member
-            products = Product.objects.all().order_by("pk")
+            updates = json.loads(request.body).get("updates")
+        except (ValueError, AttributeError):
+            return JsonResponse({"error": "Invalid JSON body."}, status=400)
 
-            paginator = Paginator(products, products_per_page)
+        if not isinstance(updates, list) or not updates:
+            return JsonResponse({"error": "Updates are required."}, status=400)
+        if len(updates) > MAX_BULK_UPDATES:
+            return JsonResponse(
+                {"error": f"At most {MAX_BULK_UPDATES} updates are allowed."},
+                status=400,
+            )
 
+        # Validate the shape of every update before touching the database
+        cleaned_updates = []
+        for index, update in enumerate(updates):
             try:
-                page_products = paginator.page(page_number)
-            except EmptyPage:
-                page_products = paginator.page(
-                    1
-                )  # Handle out-of-range pages by returning the first page
+                cleaned_updates.append(clean_stock_price_update(update))
+            except ValueError as e:
+                return JsonResponse({"error": str(e), "index": index}, status=400)
 
-            total_pages = paginator.num_pages
+        # pylint: disable=no-member
+        seller_id = request.token_entry.seller_id if request.token_entry else None
+        if seller_id is None:
+            seller_id = (
+                Seller.objects.filter(user=request.user)
+                .values_list("pk", flat=True)
+                .first()
+            )
+        if seller_id is None:
+            return JsonResponse(
+                {"error": "Seller does not exist for this user."}, status=404
+            )
 
-            # Extract IDs of all products
-            all_product_ids = [p.pk for p in products]
+        try:
+            products = apply_stock_price_updates(seller_id, cleaned_updates)
+        except BulkUpdateError as e:
+            return JsonResponse({"error": e.message, "index": e.index}, status=400)
 
-            products_json = [
-                {
-                    "id": p.pk,
-                    "name": p.name,
-                    "brand": p.brand,
-                    "description": p.description,
-                    "base_price": str(p.base_price),
-                    "price": str(p.price),
-                    "stock": p.stock,
-                    "image": p.image.url if p.image else None,
-                    "category": {
-                        "id": p.category.id,
-                        "name": p.category.name,
-                        "code": p.category.code,
-                    },
-                    "seller": {
-                        "id": p.seller.id,
-                        "username": p.seller.user.username,
-                    },
-                }
-                for p in products
-            ]
+        return JsonResponse(
+            {
+                "message": "Products updated successfully",
+                "products": [
+                    {
+                        "id": product.pk,
+                        "stock": product.stock,
+                        "price": format_price(product.price),
+                        "version": product.version,
+                    }
+                    for product in products
+                ],
+            },
+            status=200,
+        )
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+def _all_products_response(
+    page_listings, pagination_info, counts, category_counts
+) -> JsonResponse:
+    pagination_info["total_products"] = counts.products
+    pagination_info["in_stock_products"] = counts.in_stock
+    pagination_info["category_counts"] = {
+        category_id: category.products
+        for category_id, category in category_counts.items()
+    }
+    return JsonResponse(
+        {
+            "message": "Products retrieved successfully",
+            # Serialize only the products of the requested page
+            "products": serialize_listings(page_listings),
+            "pagination_info": pagination_info,
+        },
+        status=200,
+    )
+
+
+@cache_response("all_products", ("page", "per_page", "cursor", "sort"))
+@replica_reads
+def all_products(request):
+    if request.method == "GET":
+        try:
+            # pylint: disable=no-member
+            # Listings carry the category and seller, no join needed
+            listings = ProductListing.objects.order_by("pk")
+            counts, category_counts = get_catalog_counts()
+            page_listings, pagination_info = paginate(
+                request, listings, total_count=counts.products
+            )
+            return _all_products_response(
+                page_listings, pagination_info, counts, category_counts
+            )
+        except Exception as e:
             return JsonResponse(
-                {
-                    "message": "Products retrieved successfully",
-                    "products": products_json,
-                    "all_product_ids": all_product_ids,
-                    "pagination_info": {
-                        "total_pages": total_pages,
-                        "current_page": page_number,
-                        "products_per_page": products_per_page,
-                        "has_next": page_products.has_next(),
-                        "has_previous": page_products.has_previous(),
-                    },
-                },
-                status=200,
+                {"error": "Couldn't retrieve products. Error: " + str(e)}, status=500
+            )
+
+
+@cache_response("all_products", ("page", "per_page", "cursor", "sort"))
+@replica_reads
+async def aall_products(request):
+    """
+    Async version of all_products, routed under ASGI.
+    """
+    if request.method == "GET":
+        try:
+            # pylint: disable=no-member
+            listings = ProductListing.objects.order_by("pk")
+            counts, category_counts = await aget_catalog_counts()
+            page_listings, pagination_info = await apaginate(
+                request, listings, total_count=counts.products
+            )
+            return _all_products_response(
+                page_listings, pagination_info, counts, category_counts
             )
         except Exception as e:
             return JsonResponse(
@@ -451,13 +636,147 @@ def all_products(request):
             )
 
 
+def all_product_ids(request):
+    """
+    View that streams the IDs of every product as a compact JSON document.
+    The IDs are read in chunks straight from the database so the full catalog
+    is never held in memory.
+    Returns:
+        StreamingJsonResponse: {"all_product_ids": [1, 2, ...]}
+    """
+    if request.method == "GET":
+        # pylint: disable=no-member
+        product_ids = Product.objects.order_by("pk").values_list("pk", flat=True)
+        return StreamingJsonResponse(
+            "all_product_ids", product_ids, chunk_size=ID_CHUNK_SIZE
+        )
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+@role_required("any")
+def catalog(request):
+    """
+    View that streams the whole catalog as one JSON document, products are
+    serialized one at a time as they are read from the listings table.
+    Authenticated users only, it reads every product on each request.
+    Returns:
+        StreamingJsonResponse: {"message": ..., "products": [...]}
+    """
+    if request.method == "GET":
+        return StreamingJsonResponse(
+            "products",
+            # pylint: disable=no-member
+            ProductListing.objects.order_by("pk"),
+            serialize_listing,
+            extra={"message": "Products retrieved successfully"},
+        )
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+@role_required("any")
+def export_products(request):
+    """
+    View that streams the catalog for feeds and analytics, as CSV
+    ("format=csv", the default) or NDJSON ("format=ndjson"). "since" (ISO 8601)
+    limits it to the products updated since then, or whose category or
+    seller's user was (see export.changed_since), and the X-Export-Started-At
+    header gives the value to use for the next incremental export. The
+    stream is gzipped when the client accepts it.
+    Returns:
+        StreamingHttpResponse: The export.
+    """
+    if request.method == "GET":
+        file_format = request.GET.get("format", "csv")
+        if file_format not in EXPORT_FORMATS:
+            return JsonResponse({"error": "Format must be csv or ndjson."}, status=400)
+        try:
+            since = parse_since(request.GET.get("since"))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        started_at = timezone.now()
+        compress = "gzip" in request.headers.get("Accept-Encoding", "")
+        response = StreamingHttpResponse(
+            export_catalog(file_format, since, compress),
+            content_type=(
+                "text/csv; charset=utf-8"
+                if file_format == "csv"
+                else "application/x-ndjson"
+            ),
+        )
+        filename = f"catalog.{file_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["X-Export-Started-At"] = started_at.isoformat()
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if compress:
+            response["Content-Encoding"] = "gzip"
+        return response
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+def metrics(request):
+    """
+    View exposing the request metrics of this process (query count, database,
+    serialization and total time per URL name) in the Prometheus text format.
+    Only the addresses of METRICS["ALLOWED_IPS"] can read it.
+    Returns:
+        HttpResponse: The metrics.
+    """
+    if request.method == "GET":
+        if not can_read_metrics(request):
+            return HttpResponseForbidden(
+                "You don't have permission to access this page."
+            )
+        return HttpResponse(
+            metrics_registry.render(), content_type="text/plain; version=0.0.4"
+        )
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+def search(request):
+    """
+    View for searching the catalog by text ("q") over product name, brand,
+    description and category name, with optional filters: category (code),
+    min_price, max_price, in_stock and seller (ID). Results are ranked by
+    relevance and paginated by page number.
+    Returns:
+        JsonResponse: The page of products, pagination info and the facet
+        counts per category and brand.
+    """
+    if request.method == "GET":
+        query = request.GET.get("q", "").strip()
+        try:
+            filters = parse_filters(request.GET)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        products, pagination_info, facets = search_products(request, query, filters)
+        return JsonResponse(
+            {
+                "message": "Products retrieved successfully",
+                "products": serialize_products(products),
+                "pagination_info": pagination_info,
+                "facets": facets,
+            },
+            status=200,
+        )
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
 @role_required("Seller")
+@primary_writes
 def delete_product(request, product_id):
     if request.method == "DELETE":
         try:
             # pylint: disable=no-member
             product = Product.objects.get(pk=product_id)
             product.delete()
+            invalidate_responses("all_products")
             return JsonResponse({"message": "Product deleted successfully"}, status=200)
         except Product.DoesNotExist:
             return JsonResponse(
@@ -467,8 +786,127 @@ def delete_product(request, product_id):
         return JsonResponse({"error": "Invalid request method."}, status=405)
 
 
+def patch_product(request, product_id):
+    """
+    Partial update of a product (PATCH on update_product). Body: JSON, form
+    or multipart (for a new "image") with any of name, brand, description,
+    base_price, price, stock, category_code and seller_id. Only the given
+    fields are validated and written, the seller and category are only
+    looked up when given.
+
+    Optimistic concurrency: the write only succeeds if the product is still
+    at the version it was read at, or at the one given by If-Match (an ETag
+    from a previous response) or "version", otherwise 412 is returned.
+    No row is locked while the request is processed.
+    Returns:
+        JsonResponse: The updated product, with its new ETag.
+    """
+    try:
+        if request.content_type == "multipart/form-data":
+            data, files = request.parse_file_upload(request.META, request)
+        elif request.content_type == "application/json":
+            data, files = json.loads(request.body), {}
+        else:
+            data, files = QueryDict(request.body), {}
+    except (ValueError, MultiPartParserError):
+        return JsonResponse({"error": "Invalid request body."}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "Invalid request body."}, status=400)
+
+    try:
+        expected_version = parse_if_match(request.headers.get("If-Match"), product_id)
+        if expected_version is None and data.get("version") is not None:
+            expected_version = int(data["version"])
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid If-Match or version."}, status=400)
+
+    try:
+        values = validate_product_fields(data, partial=True)
+    except ProductValidationError as e:
+        return JsonResponse({"error": e.message}, status=400)
+
+    image = files.get("image")
+    if image:
+        image_error = validate_upload(image)
+        if image_error:
+            return JsonResponse({"error": image_error}, status=400)
+
+    try:
+        # pylint: disable=no-member
+        product = product_queryset().get(pk=product_id)
+    except Product.DoesNotExist:
+        return JsonResponse(
+            {"error": "Product with provided ID does not exist."}, status=400
+        )
+    if expected_version is not None and expected_version != product.version:
+        return JsonResponse(
+            {"error": "Product was modified, reload it and retry."},
+            status=412,
+            headers={"ETag": product_etag(product)},
+        )
+
+    if data.get("seller_id") is not None:
+        try:
+            # pylint: disable=no-member
+            values["seller"] = Seller.objects.select_related("user").get(
+                user_id=int(data["seller_id"])
+            )
+        except (TypeError, ValueError, Seller.DoesNotExist):
+            return JsonResponse(
+                {"error": "Seller with provided ID does not exist."}, status=400
+            )
+    if "category_code" in data:
+        try:
+            # pylint: disable=no-member
+            values["category"] = Category.objects.get(
+                code=data["category_code"] or "no-category"
+            )
+        except Category.DoesNotExist:
+            return JsonResponse(
+                {"error": "Category with provided code does not exist."}, status=400
+            )
+    if image:
+        values["image"] = image
+        # The variants of the previous image are regenerated by a worker
+        values["image_thumbnail"] = ""
+        values["image_medium"] = ""
+    if not values:
+        return JsonResponse({"error": "Nothing to update."}, status=400)
+
+    with transaction.atomic():
+        # Compare-and-set on the version, a concurrent edit makes it match nothing
+        # pylint: disable=no-member
+        claimed = Product.objects.filter(pk=product.pk, version=product.version).update(
+            version=F("version") + 1
+        )
+        if not claimed:
+            return JsonResponse(
+                {"error": "Product was modified, reload it and retry."}, status=412
+            )
+        for name, value in values.items():
+            setattr(product, name, value)
+        product.version += 1
+        product.save(update_fields=[*values, "updated_at"])
+
+    if image:
+        schedule_product_image(product)
+    invalidate_responses("all_products")
+
+    return JsonResponse(
+        {
+            "message": "Product updated successfully",
+            "product": serialize_product(product),
+        },
+        status=200,
+        headers={"ETag": product_etag(product)},
+    )
+
+
 @role_required("Seller")
+@primary_writes
 def update_product(request, product_id):
+    if request.method == "PATCH":
+        return patch_product(request, product_id)
     if request.method == "POST":
         try:
             # pylint: disable=no-member
@@ -477,53 +915,26 @@ def update_product(request, product_id):
             return JsonResponse(
                 {"error": "Product with provided ID does not exist."}, status=400
             )
-        name = request.POST.get("name")
-        brand = request.POST.get("brand")
-        description = request.POST.get("description")
-        base_price = request.POST.get("base_price")
-        price = request.POST.get("price")
-        stock = request.POST.get("stock")
         category_code = request.POST.get("category_code")
-        seller_id = int(request.POST.get("seller_id"))
         image = request.FILES.get("image")  # Use request.FILES for file fields
 
-        # Validate inputs
-        fields_to_validate = [
-            {"field": name, "message": "Name is required"},
-            {"field": brand, "message": "Brand is required"},
-            {"field": description, "message": "Description is required"},
-            {"field": base_price, "message": "Base price is required"},
-            {"field": price, "message": "Price is required"},
-            {"field": stock, "message": "Stock is required"},
-        ]
-
-        for field in fields_to_validate:
-            if not field["field"]:
-                return JsonResponse({"error": field["message"]}, status=400)
-
+        # Validate inputs, with the same rules as create_product and PATCH
         try:
-            float_price = float(price)
-            if float_price < 0:
-                return JsonResponse(
-                    {"error": "Price must be a positive number"}, status=400
-                )
-        except ValueError:
-            return JsonResponse({"error": "Price must be a valid number"}, status=400)
+            values = validate_product_fields(request.POST)
+        except ProductValidationError as e:
+            return JsonResponse({"error": e.message}, status=400)
 
-        if not stock.isdigit() or int(stock) < 0:
+        try:
+            seller_id = int(request.POST.get("seller_id"))
+        except (TypeError, ValueError):
             return JsonResponse(
-                {"error": "Stock must be a positive integer"}, status=400
+                {"error": "Seller with provided ID does not exist."}, status=400
             )
 
         if image:
-            if not image.name.endswith((".jpg", ".png")):
-                return JsonResponse(
-                    {"error": "Image must be a .jpg or .png file."}, status=400
-                )
-            if image.size > 2 * 1024 * 1024:
-                return JsonResponse(
-                    {"error": "Image must be less than or equal to 2MB."}, status=400
-                )
+            image_error = validate_upload(image)
+            if image_error:
+                return JsonResponse({"error": image_error}, status=400)
 
         try:
             seller_user = User.objects.get(pk=seller_id)
@@ -535,7 +946,7 @@ def update_product(request, product_id):
             )
 
         # pylint: disable=no-member
-        seller = Seller.objects.get(user=seller_user)
+        seller = Seller.objects.select_related("user").get(user=seller_user)
         # If no category_code is provided, use the "no-category" category
         if not category_code:
             category_code = "no-category"
@@ -544,45 +955,33 @@ def update_product(request, product_id):
         category = Category.objects.get(code=category_code)
 
         try:
-            product.name = name
-            product.brand = brand
-            product.description = description
-            product.base_price = base_price
-            product.price = price
-            product.stock = stock
+            for name, value in values.items():
+                setattr(product, name, value)
             product.category = category
             product.seller = seller
             if image:
                 product.image = image
+                # The variants of the previous image are regenerated by a worker
+                product.image_thumbnail = ""
+                product.image_medium = ""
+            product.version += 1
 
-            product.save()
+            # The listing and counters are written in the same transaction
+            with transaction.atomic():
+                product.save()
 
         except IntegrityError:
             return JsonResponse({"error": "Product couldn't be updated"}, status=400)
 
+        if image:
+            schedule_product_image(product)
+
+        invalidate_responses("all_products")
+
         return JsonResponse(
             {
                 "message": "Product updated successfully",
-                "product": {
-                    "id": product.id,
-                    "name": product.name,
-                    "brand": product.brand,
-                    "description": product.description,
-                    "base_price": product.base_price,
-                    "price": product.price,
-                    "stock": product.stock,  # Return the stock value
-                    "category": {
-                        "id": product.category.id,
-                        "name": product.category.name,
-                        "code": product.category.code,
-                    },
-                    "seller": {
-                        "id": product.seller.id,
-                        "username": product.seller.user.username,
-                    },
-                    "image": product.image.url if product.image else None,
-                    # Return the URL of the image
-                },
+                "product": serialize_product(product),
             },
             status=200,
         )
@@ -590,33 +989,46 @@ def update_product(request, product_id):
         return JsonResponse({"error": "Invalid request method."}, status=405)
 
 
+def _form_quantity(value):
+    # Form fields are strings, "-1" included, clean_quantity rejects the rest
+    if isinstance(value, str) and value.removeprefix("-").isdecimal():
+        return int(value)
+    return value
+
+
 @role_required("Customer")
+@primary_writes
 def add_to_cart(request, product_id):
     """
     View for adding a product to the shopping cart for a customer.
     """
     if request.method == "POST":
-        customer = Customer.objects.get(user=request.user)
-
-        try:
-            product = Product.objects.get(pk=product_id)
-        except Product.DoesNotExist:
+        # pylint: disable=no-member
+        if not Product.objects.filter(pk=product_id).exists():
             return JsonResponse(
                 {"error": "Product with provided ID does not exist."}, status=400
             )
 
-        quantity = int(request.POST.get("quantity", 1))
+        try:
+            quantity = clean_quantity(
+                _form_quantity(request.POST.get("quantity", "1")), "add"
+            )
+        except CartQuantityError as e:
+            return JsonResponse({"error": e.message}, status=400)
 
-        cart = Cart.objects.get(customer=customer)
+        cart_id = get_cart_id(request.user)
+        if cart_id is None:
+            return JsonResponse(
+                {"error": "Cart does not exist for this customer."}, status=404
+            )
 
-        # Verify if cartItem already exists
+        # Increments the existing cart item or creates it, in one transaction
         try:
-            cart_item = CartItem.objects.get(cart=cart, product=product)
-            cart_item.quantity += quantity
-            cart_item.save()
-        except CartItem.DoesNotExist:
-            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
-
+            add_item(cart_id, product_id, quantity)
+        except CartQuantityError as e:
+            return JsonResponse({"error": e.message}, status=400)
+        except IntegrityError:
+            return JsonResponse({"error": "Product couldn't be added."}, status=400)
 
         return JsonResponse(
             {"message": "Product added to cart successfully."}, status=200
@@ -626,28 +1038,29 @@ def add_to_cart(request, product_id):
 
 
 @role_required("Customer")
+@primary_writes
 def remove_from_cart(request, product_id):
     """
     View for removing a product from the shopping cart for a customer.
     """
     if request.method == "DELETE":
-        customer = request.user.customer
-        try:
-            product = Product.objects.get(pk=product_id)
-        except Product.DoesNotExist:
+        # pylint: disable=no-member
+        if not Product.objects.filter(pk=product_id).exists():
             return JsonResponse(
                 {"error": "Product with provided ID does not exist."}, status=400
             )
 
-        # Check if the product is in the customer's cart
-        cart = Cart.objects.get(customer=customer)
-        try:
-            cart_item = CartItem.objects.get(cart=cart, product=product)
-        except CartItem.DoesNotExist:
-            return JsonResponse({"error": "Product is not in the cart."}, status=400)
+        cart_id = get_cart_id(request.user)
+        if cart_id is None:
+            return JsonResponse(
+                {"error": "Cart does not exist for this customer."}, status=404
+            )
 
         # Remove the product from the cart
-        cart_item.delete()
+        try:
+            remove_item(cart_id, product_id)
+        except CartItemNotFound:
+            return JsonResponse({"error": "Product is not in the cart."}, status=400)
 
         return JsonResponse(
             {"message": "Product removed from cart successfully."}, status=200
@@ -657,107 +1070,227 @@ def remove_from_cart(request, product_id):
 
 
 @role_required("Customer")
+@primary_writes
 def update_quantity(request, product_id):
     """
     View for updating the quantity of a product in the shopping cart for a customer.
     """
     if request.method == "PUT":
-        customer = request.user.customer
-        print("put")
+        # pylint: disable=no-member
+        if not Product.objects.filter(pk=product_id).exists():
+            return JsonResponse(
+                {"error": "Product with provided ID does not exist."}, status=400
+            )
 
         try:
-            product = Product.objects.get(pk=product_id)
-        except Product.DoesNotExist:
+            data = json.loads(request.body)
+            new_quantity = clean_quantity(
+                _form_quantity(data.get("quantity", 1)), "update"
+            )
+        except (ValueError, AttributeError):
+            return JsonResponse({"error": "Invalid JSON body."}, status=400)
+        except CartQuantityError as e:
+            return JsonResponse({"error": e.message}, status=400)
+        # A zero delta has always meant one more unit
+        new_quantity = new_quantity or 1
+
+        cart_id = get_cart_id(request.user)
+        if cart_id is None:
             return JsonResponse(
-                {"error": "Product with provided ID does not exist."}, status=400
+                {"error": "Cart does not exist for this customer."}, status=404
             )
 
-        data = json.loads(request.body)
+        # Update the quantity of the product in the cart
+        try:
+            change_item_quantity(cart_id, product_id, new_quantity)
+        except CartItemNotFound:
+            return JsonResponse({"error": "Product is not in the cart."}, status=400)
+        except CartQuantityError as e:
+            return JsonResponse({"error": e.message}, status=400)
+        except IntegrityError:
+            return JsonResponse(
+                {"error": "Quantity can't be lower than zero."}, status=400
+            )
 
-        new_quantity = int(data.get("quantity")) or 1
-        print(f"new quantity from frontend: {new_quantity}")
+        return JsonResponse({"message": "Cart updated successfully."}, status=200)
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
 
-        # Check if the product is in the customer's cart
-        cart = Cart.objects.get(customer=customer)
-        print(f"cart: {cart}")
+
+@role_required("Customer")
+@primary_writes
+def batch_cart(request):
+    """
+    View for applying many cart operations in one request, e.g. to sync a cart
+    edited offline. Body: {"operations": [{"op": "add" | "update" | "remove",
+    "product_id": int, "quantity": int}, ...]}. Either every operation is
+    applied or none is.
+    Returns:
+        JsonResponse: The final cart, like get_cart.
+    """
+    if request.method == "POST":
         try:
-            cart_item = CartItem.objects.get(cart=cart, product=product)
-            print(f"cart_item: {cart_item}")
+            operations = json.loads(request.body).get("operations")
+        except (ValueError, AttributeError):
+            return JsonResponse({"error": "Invalid JSON body."}, status=400)
 
-        except CartItem.DoesNotExist:
-            return JsonResponse({"error": "Product is not in the cart."}, status=400)
+        if not isinstance(operations, list) or not operations:
+            return JsonResponse({"error": "Operations are required."}, status=400)
+        if len(operations) > MAX_CART_OPERATIONS:
+            return JsonResponse(
+                {"error": f"At most {MAX_CART_OPERATIONS} operations are allowed."},
+                status=400,
+            )
 
-        # Update the quantity of the product in the cart
-        cart_item.quantity = cart_item.quantity + new_quantity
-        cart_item.save()
+        # Validate the shape of every operation before touching the database
+        for index, operation in enumerate(operations):
+            if (
+                not isinstance(operation, dict)
+                or operation.get("op") not in CART_OPERATIONS
+            ):
+                return JsonResponse(
+                    {"error": "Invalid operation.", "index": index}, status=400
+                )
+            product_id = operation.get("product_id")
+            # bool is an int subclass, JSON true / false aren't product IDs
+            if not isinstance(product_id, int) or isinstance(product_id, bool):
+                return JsonResponse(
+                    {"error": "Product ID must be an integer.", "index": index},
+                    status=400,
+                )
+            if operation["op"] == "remove":
+                continue
+            try:
+                operation["quantity"] = clean_quantity(
+                    operation.get("quantity", 1), operation["op"]
+                )
+            except CartQuantityError as e:
+                return JsonResponse({"error": e.message, "index": index}, status=400)
 
-        return JsonResponse({"message": "Cart updated successfully."}, status=200)
+        # One query to check that every product exists
+        product_ids = {operation["product_id"] for operation in operations}
+        # pylint: disable=no-member
+        existing_ids = Product.objects.only("id").in_bulk(product_ids)
+        for index, operation in enumerate(operations):
+            if operation["product_id"] not in existing_ids:
+                return JsonResponse(
+                    {
+                        "error": "Product with provided ID does not exist.",
+                        "index": index,
+                    },
+                    status=400,
+                )
+
+        cart_id = get_cart_id(request.user)
+        if cart_id is None:
+            return JsonResponse(
+                {"error": "Cart does not exist for this customer."}, status=404
+            )
+
+        try:
+            apply_operations(cart_id, operations)
+        except CartOperationError as e:
+            return JsonResponse({"error": e.message, "index": e.index}, status=400)
+        except IntegrityError:
+            return JsonResponse(
+                {"error": "The cart was modified at the same time, please retry."},
+                status=409,
+            )
+
+        return JsonResponse(serialize_cart(cart_lines(cart_id)), status=200)
     else:
         return JsonResponse({"error": "Invalid request method."}, status=405)
 
+
 @role_required("Customer")
+@replica_reads
 def get_cart(request):
     if request.method == "GET":
-        customer = request.user.customer
+        cart_id = get_cart_id(request.user)
+        if cart_id is None:
+            return JsonResponse(
+                {"error": "Cart does not exist for this customer."}, status=404
+            )
 
-        try:
-            cart = Cart.objects.get(customer=customer)
-        except Cart.DoesNotExist:
+        # Quantities and line totals are aggregated per product by the database
+        return JsonResponse(serialize_cart(cart_lines(cart_id)), status=200)
+
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+@role_required("Customer")
+@replica_reads
+async def aget_cart(request):
+    """
+    Async version of get_cart, routed under ASGI.
+    """
+    if request.method == "GET":
+        cart_id = await aget_cart_id(request.user)
+        if cart_id is None:
             return JsonResponse(
                 {"error": "Cart does not exist for this customer."}, status=404
             )
 
-        # Retrieve all cart items associated with the cart
-        cart_items = CartItem.objects.filter(cart=cart)
+        # Quantities and line totals are aggregated per product by the database
+        lines = [line async for line in cart_lines(cart_id)]
+        return JsonResponse(serialize_cart(lines), status=200)
 
-        # Initialize a dictionary to aggregate quantities of the same product
-        product_quantities = {}
+    else:
+        return JsonResponse({"error": "Invalid request method."}, status=405)
 
-        # Aggregate quantities for identical products
-        for cart_item in cart_items:
-            product_id = cart_item.product.id
-            if product_id in product_quantities:
-                product_quantities[product_id] += cart_item.quantity
-            else:
-                product_quantities[product_id] = cart_item.quantity
-
-        # Serialize cart items data
-        cart_items_data = []
-        for product_id, quantity in product_quantities.items():
-            cart_item = cart_items.filter(product_id=product_id).first()
-            if cart_item:
-                product_data = {
-                    "id": cart_item.product.id,
-                    "name": cart_item.product.name,
-                    "brand": cart_item.product.brand,
-                    "description": cart_item.product.description,
-                    "base_price": round(float(cart_item.product.base_price), 2),
-                    "price": round(float(cart_item.product.price), 2), 
-                    "stock": cart_item.product.stock,
-                    "category": cart_item.product.category.name,
-                    "seller": cart_item.product.seller.user.username,
-                    "quantity": quantity
-                }
-                if cart_item.product.image:  # Check if the product has an associated image
-                    product_data["image_url"] = cart_item.product.image.url
-                else:
-                    product_data["image_url"] = None  # Or any default image URL or placeholder
-                cart_items_data.append(product_data)
-
-        # Calculate total quantity and total price
-        cart_total_quantity = sum(product_quantities.values())
-        cart_total_price = sum(
-            cart_item.product.price * quantity for product_id, quantity in product_quantities.items()
+
+@role_required("Customer")
+@primary_writes
+def checkout_view(request):
+    """
+    View for turning the customer's cart into an order. Stock is reserved
+    atomically, the request fails without changes if a product sold out.
+    Body (optional): {"shipping_information": str}, defaults to the
+    customer's shipping address.
+    Returns:
+        JsonResponse: The created order.
+    """
+    if request.method == "POST":
+        try:
+            data = json.loads(request.body) if request.body else {}
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body."}, status=400)
+
+        # pylint: disable=no-member
+        cart = (
+            Cart.objects.filter(customer__user=request.user)
+            .values("pk", "customer_id", "customer__shipping_address")
+            .first()
+        )
+        if cart is None:
+            return JsonResponse(
+                {"error": "Cart does not exist for this customer."}, status=404
+            )
+
+        shipping_information = (
+            data.get("shipping_information") or cart["customer__shipping_address"]
         )
+        if not shipping_information:
+            return JsonResponse(
+                {"error": "Shipping information is required."}, status=400
+            )
+
+        try:
+            order, items = checkout(
+                cart["pk"], cart["customer_id"], shipping_information
+            )
+        except CheckoutError as e:
+            return JsonResponse({"error": e.message}, status=e.status)
+        # The listed stock of the ordered products changed
+        invalidate_responses("all_products")
 
         return JsonResponse(
             {
-                "cartItems": cart_items_data,
-                "cartTotalQuantity": cart_total_quantity,
-                "cartTotalPrice": round(float(cart_total_price), 2),
+                "message": "Order created successfully",
+                "order": serialize_order(order, items),
             },
             status=200,
         )
-
     else:
         return JsonResponse({"error": "Invalid request method."}, status=405)
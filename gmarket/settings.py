@@ -71,7 +71,55 @@ DATABASES = {
     }
 }
 database_url = os.getenv("database_url")
-DATABASES["default"] = dj_database_url.parse(database_url)
+
+# Deployment mode, "wsgi" or "asgi" (set by gmarket/asgi.py). Under ASGI the
+# catalog and cart read views are routed to their async versions, under WSGI to
+# the sync ones, which don't pay for an async_to_sync hop, see cmscommerce/urls.py
+SERVER_INTERFACE = os.getenv("SERVER_INTERFACE", "wsgi").lower()
+
+# Database connections, see cmscommerce/management/commands/benchmark_connections.py
+# DB_CONN_MAX_AGE: seconds a connection is reused across requests, 0 reconnects
+# on every request. Defaults to 0 under ASGI (every request runs in a new thread,
+# persistent connections would pile up), pool with PgBouncer instead.
+# DB_PGBOUNCER: "true" when the URL points to PgBouncer in transaction pooling
+# mode, which can't keep the server-side cursors of QuerySet.iterator() open.
+DB_CONN_MAX_AGE = int(
+    os.getenv("DB_CONN_MAX_AGE", "0" if SERVER_INTERFACE == "asgi" else "600")
+)
+DB_CONN_HEALTH_CHECKS = os.getenv("DB_CONN_HEALTH_CHECKS", "true").lower() == "true"
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+
+def database_config(url):
+    config = dj_database_url.parse(
+        url, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=DB_CONN_HEALTH_CHECKS
+    )
+    if DB_PGBOUNCER:
+        config["DISABLE_SERVER_SIDE_CURSORS"] = True
+    return config
+
+
+DATABASES["default"] = database_config(database_url)
+
+# Optional read replicas (space separated URLs) of the read-only views, see
+# cmscommerce/routers.py. The first one is the "replica" alias, the next ones
+# "replica_2", "replica_3"...
+DATABASE_REPLICAS = []
+for index, url in enumerate(os.getenv("database_replica_url", "").split(), start=1):
+    alias = "replica" if index == 1 else f"replica_{index}"
+    DATABASES[alias] = {
+        **database_config(url),
+        # Tests read the test default database through it
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ["cmscommerce.routers.ReplicaRouter"]
+DATABASE_ROUTING = {
+    "REPLICAS": DATABASE_REPLICAS,
+    "STICKY_SECONDS": int(os.getenv("DB_REPLICA_STICKY_SECONDS", "5")),
+    # Must be shared by the workers (see TOKEN_CACHE_ALIAS) to follow the users
+    "CACHE_ALIAS": os.getenv("DB_REPLICA_STICKY_CACHE_ALIAS", "default"),
+}
 STORAGES = {
     "default": {
         "BACKEND": "storages.backends.s3.S3Storage",
@@ -109,7 +157,85 @@ REST_FRAMEWORK = {
     ],
 }
 
+# RESPONSE_CACHE_BACKEND: "locmem" (per process), "file" or "redis"
+RESPONSE_CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "responses",
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("RESPONSE_CACHE_LOCATION", "/tmp/gmarket_responses"),
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("RESPONSE_CACHE_LOCATION", "redis://127.0.0.1:6379"),
+    },
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": RESPONSE_CACHE_BACKENDS[os.getenv("RESPONSE_CACHE_BACKEND", "locmem")],
+}
+
+# Seconds the categories payload is reused, see cmscommerce/categories.py.
+# Category saves and deletes invalidate it at once, but only in the processes
+# sharing CACHES "default" (just the current one with locmem): changes made
+# by other processes or raw SQL show up after this delay, unless they call
+# cmscommerce.categories.invalidate_categories().
+CATEGORIES_CACHE_TIMEOUT = int(os.getenv("CATEGORIES_CACHE_TIMEOUT", "300"))
+
+# Cache of the anonymous catalog responses, see cmscommerce/response_cache.py.
+# Writes only invalidate the responses of the workers sharing the cache: with
+# "locmem" the other workers serve theirs until TIMEOUT, use "redis" (or
+# "file" on a single host) when running several workers.
+RESPONSE_CACHE = {
+    "CACHE_ALIAS": "responses",
+    "TIMEOUT": int(os.getenv("RESPONSE_CACHE_TIMEOUT", "60")),
+}
+
+# Token authentication cache used by helpers.role_required
+# BACKEND: "lru" (per process), "django" (uses the CACHES alias below) or "none"
+TOKEN_CACHE = {
+    "BACKEND": os.getenv("TOKEN_CACHE_BACKEND", "lru"),
+    "MAX_SIZE": int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000")),
+    "TIMEOUT": int(os.getenv("TOKEN_CACHE_TIMEOUT", "300")),
+    "CACHE_ALIAS": os.getenv("TOKEN_CACHE_ALIAS", "default"),
+}
+
+# Product image uploads processing, see cmscommerce/images.py
+IMAGE_PIPELINE = {
+    "WORKERS": int(os.getenv("IMAGE_PIPELINE_WORKERS", "2")),
+    "FORMAT": os.getenv("IMAGE_PIPELINE_FORMAT", "WEBP"),
+}
+
+# Per-view query count / timings, see cmscommerce/metrics.py
+METRICS = {
+    "ENABLED": os.getenv("METRICS_ENABLED", "true").lower() == "true",
+    "LOG_QUERY_COUNT_OVER": (
+        int(os.getenv("LOG_QUERY_COUNT_OVER"))
+        if os.getenv("LOG_QUERY_COUNT_OVER")
+        else None
+    ),
+    "LOG_QUERY_TIME_OVER_MS": (
+        int(os.getenv("LOG_QUERY_TIME_OVER_MS"))
+        if os.getenv("LOG_QUERY_TIME_OVER_MS")
+        else None
+    ),
+    # Space separated client addresses allowed to read /metrics (the proxy's
+    # address behind a reverse proxy), "*" allows everyone
+    "ALLOWED_IPS": (
+        None
+        if os.getenv("METRICS_ALLOWED_IPS") == "*"
+        else os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1 ::1").split()
+    ),
+}
+
 MIDDLEWARE = [
+    # First, so its total time covers the other middlewares
+    "cmscommerce.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
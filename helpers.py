@@ -1,30 +1,131 @@
 from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.http import HttpResponseForbidden
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import AuthenticationFailed
 
+from cmscommerce.token_cache import (
+    get_token_cache,
+    entry_for_user,
+    aentry_for_user,
+    user_from_entry,
+)
+
+
+def get_token_key(request):
+    """
+    Reads the key of a well-formed "Authorization: Token <key>" header.
+    Returns:
+        str: The token key, or None if the request has no such header.
+    """
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != TokenAuthentication.keyword.lower().encode():
+        return None
+    try:
+        return auth[1].decode()
+    except UnicodeError:
+        return None
+
+
+def _authorize(request, role):
+    """
+    Authenticates the request by token (cached) or session and checks the
+    user's role.
+    Returns:
+        HttpResponseForbidden: If the request isn't allowed, else None.
+    """
+    token_cache = get_token_cache()
+    token_key = get_token_key(request)
+    entry = token_cache.get(token_key) if token_key else None
+
+    if entry is not None:
+        # Cache hit, no database round trip needed
+        request.user = user_from_entry(entry)
+    else:
+        token_auth = TokenAuthentication()
+
+        try:
+            user_auth_tuple = token_auth.authenticate(request)
+        except AuthenticationFailed:
+            return HttpResponseForbidden("Invalid token.")
+
+        if user_auth_tuple is not None:
+            request.user, token = user_auth_tuple
+            entry = entry_for_user(request.user)
+            token_cache.set(token.key, entry)
+
+    # Customer / Seller ids of token-authenticated requests, or None
+    request.token_entry = entry
+    return _check_role(request.user, role)
+
+
+async def _aauthorize(request, role):
+    """
+    Async version of _authorize: token lookups use the async cache and ORM
+    APIs. Requests without a well-formed token header (session users) fall
+    back to _authorize in a thread, the lazy request.user can't be loaded
+    from async code.
+    Returns:
+        HttpResponseForbidden: If the request isn't allowed, else None.
+    """
+    token_key = get_token_key(request)
+    if token_key is None:
+        return await sync_to_async(_authorize)(request, role)
+
+    token_cache = get_token_cache()
+    entry = await token_cache.aget(token_key)
+    if entry is not None:
+        request.user = user_from_entry(entry)
+    else:
+        try:
+            # pylint: disable=no-member
+            token = await Token.objects.select_related("user").aget(key=token_key)
+        except Token.DoesNotExist:
+            return HttpResponseForbidden("Invalid token.")
+        if not token.user.is_active:
+            return HttpResponseForbidden("Invalid token.")
+        request.user = token.user
+        entry = await aentry_for_user(token.user)
+        await token_cache.aset(token.key, entry)
+
+    request.token_entry = entry
+    return _check_role(request.user, role)
+
+
+def _check_role(user, role):
+    if user.is_authenticated and (user.role == role or role == "any"):
+        return None
+    return HttpResponseForbidden("You don't have permission to access this page.")
+
 
 # Create the custom decorator
 def role_required(role):
+    """
+    Restricts a view to the users of a role ("any" for every authenticated
+    user). Async views get an async wrapper, so they don't leave the event
+    loop to authenticate cached tokens.
+    """
+
     def decorator(view_func):
-        @wraps(view_func)
-        def _wrapped_view(request, *args, **kwargs):
-            token_auth = TokenAuthentication()
+        if iscoroutinefunction(view_func):
 
-            try:
-                user_auth_tuple = token_auth.authenticate(request)
-            except AuthenticationFailed:
-                return HttpResponseForbidden("Invalid token.")
+            @wraps(view_func)
+            async def _async_wrapped_view(request, *args, **kwargs):
+                forbidden = await _aauthorize(request, role)
+                if forbidden is not None:
+                    return forbidden
+                return await view_func(request, *args, **kwargs)
 
-            if user_auth_tuple is not None:
-                request.user = user_auth_tuple[0]
+            return _async_wrapped_view
 
-            if request.user.is_authenticated and (request.user.role == role or role == "any"):
-                return view_func(request, *args, **kwargs)
-            else:
-                return HttpResponseForbidden(
-                    "You don't have permission to access this page."
-                )
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            forbidden = _authorize(request, role)
+            if forbidden is not None:
+                return forbidden
+            return view_func(request, *args, **kwargs)
 
         return _wrapped_view
-    return decorator
\ No newline at end of file
+
+    return decorator